@@ -0,0 +1,164 @@
+"""
+Benchmark for loading the JSON command history.
+
+Writes synthetic histories of each size, in the current compact format
+(rows with Unix timestamps) and in the 1.0 format (one dict with ISO
+timestamps per entry), then loads each one with HistoryManager in a fresh
+interpreter. Since loading is lazy, construction and the first access are
+timed separately. Resident memory is measured before the history is
+created and after the first access; "peak" includes the parsed JSON,
+which is freed once the entries are built.
+
+Usage:
+    python3 benchmarks/bench_history_load.py [--sizes 1000,100000,1000000] [--repeat 3]
+"""
+
+import argparse
+import json
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from history_journal import write_atomic  # noqa: E402
+from history_manager import HistoryManager  # noqa: E402
+from models import CommandHistory  # noqa: E402
+
+PROMPTS = [
+    "list files including hidden ones",
+    "show git status",
+    "find python files changed this week",
+    "disk usage of this folder sorted by size",
+    "which process is listening on port 3000",
+    "compress the project folder",
+]
+
+COMMANDS = [
+    "ls -la",
+    "git status",
+    "find . -name '*.py' -mtime -7",
+    "du -sh * | sort -h",
+    "lsof -i :3000",
+    "tar -czf backup.tar.gz ./project",
+]
+
+
+def build_entries(size: int, seed: int = 0) -> List[CommandHistory]:
+    """Build size entries with distinct commands, used over the past year."""
+    rng = random.Random(seed)
+    now = time.time()
+    entries = []
+    for i in range(size):
+        created_at = round(now - rng.random() * 365 * 86400, 6)
+        entries.append(CommandHistory(
+            prompt=f"{rng.choice(PROMPTS)} {i}",
+            command=f"{rng.choice(COMMANDS)} # {i}",
+            alias=f"alias{i}" if rng.random() < 0.05 else None,
+            use_count=rng.randint(1, 50),
+            last_used_ts=round(created_at + rng.random() * (now - created_at), 6),
+            created_at_ts=created_at
+        ))
+    entries.sort(key=lambda entry: entry.last_used_ts)
+    return entries
+
+
+def write_histories(entries: List[CommandHistory], directory: Path) -> Dict[str, Path]:
+    """Write the entries as a compact and as a 1.0 history file."""
+    compact = directory / "compact" / "history.json"
+    legacy = directory / "legacy" / "history.json"
+    for path in (compact, legacy):
+        path.parent.mkdir(parents=True)
+    write_atomic(compact, {
+        "version": "2.0",
+        "generation": 1,
+        "commands": [entry.to_row() for entry in entries]
+    })
+    write_atomic(legacy, {
+        "version": "1.0",
+        "commands": [entry.to_dict() for entry in entries]
+    })
+    return {"compact": compact, "1.0": legacy}
+
+
+def _rss_bytes() -> int:
+    """Current resident memory of this process, or the peak where unavailable."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * resource.getpagesize()
+    except OSError:
+        return _peak_rss_bytes()
+
+
+def _peak_rss_bytes() -> int:
+    """Peak resident memory of this process."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Bytes on macOS, KiB on Linux
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def load_once(path: str) -> None:
+    """Load a history and print its timings and memory as JSON (run in a child process)."""
+    rss_before = _rss_bytes()
+    start = time.perf_counter()
+    manager = HistoryManager(path, max_items=10 ** 7, compact_after=10 ** 9)
+    constructed = time.perf_counter()
+    count = manager.get_count()
+    loaded = time.perf_counter()
+    print(json.dumps({
+        "count": count,
+        "construct": constructed - start,
+        "first_access": loaded - constructed,
+        "rss": _rss_bytes() - rss_before,
+        "peak": _peak_rss_bytes() - rss_before,
+    }))
+
+
+def measure(path: Path, repeat: int) -> Dict[str, float]:
+    """Load a history in fresh interpreters; the best timings and memory of `repeat` runs."""
+    best: Dict[str, float] = {}
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, __file__, "--load", str(path)],
+            check=True, stdout=subprocess.PIPE, universal_newlines=True
+        ).stdout
+        result = json.loads(output)
+        for key, value in result.items():
+            best[key] = min(best.get(key, value), value)
+    return best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sizes", default="1000,100000,1000000")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--load", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.load:
+        load_once(args.load)
+        return
+
+    for size in (int(size) for size in args.sizes.split(",")):
+        with tempfile.TemporaryDirectory() as directory:
+            paths = write_histories(build_entries(size), Path(directory))
+            for name, path in paths.items():
+                result = measure(path, args.repeat)
+                assert result["count"] == size, result
+                print(
+                    f"{size:>9,} entries  {name:<7}  "
+                    f"file: {path.stat().st_size / 2 ** 20:>7.1f} MiB  "
+                    f"construct: {result['construct'] * 1e3:>6.2f} ms  "
+                    f"first access: {result['first_access'] * 1e3:>9.1f} ms  "
+                    f"rss: {result['rss'] / 2 ** 20:>7.1f} MiB  "
+                    f"peak: {result['peak'] / 2 ** 20:>7.1f} MiB"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Benchmark for ranked command history search.
+
+Builds one synthetic history in both backends (a JSON history, migrated
+into SQLite) and times search_ranked() on each for exact, misspelled,
+short and empty queries. Both backends must return the same entries in
+the same order; any difference is printed.
+
+Usage:
+    python3 benchmarks/bench_history_search.py [--sizes 1000,10000] [--repeat 5]
+"""
+
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from bench_history_load import build_entries  # noqa: E402
+from history_journal import write_atomic  # noqa: E402
+from history_manager import HistoryManager  # noqa: E402
+from history_sqlite import SQLiteHistoryManager  # noqa: E402
+from models import CommandHistory  # noqa: E402
+
+QUERIES = [
+    "",
+    "git status",
+    "gti stauts",
+    "disk usage sorted",
+    "dsik usgae",
+    "ls",
+    "port 3000",
+    "compress 42",
+    "compres 42",
+]
+
+
+def measure(search: Callable[[str], List[CommandHistory]], query: str, repeat: int) -> float:
+    """Return the best seconds per search over `repeat` runs."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        search(query)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sizes", default="1000,10000")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    for size in (int(size) for size in args.sizes.split(",")):
+        with tempfile.TemporaryDirectory() as directory:
+            json_path = Path(directory) / "history.json"
+            write_atomic(json_path, {
+                "version": "2.0",
+                "generation": 1,
+                "commands": [entry.to_row() for entry in build_entries(size)]
+            })
+            backends = {
+                "json": HistoryManager(str(json_path), max_items=size),
+                "sqlite": SQLiteHistoryManager(
+                    str(Path(directory) / "history.db"), max_items=size, json_path=str(json_path)
+                ),
+            }
+            mismatches = []
+            for query in QUERIES:
+                results = {name: backend.search_ranked(query) for name, backend in backends.items()}
+                timings = "  ".join(
+                    f"{name}: {measure(backend.search_ranked, query, args.repeat) * 1e3:>7.2f} ms"
+                    for name, backend in backends.items()
+                )
+                commands = {name: [entry.command for entry in found] for name, found in results.items()}
+                if commands["json"] != commands["sqlite"]:
+                    mismatches.append(query)
+                print(f"{size:>7,} entries  {query!r:<20} {len(results['json']):>2} results  {timings}")
+            status = "ok" if not mismatches else f"differ for {mismatches}"
+            print(f"{size:>7,} entries  same results on both backends ({status})")
+            for backend in backends.values():
+                backend.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,271 @@
+"""
+Micro-benchmark for RiskDetector.analyze.
+
+Compares the parse-tree detector with the previous approach (re.search of
+every raw regex rule on the command text) over a synthetic corpus of mostly
+safe commands. "cold" commands are all unique, as generated commands are in
+practice, and caches are cleared before every run; this is the number that
+matters. "warm" commands repeat, so their parse trees and rule results come
+from the cache. The two detectors intentionally disagree on some commands
+(e.g. `git commit -m 'rm -rf /'`), so the flagged counts are printed instead
+of compared. analyze_many() is then timed serially and with --workers
+processes on unique commands, to check whether a process pool pays off.
+
+Usage:
+    python3 benchmarks/bench_risk_detector.py [--commands 100000] [--repeat 3] [--workers N]
+"""
+
+import argparse
+import os
+import random
+import re
+import sys
+import time
+from pathlib import Path
+from typing import Callable, List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from models import RiskLevel, RiskResult  # noqa: E402
+from risk_detector import PARALLEL_THRESHOLD, RiskDetector, ScriptRiskScanner  # noqa: E402
+from shell_parser import _plain_word, parse  # noqa: E402
+from shell_rules import analyze_command  # noqa: E402
+
+SAFE_COMMANDS = [
+    "ls -la",
+    "git status",
+    "find . -name '*.py' -mtime -7",
+    "grep -rn 'TODO' src/",
+    "docker ps -a",
+    "du -sh * | sort -h",
+    "tar -czf backup.tar.gz ./project",
+    "ps aux | grep python",
+    "lsof -i :3000",
+    "cat README.md | head -20",
+    "python3 -m venv venv && source venv/bin/activate",
+    "kubectl get pods -n default",
+    "awk '{print $1}' access.log | sort | uniq -c",
+    "npm install --save-dev typescript",
+]
+
+RISKY_COMMANDS = [
+    "rm -rf /",
+    "sudo apt-get update",
+    "chmod -R 755 ./public",
+    "curl -fsSL https://example.com/install.sh | bash",
+    "dd if=/dev/zero of=/dev/sda bs=1M",
+    "kill -9 1234",
+    "rm -rf ~/Downloads/tmp",
+    ":(){ :|:& };:",
+    "case x in a) rm -rf / ;; esac",
+    "f() { rm -rf /; }",
+    "function f { rm -rf /; }",
+    "function f() { rm -rf /; }",
+    "RM -RF /",
+    # Commands run from a quoted argument or a piped here-document
+    "su -c 'rm -rf /'",
+    "ssh host 'rm -rf /'",
+    "ssh host sudo reboot",
+    "watch -n1 'rm -rf /'",
+    "busybox rm -rf /",
+    "parallel rm -rf ::: /",
+    "python -c 'os.system(\"rm -rf /\")'",
+    "cat <<EOF | sh\nshutdown now\nEOF",
+]
+
+
+# Generated-script shape with risky case arms, function bodies and a
+# here-document piped to sh; pattern lines (reboot|shutdown, sudo) and a
+# here-document only printed must not be reported as commands
+RISKY_SCRIPT = """#!/bin/bash
+cleanup() {
+  sudo rm -rf /usr
+}
+function nuke {
+  rm -rf ~
+}
+case "$1" in
+  build)
+    make ;;
+  clean) rm -rf "$HOME" ;;
+  reboot|shutdown)
+    echo "use the menu"
+    ;;
+  sudo) echo no ;;
+  wipe)
+    rm -rf /
+    ;;
+esac
+cat <<'EOF'
+reboot
+EOF
+cat <<EOF | sh
+shutdown now
+EOF
+"""
+RISKY_SCRIPT_LINES = [3, 6, 11, 17, 24]
+
+
+# Default rules before the parse-tree detector, as (pattern, level, reason)
+REGEX_RULES = [
+    (r'rm\s+(-[rf]+\s+)*/', RiskLevel.DANGEROUS, "루트 디렉토리 삭제 시도"),
+    (r'rm\s+(-[rf]+\s+)*~', RiskLevel.DANGEROUS, "홈 디렉토리 삭제 시도"),
+    (r'rm\s+-[rf]*\s+-[rf]*\s+/', RiskLevel.DANGEROUS, "루트 디렉토리 삭제 시도"),
+    (r'mkfs\.', RiskLevel.DANGEROUS, "파일시스템 포맷 시도"),
+    (r'>\s*/dev/sd[a-z]', RiskLevel.DANGEROUS, "디스크 직접 덮어쓰기"),
+    (r'>\s*/dev/nvme', RiskLevel.DANGEROUS, "NVMe 디스크 직접 덮어쓰기"),
+    (r':\(\)\s*\{\s*:\|:\s*&\s*\}\s*;:', RiskLevel.DANGEROUS, "Fork bomb 감지"),
+    (r'echo\s+.*>\s*/dev/sd[a-z]', RiskLevel.DANGEROUS, "디스크에 데이터 직접 쓰기"),
+    (r'chmod\s+777', RiskLevel.WARNING, "과도한 권한 부여 (777)"),
+    (r'chmod\s+-R', RiskLevel.WARNING, "재귀적 권한 변경"),
+    (r'chown\s+-R', RiskLevel.WARNING, "재귀적 소유자 변경"),
+    (r'dd\s+if=', RiskLevel.WARNING, "디스크 이미지 직접 쓰기"),
+    (r'sudo\s+', RiskLevel.WARNING, "관리자 권한으로 실행"),
+    (r'curl\s+.*\|\s*sh', RiskLevel.WARNING, "원격 스크립트 직접 실행"),
+    (r'curl\s+.*\|\s*bash', RiskLevel.WARNING, "원격 스크립트 직접 실행"),
+    (r'wget\s+.*\|\s*sh', RiskLevel.WARNING, "원격 스크립트 직접 실행"),
+    (r'wget\s+.*\|\s*bash', RiskLevel.WARNING, "원격 스크립트 직접 실행"),
+    (r'>\s*/etc/', RiskLevel.WARNING, "/etc 디렉토리 파일 덮어쓰기"),
+    (r'rm\s+-[rf]', RiskLevel.WARNING, "강제/재귀 삭제"),
+    (r'pkill\s+-9', RiskLevel.WARNING, "프로세스 강제 종료"),
+    (r'kill\s+-9', RiskLevel.WARNING, "프로세스 강제 종료"),
+    (r'shutdown', RiskLevel.WARNING, "시스템 종료 명령"),
+    (r'reboot', RiskLevel.WARNING, "시스템 재시작 명령"),
+    (r'init\s+[06]', RiskLevel.WARNING, "시스템 종료/재시작"),
+    (r'systemctl\s+(stop|disable|mask)', RiskLevel.WARNING, "서비스 중지/비활성화"),
+    (r'launchctl\s+unload', RiskLevel.WARNING, "서비스 언로드"),
+    (r'>\s*/dev/null\s+2>&1\s*&', RiskLevel.WARNING, "백그라운드로 출력 숨김"),
+    (r'history\s+-c', RiskLevel.WARNING, "명령어 히스토리 삭제"),
+    (r'shred\s+', RiskLevel.WARNING, "파일 영구 삭제"),
+]
+
+
+def build_corpus(size: int, risky_ratio: float, unique: bool, seed: int = 0) -> List[str]:
+    """Build a corpus of commands, risky_ratio of which match a rule."""
+    rng = random.Random(seed)
+    corpus = []
+    for i in range(size):
+        pool = RISKY_COMMANDS if rng.random() < risky_ratio else SAFE_COMMANDS
+        command = rng.choice(pool)
+        # Vary the text so nothing can be cached per command
+        corpus.append(f"{command} # {i}" if unique else command)
+    return corpus
+
+
+def naive_analyze() -> Callable[[str], RiskResult]:
+    """Return the pre-parser analyze(): re.search per raw regex rule."""
+    patterns = REGEX_RULES
+
+    def analyze(command: str) -> RiskResult:
+        reasons = []
+        highest_level = RiskLevel.SAFE
+        for pattern, level, reason in patterns:
+            if re.search(pattern, command, re.IGNORECASE):
+                reasons.append(reason)
+                if level == RiskLevel.DANGEROUS:
+                    highest_level = RiskLevel.DANGEROUS
+                elif level == RiskLevel.WARNING and highest_level != RiskLevel.DANGEROUS:
+                    highest_level = RiskLevel.WARNING
+        return RiskResult(level=highest_level, reasons=reasons)
+
+    return analyze
+
+
+def scan_script(detector: RiskDetector, lines: List[str]) -> List[int]:
+    """Scan a script line by line; returns the flagged line numbers."""
+    scanner = ScriptRiskScanner(detector)
+    for line in lines:
+        scanner.feed(line)
+    scanner.finish()
+    return [finding.line_number for finding in scanner.findings]
+
+
+def clear_caches() -> None:
+    """Forget cached words, parse trees and rule results."""
+    _plain_word.cache_clear()
+    parse.cache_clear()
+    analyze_command.cache_clear()
+
+
+def measure(
+    analyze: Callable[[str], RiskResult],
+    corpus: List[str],
+    repeat: int,
+    cold: bool
+) -> float:
+    """Return the best commands-per-second over `repeat` runs."""
+    best = float("inf")
+    for _ in range(repeat):
+        if cold:
+            clear_caches()
+        start = time.perf_counter()
+        for command in corpus:
+            analyze(command)
+        best = min(best, time.perf_counter() - start)
+    return len(corpus) / best
+
+
+def measure_many(detector: RiskDetector, corpus: List[str], workers: int, repeat: int) -> float:
+    """Return the best commands-per-second of analyze_many() over `repeat` runs."""
+    best = float("inf")
+    for _ in range(repeat):
+        clear_caches()
+        start = time.perf_counter()
+        detector.analyze_many(corpus, workers=workers)
+        best = min(best, time.perf_counter() - start)
+    return len(corpus) / best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--commands", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--workers", type=int, default=max(2, os.cpu_count() or 1))
+    args = parser.parse_args()
+
+    detector = RiskDetector()
+    baseline = naive_analyze()
+
+    for unique in (True, False):
+        for risky_ratio in (0.0, 0.05, 0.5):
+            corpus = build_corpus(args.commands, risky_ratio, unique)
+            clear_caches()
+
+            naive_rate = measure(baseline, corpus, args.repeat, unique)
+            fast_rate = measure(detector.analyze, corpus, args.repeat, unique)
+            naive_flagged = sum(1 for c in corpus if baseline(c).level != RiskLevel.SAFE)
+            flagged = sum(1 for c in corpus if detector.analyze(c).level != RiskLevel.SAFE)
+            print(
+                f"{'cold' if unique else 'warm'} risky={risky_ratio:>4.0%}  "
+                f"re.search: {naive_rate:>10,.0f} cmd/s ({naive_flagged} flagged)  "
+                f"parse tree: {fast_rate:>10,.0f} cmd/s ({flagged} flagged)  "
+                f"speedup: {fast_rate / naive_rate:.1f}x"
+            )
+
+    print(f"analyze_many on {os.cpu_count()} CPUs (pool from {PARALLEL_THRESHOLD:,} unique commands)")
+    for size in (PARALLEL_THRESHOLD, PARALLEL_THRESHOLD * 5, args.commands):
+        corpus = build_corpus(size, 0.05, unique=True)
+        serial_rate = measure_many(detector, corpus, 1, args.repeat)
+        parallel_rate = measure_many(detector, corpus, args.workers, args.repeat)
+        print(
+            f"  {size:>7,} commands  serial: {serial_rate:>10,.0f} cmd/s  "
+            f"{args.workers} workers: {parallel_rate:>10,.0f} cmd/s  "
+            f"speedup: {parallel_rate / serial_rate:.1f}x"
+        )
+
+    missed = [command for command in RISKY_COMMANDS if detector.analyze(command).level == RiskLevel.SAFE]
+    status = "ok" if not missed else f"missed {missed}"
+    print(f"risky commands: {len(RISKY_COMMANDS) - len(missed)} of {len(RISKY_COMMANDS)} flagged ({status})")
+
+    flagged_lines = scan_script(detector, RISKY_SCRIPT.splitlines())
+    status = "ok" if flagged_lines == RISKY_SCRIPT_LINES else f"expected {RISKY_SCRIPT_LINES}"
+    print(f"script with case arms, functions and here-documents: flagged lines {flagged_lines} ({status})")
+
+    start = time.perf_counter()
+    detector.add_pattern(r'terraform\s+destroy', RiskLevel.DANGEROUS, "benchmark rule")
+    detector.remove_pattern(r'terraform\s+destroy')
+    print(f"add_pattern + remove_pattern: {(time.perf_counter() - start) * 1e6:.0f} us")
+
+
+if __name__ == "__main__":
+    main()
@@ -77,9 +77,16 @@ mkdir -p "$PLUGIN_SCRIPT_DIR"
 cp src/models.py "$PLUGIN_SCRIPT_DIR/"
 cp src/exceptions.py "$PLUGIN_SCRIPT_DIR/"
 cp src/config.py "$PLUGIN_SCRIPT_DIR/"
+cp src/shell_parser.py "$PLUGIN_SCRIPT_DIR/"
+cp src/shell_rules.py "$PLUGIN_SCRIPT_DIR/"
+cp src/rule_packs.py "$PLUGIN_SCRIPT_DIR/"
 cp src/risk_detector.py "$PLUGIN_SCRIPT_DIR/"
 cp src/gemini_client.py "$PLUGIN_SCRIPT_DIR/"
+cp src/llm_backends.py "$PLUGIN_SCRIPT_DIR/"
+cp src/history_journal.py "$PLUGIN_SCRIPT_DIR/"
+cp src/history_search.py "$PLUGIN_SCRIPT_DIR/"
 cp src/history_manager.py "$PLUGIN_SCRIPT_DIR/"
+cp src/history_sqlite.py "$PLUGIN_SCRIPT_DIR/"
 
 # Create main entry point as __main__.py (required for folder-based scripts)
 cat > "$PLUGIN_SCRIPT_DIR/__main__.py" << 'EOF'
@@ -87,8 +94,10 @@ cat > "$PLUGIN_SCRIPT_DIR/__main__.py" << 'EOF'
 """iTerm2 AI Command Generator - Main Script."""
 
 import asyncio
+import atexit
 import logging
 import signal
+import sqlite3
 import sys
 import os
 from typing import Optional
@@ -137,16 +146,66 @@ logger = logging.getLogger("iterm2-ai-generator")
 
 from config import ConfigManager
 from exceptions import APIError, KeychainError, RateLimitError
-from gemini_client import GeminiClient
+from gemini_client import (
+    AUTO_MODEL, AVAILABLE_MODELS, GeminiClient, RateLimiter, RequestTransport,
+    build_generation_profiles
+)
 from history_manager import HistoryManager
+from history_sqlite import SQLiteHistoryManager
+from llm_backends import OpenAICompatibleBackend
 from models import GeneratedCommand, RiskLevel
+from risk_detector import RiskDetector, ScriptRiskScanner
+
+
+def create_gemini_client(
+    api_key: str,
+    config_manager: ConfigManager,
+    history_manager: Optional[HistoryManager] = None
+) -> GeminiClient:
+    """Create a client using the configured backend, concurrency, rate limit and hedging settings."""
+    backend = None
+    if config_manager.get_backend() == "openai":
+        backend = OpenAICompatibleBackend(
+            base_url=config_manager.get_backend_url() or "http://127.0.0.1:8080/v1",
+            model=config_manager.get_backend_model() or None
+        )
+    transport = RequestTransport(max_in_flight=config_manager.get_max_concurrent_requests())
+    rate_limiter = RateLimiter(config_manager.get_requests_per_minute())
+    try:
+        profiles = build_generation_profiles(config_manager.get_generation_profiles())
+    except (TypeError, ValueError) as e:
+        logger.warning(f"Invalid generation_profiles in config, using defaults: {e}")
+        profiles = build_generation_profiles()
+    return GeminiClient(
+        api_key,
+        transport=transport,
+        rate_limiter=rate_limiter,
+        history_manager=history_manager,
+        hedging=config_manager.is_hedging_enabled(),
+        backend=backend,
+        profiles=profiles,
+        # Rule packs in the rules directory are reloaded when they change
+        risk_detector=RiskDetector(rules_dir=config_manager.get_rules_dir())
+    )
 
 
+def create_history_manager(config_manager: ConfigManager):
+    """Create the history store selected by the history_backend setting."""
+    max_items = config_manager.get_max_history()
+    if config_manager.get_history_backend() == "sqlite":
+        try:
+            return SQLiteHistoryManager(max_items=max_items)
+        except sqlite3.Error as e:
+            logger.error(f"Failed to open SQLite history, using JSON history: {e}")
+    return HistoryManager(max_items=max_items)
 
 
 class AICommandGenerator:
     """Main iTerm2 AI Command Generator application."""
 
+    # Longer histories are searched before the picker is shown
+    HISTORY_DIALOG_LIMIT = 30
+
     def __init__(
         self,
         connection: iterm2.Connection,
@@ -156,8 +215,16 @@ class AICommandGenerator:
         self.connection = connection
         self.config_manager = config_manager
         self.gemini_client = gemini_client
-        self.history_manager = HistoryManager(max_items=config_manager.get_max_history())
+        self.history_manager = create_history_manager(config_manager)
+        # Flush batched history writes on SIGTERM/SIGINT (sys.exit) and normal exit
+        atexit.register(self.history_manager.close)
+        if self.gemini_client is not None:
+            # Offline fallback while the API is unavailable
+            self.gemini_client.history_manager = self.history_manager
         self.app = None
+        # Seconds without shortcut activity before history explanations are precomputed
+        self.idle_delay = 30.0
+        self._idle_task: Optional[asyncio.Task] = None
 
     async def run(self) -> None:
         """Start the main event loop."""
@@ -170,11 +237,15 @@ class AICommandGenerator:
             return
 
         logger.info("API key verified, starting keyboard monitoring")
+        self._schedule_idle_precompute()
         # Set up keyboard monitoring
         await self._setup_keyboard_monitoring()
 
     async def _ensure_api_key(self) -> bool:
         """Ensure API key is configured, prompt if not."""
+        if not self.config_manager.requires_api_key():
+            return True
+
         api_key = self.config_manager.get_api_key()
 
         if not api_key:
@@ -187,7 +258,9 @@ class AICommandGenerator:
             try:
                 self.config_manager.set_api_key(api_key)
                 # Reinitialize Gemini client with new key
-                self.gemini_client = GeminiClient(api_key)
+                self.gemini_client = create_gemini_client(
+                    api_key, self.config_manager, self.history_manager
+                )
             except KeychainError as e:
                 await self._show_error(f"Failed to save API key: {e}")
                 return False
@@ -228,7 +301,7 @@ display dialog "Enter your Google Gemini API key.\\n(Get one at https://aistudio
                     try:
                         session = self.app.current_terminal_window.current_tab.current_session
                         # Run as concurrent task to allow multiple requests
-                        asyncio.create_task(self.handle_shortcut(session))
+                        self._start_shortcut(self.handle_shortcut(session))
                     except Exception as e:
                         await self._show_error(f"Error: {e}")
 
@@ -239,7 +312,7 @@ display dialog "Enter your Google Gemini API key.\\n(Get one at https://aistudio
 
                     try:
                         session = self.app.current_terminal_window.current_tab.current_session
-                        asyncio.create_task(self.show_history_dialog(session))
+                        self._start_shortcut(self.show_history_dialog(session))
                     except Exception as e:
                         await self._show_error(f"Error: {e}")
 
@@ -249,7 +322,7 @@ display dialog "Enter your Google Gemini API key.\\n(Get one at https://aistudio
                       iterm2.Modifier.COMMAND in keystroke.modifiers):
 
                     try:
-                        asyncio.create_task(self.show_model_selection())
+                        self._start_shortcut(self.show_model_selection())
                     except Exception as e:
                         await self._show_error(f"Error: {e}")
 
@@ -260,7 +333,7 @@ display dialog "Enter your Google Gemini API key.\\n(Get one at https://aistudio
 
                     try:
                         session = self.app.current_terminal_window.current_tab.current_session
-                        asyncio.create_task(self.handle_script_shortcut(session))
+                        self._start_shortcut(self.handle_script_shortcut(session))
                     except Exception as e:
                         await self._show_error(f"Error: {e}")
 
@@ -270,10 +343,41 @@ display dialog "Enter your Google Gemini API key.\\n(Get one at https://aistudio
                       iterm2.Modifier.COMMAND in keystroke.modifiers):
 
                     try:
-                        asyncio.create_task(self.show_instructions_dialog())
+                        self._start_shortcut(self.show_instructions_dialog())
                     except Exception as e:
                         await self._show_error(f"Error: {e}")
 
+    def _start_shortcut(self, coro) -> None:
+        """Run a shortcut handler as a task, pausing speculative requests until it is done."""
+        self._cancel_background_work()
+        task = asyncio.create_task(coro)
+        task.add_done_callback(lambda _: self._schedule_idle_precompute())
+
+    def _cancel_background_work(self) -> None:
+        """Stop speculative requests so they do not compete with the user."""
+        if self._idle_task is not None:
+            self._idle_task.cancel()
+            self._idle_task = None
+        if self.gemini_client is not None:
+            self.gemini_client.cancel_prefetch()
+
+    def _schedule_idle_precompute(self) -> None:
+        """Precompute explanations for history entries once the user is idle."""
+        if self.gemini_client is None or not self.config_manager.is_speculative_explain_enabled():
+            return
+        if self._idle_task is not None:
+            self._idle_task.cancel()
+        self._idle_task = asyncio.ensure_future(self._precompute_when_idle())
+
+    async def _precompute_when_idle(self) -> None:
+        """Wait for the idle delay, then explain recently used history commands."""
+        await asyncio.sleep(self.idle_delay)
+        # Empty query: most frequently and recently used first
+        commands = [item.command for item in self.history_manager.search_ranked("", 10)]
+        fetched = await self.gemini_client.precompute_explanations(commands)
+        if fetched:
+            logger.debug(f"Precomputed {fetched} history explanations")
+
     async def handle_shortcut(self, session: iterm2.Session) -> None:
         """Handle the activation shortcut."""
         # Get window ID for dialogs
@@ -321,11 +425,22 @@ display dialog "Enter your Google Gemini API key.\\n(Get one at https://aistudio
                     user_input,
                     working_directory,
                     shell_type,
-                    custom_instructions
+                    custom_instructions,
+                    candidates=self.config_manager.get_command_candidates()
                 ),
                 timeout=30.0  # 30 second timeout
             )
-            logger.info(f"Command generated: {command.command}")
+            if command.from_history:
+                logger.warning(f"API unavailable, using history: {command.command}")
+            else:
+                logger.info(f"Command generated: {command.command}")
+            if self.gemini_client.hedging:
+                logger.debug(f"Hedge stats: {self.gemini_client.hedge_stats()}")
+            if self.config_manager.is_speculative_explain_enabled():
+                # Ready by the time the user asks for it in the risk warning
+                for candidate in [command] + command.alternatives:
+                    if candidate.risk_level != RiskLevel.SAFE:
+                        self.gemini_client.prefetch_explanation(candidate.command)
 
             # Stop spinner and clear line
             spinner_running = False
@@ -384,6 +499,12 @@ display dialog "Enter your Google Gemini API key.\\n(Get one at https://aistudio
             await self._show_error(f"Error: {e}")
             return
 
+        # Let the user pick among alternative candidates without another API call
+        if command.alternatives:
+            command = await self._choose_candidate(command)
+            if command is None:
+                return
+
         # Check for dangerous commands - show warning only for dangerous ones
         if command.risk_level == RiskLevel.DANGEROUS:
             if not await self._show_dangerous_warning(window_id, command):
@@ -396,6 +517,49 @@ display dialog "Enter your Google Gemini API key.\\n(Get one at https://aistudio
         self.history_manager.add(user_input, command.command)
         await self.send_to_terminal(session, command.command)
 
+    async def _choose_candidate(self, command: GeneratedCommand) -> Optional[GeneratedCommand]:
+        """Show ranked candidate commands and return the selected one."""
+        candidates = [command] + command.alternatives
+
+        list_items = []
+        for i, candidate in enumerate(candidates, 1):
+            marker = {RiskLevel.WARNING: " ⚠️", RiskLevel.DANGEROUS: " 🚨"}.get(candidate.risk_level, "")
+            cmd_escaped = candidate.command.replace('\\', '\\\\').replace('"', '\\"')
+            list_items.append(f"{i}. {cmd_escaped}{marker}")
+
+        items_str = '", "'.join(list_items)
+
+        apple_script = f'''
+tell application "iTerm"
+    activate
+    set candidateItems to {{"{items_str}"}}
+    set selectedItem to choose from list candidateItems with title "Command Candidates" with prompt "Select a command:" default items {{item 1 of candidateItems}}
+    if selectedItem is false then
+        return ""
+    else
+        return item 1 of selectedItem
+    end if
+end tell
+'''
+        proc = await asyncio.create_subprocess_exec(
+            "osascript", "-e", apple_script,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        stdout, stderr = await proc.communicate()
+
+        if proc.returncode != 0:
+            return None
+
+        result = stdout.decode("utf-8").strip()
+        if not result:
+            return None
+
+        index = int(result.split(".")[0]) - 1
+        if 0 <= index < len(candidates):
+            return candidates[index]
+        return None
+
     async def handle_script_shortcut(self, session: iterm2.Session) -> None:
         """Handle the script generation shortcut."""
         import tempfile
@@ -564,14 +728,18 @@ sys.exit(1)
         if "/" in shell_type:
             shell_type = shell_type.split("/")[-1]
 
-        # Spinner animation
+        # Lines received so far from the streaming response
+        script_lines = []
+
+        # Spinner animation with streaming progress
         spinner_running = True
         async def run_spinner():
             spinner_chars = ["⠋", "⠙", "⠹", "⠸", "⠼", "⠴", "⠦", "⠧", "⠇", "⠏"]
             idx = 0
             while spinner_running:
                 char = spinner_chars[idx % len(spinner_chars)]
-                await session.async_send_text("\x15" + char)
+                progress = f" {len(script_lines)} lines" if script_lines else ""
+                await session.async_send_text("\x15" + char + progress)
                 idx += 1
                 await asyncio.sleep(0.1)
 
@@ -580,14 +748,24 @@ sys.exit(1)
         # Get custom instructions
         custom_instructions = self.config_manager.get_custom_instructions()
 
+        # Scan each line for risky commands while the rest is still streaming
+        scanner = ScriptRiskScanner(self.gemini_client.risk_detector, shell_type)
+
+        async def collect_script():
+            async for line in self.gemini_client.stream_script(
+                user_input,
+                working_directory,
+                shell_type,
+                custom_instructions
+            ):
+                script_lines.append(line)
+                scanner.feed(line)
+            scanner.finish()
+            return "\n".join(script_lines).strip()
+
         try:
             script = await asyncio.wait_for(
-                self.gemini_client.generate_script(
-                    user_input,
-                    working_directory,
-                    shell_type,
-                    custom_instructions
-                ),
+                collect_script(),
                 timeout=60.0  # 60 second timeout for scripts
             )
             logger.info("Script generated")
@@ -622,6 +800,12 @@ sys.exit(1)
             await self._show_error(f"Script generation failed: {e}")
             return
 
+        # Check for dangerous commands in the script
+        risk = scanner.result()
+        if risk.level != RiskLevel.SAFE:
+            if not await self._show_script_warning(window_id, scanner):
+                return
+
         # Ask user how to save the script
         apple_script = '''
 tell application "iTerm"
@@ -709,18 +893,9 @@ display dialog "Describe what you want to do in natural language.\\nEx: Find fil
         command: GeneratedCommand
     ) -> bool:
         """Show warning dialog for potentially dangerous commands."""
-        cmd_escaped = command.command.replace('"', '\\"')
-        reasons = ', '.join(command.risk_reasons)
-        apple_script = f'''
-display dialog "⚠️ This command requires caution:\\n\\n{cmd_escaped}\\n\\nReason: {reasons}\\n\\nInsert into terminal?" with title "Warning" buttons {{"Cancel", "Insert"}} default button "Insert" cancel button "Cancel"
-'''
-        proc = await asyncio.create_subprocess_exec(
-            "osascript", "-e", apple_script,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE,
+        return await self._confirm_risky(
+            window_id, command, "Warning", "⚠️ This command requires caution:", "Insert"
         )
-        stdout, stderr = await proc.communicate()
-        return proc.returncode == 0
 
     async def _show_dangerous_warning(
         self,
@@ -728,10 +903,71 @@ display dialog "⚠️ This command requires caution:\\n\\n{cmd_escaped}\\n\\nRe
         command: GeneratedCommand
     ) -> bool:
         """Show strong warning dialog for dangerous commands."""
-        cmd_escaped = command.command.replace('"', '\\"')
+        return await self._confirm_risky(
+            window_id, command, "Danger", "🚨 This command is very dangerous:", "Cancel"
+        )
+
+    async def _confirm_risky(
+        self,
+        window_id: Optional[str],
+        command: GeneratedCommand,
+        title: str,
+        header: str,
+        default: str
+    ) -> bool:
+        """Ask whether to insert a risky command; "Explain" shows what it does and asks again."""
+        cmd_escaped = command.command.replace('\\', '\\\\').replace('"', '\\"')
         reasons = ', '.join(command.risk_reasons)
         apple_script = f'''
-display dialog "🚨 This command is very dangerous:\\n\\n{cmd_escaped}\\n\\nReason: {reasons}\\n\\nInsert into terminal?" with title "Danger" buttons {{"Cancel", "Insert"}} default button "Cancel" cancel button "Cancel"
+display dialog "{header}\\n\\n{cmd_escaped}\\n\\nReason: {reasons}\\n\\nInsert into terminal?" with title "{title}" buttons {{"Cancel", "Explain", "Insert"}} default button "{default}" cancel button "Cancel"
+'''
+        while True:
+            proc = await asyncio.create_subprocess_exec(
+                "osascript", "-e", apple_script,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+            )
+            stdout, stderr = await proc.communicate()
+            if proc.returncode != 0:
+                return False
+            if "button returned:Explain" not in stdout.decode("utf-8"):
+                return True
+            await self._show_explanation(window_id, command.command)
+
+    async def _show_explanation(self, window_id: Optional[str], command: str) -> None:
+        """Show what a command does; prefetched when speculative_explain is enabled."""
+        if self.gemini_client is None:
+            return
+        try:
+            explanation = await self.gemini_client.explain_command(command)
+        except APIError as e:
+            await self._show_error(f"Explanation failed: {e}")
+            return
+        # _show_info escapes quotes and newlines only
+        explanation = explanation.replace('\\', '\\\\')
+        await self._show_info(window_id, explanation or "No explanation available.")
+
+    async def _show_script_warning(
+        self,
+        window_id: Optional[str],
+        scanner: ScriptRiskScanner
+    ) -> bool:
+        """Show warning dialog listing the risky commands found in a generated script."""
+        dangerous = scanner.result().level == RiskLevel.DANGEROUS
+        lines = []
+        for finding in scanner.findings[:5]:
+            command = finding.command.splitlines()[0][:60].replace('\\', '\\\\').replace('"', '\\"')
+            lines.append(f"Line {finding.line_number}: {command}\\n  → {', '.join(finding.reasons)}")
+        if len(scanner.findings) > 5:
+            lines.append(f"... and {len(scanner.findings) - 5} more")
+        findings_text = "\\n".join(lines)
+
+        if dangerous:
+            title, header, default = "Danger", "🚨 This script contains very dangerous commands:", "Cancel"
+        else:
+            title, header, default = "Warning", "⚠️ This script contains commands that require caution:", "Continue"
+        apple_script = f'''
+display dialog "{header}\\n\\n{findings_text}\\n\\nSave the script anyway?" with title "{title}" buttons {{"Cancel", "Continue"}} default button "{default}" cancel button "Cancel"
 '''
         proc = await asyncio.create_subprocess_exec(
             "osascript", "-e", apple_script,
@@ -766,6 +1002,26 @@ display dialog "Set an alias for this command (optional).\\nAliases help you fin
             return result if result else None
         return None
 
+    async def _show_history_search(self, window_id: Optional[str]) -> Optional[str]:
+        """Ask for a history search query. Returns None if cancelled."""
+        apple_script = '''
+display dialog "Search history (typos are OK).\\nLeave empty for your most used commands." default answer "" with title "Command History" buttons {"Cancel", "Search"} default button "Search" cancel button "Cancel"
+'''
+        proc = await asyncio.create_subprocess_exec(
+            "osascript", "-e", apple_script,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        stdout, stderr = await proc.communicate()
+
+        if proc.returncode != 0:
+            return None
+
+        output = stdout.decode("utf-8").strip()
+        if "text returned:" in output:
+            return output.split("text returned:", 1)[1].strip()
+        return ""
+
     async def _show_info(self, window_id: Optional[str], message: str) -> None:
         """Show info message dialog."""
         message_escaped = message.replace('"', '\\"').replace('\n', '\\n')
@@ -798,22 +1054,44 @@ display dialog "{message_escaped}" with title "Error" buttons {{"OK"}} default b
             window = self.app.current_terminal_window
             window_id = window.window_id if window else None
 
-            history = self.history_manager.get_all()
+            if self.history_manager.get_count() > self.HISTORY_DIALOG_LIMIT:
+                query = await self._show_history_search(window_id)
+                if query is None:
+                    return
+                # Empty query: most frequently and recently used first
+                history = self.history_manager.search_ranked(query, self.HISTORY_DIALOG_LIMIT)
+                if not history:
+                    await self._show_info(window_id, f"No history matches: {query}")
+                    return
+            else:
+                history = self.history_manager.get_all()
 
             if not history:
                 await self._show_info(window_id, "No history saved.")
                 return
 
+            # Re-score saved commands with the current rules, off the event loop.
+            # workers=1: no process pool inside the iTerm2 script process.
+            levels = [RiskLevel.SAFE] * len(history)
+            if self.gemini_client is not None:
+                detector = self.gemini_client.risk_detector
+                commands = [item.command for item in history]
+                results = await asyncio.get_event_loop().run_in_executor(
+                    None, lambda: detector.analyze_many(commands, workers=1)
+                )
+                levels = [result.level for result in results]
+
             # Build list items for choose from list
             list_items = []
-            for i, item in enumerate(history, 1):
+            for i, (item, level) in enumerate(zip(history, levels), 1):
                 alias_text = f" [{item.alias}]" if item.alias else ""
+                marker = {RiskLevel.WARNING: " ⚠️", RiskLevel.DANGEROUS: " 🚨"}.get(level, "")
                 # Escape quotes and special characters for AppleScript
                 cmd_escaped = item.command.replace('\\', '\\\\').replace('"', '\\"').replace('\n', ' ')
                 # Truncate long commands
                 if len(cmd_escaped) > 80:
                     cmd_escaped = cmd_escaped[:77] + "..."
-                list_items.append(f'{i}. {cmd_escaped}{alias_text}')
+                list_items.append(f'{i}. {cmd_escaped}{alias_text}{marker}')
 
             # Create AppleScript list string
             items_str = '", "'.join(list_items)
@@ -857,24 +1135,44 @@ end tell
             logger.exception(f"History dialog exception: {e}")
             await self._show_error(f"History error: {e}")
 
+    @staticmethod
+    def _format_model_stats(stats: dict) -> str:
+        """Format a model's command latency telemetry for the model picker."""
+        if not stats["samples"]:
+            text = "no data"
+        else:
+            text = "p50 {:.1f}s / p95 {:.1f}s / p99 {:.1f}s".format(
+                stats["p50"], stats["p95"], stats["p99"]
+            )
+        failures = []
+        if stats["errors"]:
+            failures.append(f"{stats['errors']} errors")
+        if stats["timeouts"]:
+            failures.append(f"{stats['timeouts']} timeouts")
+        if failures:
+            text += ", " + ", ".join(failures)
+        return text
+
     async def show_model_selection(self) -> None:
-        """Show model selection dialog."""
-        models = [
-            "gemini-2.5-flash-lite",
-            "gemini-2.5-flash",
-            "gemini-2.5-pro",
-            "gemini-2.0-flash",
-            "gemini-2.0-flash-lite"
-        ]
+        """Show model selection dialog with recent latency per model."""
+        models = [AUTO_MODEL] + AVAILABLE_MODELS
 
         # Get current model
         current_model = self.gemini_client.model_name if self.gemini_client else "gemini-2.5-flash"
+        model_stats = self.gemini_client.model_stats() if self.gemini_client else {}
 
-        # Build list with current marker
+        # Build list with current marker and telemetry
         list_items = []
         for model in models:
             marker = " (current)" if model == current_model else ""
-            list_items.append(f"{model}{marker}")
+            if model == AUTO_MODEL:
+                detail = "fastest healthy model"
+            elif model in model_stats:
+                detail = self._format_model_stats(model_stats[model])
+            else:
+                detail = ""
+            detail = f" - {detail}" if detail else ""
+            list_items.append(f"{model}{marker}{detail}")
 
         items_str = '", "'.join(list_items)
 
@@ -904,13 +1202,14 @@ end tell
         if not result:
             return
 
-        # Extract model name (remove " (current)" suffix if present)
-        selected_model = result.replace(" (current)", "").strip()
+        # Extract model name (drop the " (current)" marker and telemetry)
+        selected_model = result.split(" ", 1)[0].strip()
 
         if selected_model and selected_model != current_model:
             # Update model in GeminiClient
             if self.gemini_client:
                 self.gemini_client.set_model(selected_model)
+                logger.info(f"Model changed to {selected_model}")
 
     async def show_instructions_dialog(self) -> None:
         """Show custom instructions dialog using TextEdit."""
@@ -942,7 +1241,10 @@ async def main(connection: iterm2.Connection) -> None:
 
     # Initialize Gemini client (may have empty API key initially)
     api_key = config_manager.get_api_key() or ""
-    gemini_client = GeminiClient(api_key) if api_key else None
+    if api_key or not config_manager.requires_api_key():
+        gemini_client = create_gemini_client(api_key, config_manager)
+    else:
+        gemini_client = None
 
     # Create and run the generator
     generator = AICommandGenerator(
@@ -37,6 +37,9 @@ class AICommandGenerator:
         self.gemini_client = gemini_client
         self.history_manager = HistoryManager(max_items=config_manager.get_max_history())
         self.app = None
+        # Seconds without shortcut activity before history explanations are precomputed
+        self.idle_delay = 30.0
+        self._idle_task: Optional[asyncio.Task] = None
 
     async def run(self) -> None:
         """Start the main event loop."""
@@ -49,6 +52,7 @@ class AICommandGenerator:
             return
 
         logger.info("API 키 확인 완료, 키보드 모니터링 시작")
+        self._schedule_idle_precompute()
         # Set up keyboard monitoring
         await self._setup_keyboard_monitoring()
 
@@ -71,7 +75,7 @@ class AICommandGenerator:
 
         # Initialize Gemini client
         try:
-            self.gemini_client = GeminiClient(api_key)
+            self.gemini_client = GeminiClient(api_key, history_manager=self.history_manager)
         except Exception as e:
             await self._show_error(f"Gemini 클라이언트 초기화 실패: {e}")
             return False
@@ -99,22 +103,51 @@ class AICommandGenerator:
                     iterm2.Modifier.CONTROL in keystroke.modifiers and
                     iterm2.Modifier.SHIFT in keystroke.modifiers):
 
+                    self._cancel_background_work()
                     try:
                         session = self.app.current_terminal_window.current_tab.current_session
                         await self.handle_shortcut(session)
                     except Exception as e:
                         await self._show_error(f"오류 발생: {e}")
+                    self._schedule_idle_precompute()
 
                 # Check for Ctrl+Shift+H (History)
                 elif (keystroke.keycode == iterm2.Keycode.ANSI_H and
                       iterm2.Modifier.CONTROL in keystroke.modifiers and
                       iterm2.Modifier.SHIFT in keystroke.modifiers):
 
+                    self._cancel_background_work()
                     try:
                         session = self.app.current_terminal_window.current_tab.current_session
                         await self.show_history_dialog(session)
                     except Exception as e:
                         await self._show_error(f"오류 발생: {e}")
+                    self._schedule_idle_precompute()
+
+    def _cancel_background_work(self) -> None:
+        """Stop speculative requests so they do not compete with the user."""
+        if self._idle_task is not None:
+            self._idle_task.cancel()
+            self._idle_task = None
+        if self.gemini_client is not None:
+            self.gemini_client.cancel_prefetch()
+
+    def _schedule_idle_precompute(self) -> None:
+        """Precompute explanations for history entries once the user is idle."""
+        if self.gemini_client is None or not self.config_manager.is_speculative_explain_enabled():
+            return
+        if self._idle_task is not None:
+            self._idle_task.cancel()
+        self._idle_task = asyncio.ensure_future(self._precompute_when_idle())
+
+    async def _precompute_when_idle(self) -> None:
+        """Wait for the idle delay, then explain recently used history commands."""
+        await asyncio.sleep(self.idle_delay)
+        # Most frequently and recently used first
+        commands = [item.command for item in self.history_manager.search_ranked("", 10)]
+        fetched = await self.gemini_client.precompute_explanations(commands)
+        if fetched:
+            logger.debug(f"히스토리 설명 {fetched}개 미리 생성")
 
     async def handle_shortcut(self, session: iterm2.Session) -> None:
         """
@@ -147,7 +180,8 @@ class AICommandGenerator:
             command = await self.gemini_client.generate_command(
                 user_input,
                 working_directory,
-                shell_type
+                shell_type,
+                candidates=self.config_manager.get_command_candidates()
             )
             logger.info(f"명령어 생성 완료: {command.command}")
         except RateLimitError as e:
@@ -163,6 +197,14 @@ class AICommandGenerator:
             await self._show_error(f"오류 발생: {e}")
             return
 
+        # Let the user pick among alternative candidates without another API call
+        if command.alternatives:
+            command = await self._choose_candidate(command)
+            if command is None:
+                return
+        if self.config_manager.is_speculative_explain_enabled():
+            self.gemini_client.prefetch_explanation(command.command)
+
         # Show command dialog with risk handling
         result = await self.show_command_dialog(window_id, command)
 
@@ -192,6 +234,49 @@ class AICommandGenerator:
             self.history_manager.add(user_input, command.command, alias)
             await self._show_info(window_id, "명령어가 히스토리에 저장되었습니다.")
 
+    async def _choose_candidate(self, command: GeneratedCommand) -> Optional[GeneratedCommand]:
+        """Show ranked candidate commands and return the selected one."""
+        candidates = [command] + command.alternatives
+
+        list_items = []
+        for i, candidate in enumerate(candidates, 1):
+            marker = {RiskLevel.WARNING: " ⚠️", RiskLevel.DANGEROUS: " 🚨"}.get(candidate.risk_level, "")
+            cmd_escaped = candidate.command.replace('\\', '\\\\').replace('"', '\\"')
+            list_items.append(f"{i}. {cmd_escaped}{marker}")
+
+        items_str = '", "'.join(list_items)
+
+        apple_script = f'''
+tell application "iTerm"
+    activate
+    set candidateItems to {{"{items_str}"}}
+    set selectedItem to choose from list candidateItems with title "Command Candidates" with prompt "Select a command:" default items {{item 1 of candidateItems}}
+    if selectedItem is false then
+        return ""
+    else
+        return item 1 of selectedItem
+    end if
+end tell
+'''
+        proc = await asyncio.create_subprocess_exec(
+            "osascript", "-e", apple_script,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        stdout, stderr = await proc.communicate()
+
+        if proc.returncode != 0:
+            return None
+
+        result = stdout.decode("utf-8").strip()
+        if not result:
+            return None
+
+        index = int(result.split(".")[0]) - 1
+        if 0 <= index < len(candidates):
+            return candidates[index]
+        return None
+
     async def show_input_dialog(self, window_id: Optional[str]) -> Optional[str]:
         """
         Show natural language input dialog.
@@ -3,7 +3,7 @@
 import json
 import os
 from pathlib import Path
-from typing import Optional
+from typing import Any, Dict, Optional
 
 import keyring
 
@@ -40,7 +40,17 @@ class ConfigManager:
                     api_key_account=data.get("api_key_account", "gemini-api-key"),
                     shortcut_key=data.get("shortcut_key", "Ctrl+Shift+A"),
                     max_history=data.get("max_history", 50),
-                    max_input_length=data.get("max_input_length", 500)
+                    max_input_length=data.get("max_input_length", 500),
+                    max_concurrent_requests=data.get("max_concurrent_requests", 4),
+                    hedging_enabled=data.get("hedging_enabled", False),
+                    requests_per_minute=data.get("requests_per_minute", {}),
+                    command_candidates=data.get("command_candidates", 1),
+                    backend=data.get("backend", "gemini"),
+                    backend_url=data.get("backend_url", ""),
+                    backend_model=data.get("backend_model", ""),
+                    speculative_explain=data.get("speculative_explain", False),
+                    generation_profiles=data.get("generation_profiles", {}),
+                    history_backend=data.get("history_backend", "json")
                 )
             except (json.JSONDecodeError, IOError) as e:
                 raise ConfigError(f"Failed to load config: {e}")
@@ -55,7 +65,17 @@ class ConfigManager:
                 "api_key_account": self.config.api_key_account,
                 "shortcut_key": self.config.shortcut_key,
                 "max_history": self.config.max_history,
-                "max_input_length": self.config.max_input_length
+                "max_input_length": self.config.max_input_length,
+                "max_concurrent_requests": self.config.max_concurrent_requests,
+                "hedging_enabled": self.config.hedging_enabled,
+                "requests_per_minute": self.config.requests_per_minute,
+                "command_candidates": self.config.command_candidates,
+                "backend": self.config.backend,
+                "backend_url": self.config.backend_url,
+                "backend_model": self.config.backend_model,
+                "speculative_explain": self.config.speculative_explain,
+                "generation_profiles": self.config.generation_profiles,
+                "history_backend": self.config.history_backend
             }
             with open(self.config_path, 'w') as f:
                 json.dump(data, f, indent=2)
@@ -141,6 +161,54 @@ class ConfigManager:
         """Get maximum input length."""
         return self.config.max_input_length
 
+    def get_max_concurrent_requests(self) -> int:
+        """Get maximum number of concurrent API requests."""
+        return self.config.max_concurrent_requests
+
+    def is_hedging_enabled(self) -> bool:
+        """Check whether slow command requests are hedged to a faster model."""
+        return self.config.hedging_enabled
+
+    def get_requests_per_minute(self) -> Dict[str, int]:
+        """Get per-model requests-per-minute overrides for the client-side rate limiter."""
+        return self.config.requests_per_minute
+
+    def get_command_candidates(self) -> int:
+        """Get number of alternative commands requested per generation."""
+        return self.config.command_candidates
+
+    def get_backend(self) -> str:
+        """Get the text generation backend ("gemini" or "openai")."""
+        return self.config.backend
+
+    def get_backend_url(self) -> str:
+        """Get the base URL of an OpenAI-compatible backend."""
+        return self.config.backend_url
+
+    def get_backend_model(self) -> str:
+        """Get the model name sent to an OpenAI-compatible backend."""
+        return self.config.backend_model
+
+    def is_speculative_explain_enabled(self) -> bool:
+        """Check whether command explanations are fetched before they are requested."""
+        return self.config.speculative_explain
+
+    def get_generation_profiles(self) -> Dict[str, Dict[str, Any]]:
+        """Get per-operation overrides of the default generation profiles."""
+        return self.config.generation_profiles
+
+    def get_history_backend(self) -> str:
+        """Get the history storage backend ("json" or "sqlite")."""
+        return self.config.history_backend
+
+    def requires_api_key(self) -> bool:
+        """Check whether the configured backend needs a Gemini API key."""
+        return self.config.backend == "gemini"
+
+    def get_rules_dir(self) -> Path:
+        """Get the directory of *.json risk rule packs."""
+        return Path(self.config_path).parent / "rules"
+
     def get_custom_instructions(self) -> str:
         """Get custom instructions for prompts."""
         instructions_file = Path(self.config_path).parent / "instructions.txt"
@@ -16,6 +16,11 @@ class RateLimitError(APIError):
     pass
 
 
+class CircuitOpenError(APIError):
+    """Raised when the API is failing and requests are rejected without being sent."""
+    pass
+
+
 class KeychainError(AIGeneratorError):
     """Raised when Keychain access fails."""
     pass
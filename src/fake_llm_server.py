@@ -0,0 +1,242 @@
+"""
+Deterministic fake LLM server for local development.
+
+Implements enough of the OpenAI /v1/chat/completions API (plain and
+server-sent event streaming) for OpenAICompatibleBackend. Responses are
+derived from the prompt, so every client operation can be exercised
+without an API key or network access:
+
+    python3 src/fake_llm_server.py --port 8080 --latency 0.2
+"""
+
+import argparse
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Optional
+
+# Keyword -> command table used for single command requests
+COMMAND_TABLE = [
+    ("disk", "df -h"),
+    ("memory", "free -h"),
+    ("process", "ps aux"),
+    ("port", "lsof -i -P -n"),
+    ("large file", "find . -type f -size +100M"),
+    ("find", "find . -name '*'"),
+    ("git", "git status"),
+    ("list", "ls -la"),
+    ("delete", "rm -i ./*.tmp"),
+]
+
+NUMBERED_LINE_PATTERN = re.compile(r'^\s*\d+\.\s+(.*)$')
+
+
+def command_for(request: str) -> str:
+    """Map a natural language request to a deterministic command."""
+    lowered = request.lower()
+    for keyword, command in COMMAND_TABLE:
+        if keyword in lowered:
+            return command
+    return "echo " + json.dumps(request)
+
+
+def _field(prompt: str, name: str) -> str:
+    """Get a single line "Name: value" field from the prompt."""
+    match = re.search(rf'^{name}: (.*)$', prompt, re.MULTILINE)
+    return match.group(1).strip() if match else ""
+
+
+def _numbered_requests(prompt: str) -> List[str]:
+    """Get the numbered lines following "User Requests:"."""
+    requests: List[str] = []
+    section = prompt.split("User Requests:", 1)[1]
+    for line in section.strip().split("\n"):
+        match = NUMBERED_LINE_PATTERN.match(line)
+        if not match:
+            break
+        requests.append(match.group(1))
+    return requests
+
+
+def respond(prompt: str) -> str:
+    """
+    Build the response text for a prompt.
+
+    Args:
+        prompt: Prompt sent by the client.
+
+    Returns:
+        Response text in the format the prompt asks for.
+    """
+    if "User Requests:" in prompt and "JSON array of" in prompt:
+        return json.dumps([command_for(request) for request in _numbered_requests(prompt)])
+
+    if "Explain this shell command" in prompt:
+        command = _field(prompt, "Command")
+        return (
+            f"`{command}` is a deterministic response from the fake LLM server.\n"
+            "1. Purpose: runs the requested command\n"
+            "2. Options: none explained\n"
+            "3. Output: depends on the command\n"
+            "4. Warnings: none"
+        )
+
+    request = _field(prompt, "User Request")
+
+    if "bash script expert" in prompt:
+        return (
+            "#!/bin/bash\n"
+            "set -euo pipefail\n"
+            f"# {request}\n"
+            f"{command_for(request)}\n"
+        )
+
+    match = re.search(r'Generate (\d+) different alternative shell commands', prompt)
+    if match:
+        command = command_for(request)
+        count = int(match.group(1))
+        lines = [command] + [f"{command} # alternative {i}" for i in range(1, count)]
+        return "\n".join(lines)
+
+    return command_for(request)
+
+
+def apply_stop(text: str, stop_sequences: List[str]) -> str:
+    """Cut text at the first stop sequence, like a real server."""
+    if isinstance(stop_sequences, str):
+        stop_sequences = [stop_sequences]
+    for stop in stop_sequences:
+        index = text.find(stop)
+        if index != -1:
+            text = text[:index]
+    return text
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """Request handler for /v1/chat/completions."""
+
+    # Set per server by FakeLLMServer
+    latency = 0.0
+
+    def do_POST(self) -> None:
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self.send_error(404)
+            return
+
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+            prompt = body["messages"][-1]["content"]
+        except (ValueError, KeyError, IndexError, TypeError):
+            self.send_error(400)
+            return
+
+        if self.latency:
+            time.sleep(self.latency)
+
+        text = apply_stop(respond(prompt), body.get("stop") or [])
+        model = body.get("model", "fake")
+        if body.get("stream"):
+            self._send_stream(model, text)
+        else:
+            self._send_json({
+                "object": "chat.completion",
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": text},
+                    "finish_reason": "stop"
+                }]
+            })
+
+    def _send_json(self, data: dict) -> None:
+        payload = json.dumps(data).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _send_stream(self, model: str, text: str) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        # One chunk per line, like a model emitting tokens
+        for piece in text.splitlines(keepends=True):
+            event = {
+                "object": "chat.completion.chunk",
+                "model": model,
+                "choices": [{"index": 0, "delta": {"content": piece}}]
+            }
+            self.wfile.write(f"data: {json.dumps(event)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+        self.close_connection = True
+
+    def log_message(self, format: str, *args) -> None:
+        """Silence per-request logging."""
+
+
+class FakeLLMServer:
+    """Fake OpenAI-compatible server running on a background thread."""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0):
+        """
+        Initialize FakeLLMServer.
+
+        Args:
+            host: Interface to bind.
+            port: Port to bind (0 picks a free port).
+            latency: Delay in seconds before each response.
+        """
+        handler = type("Handler", (_Handler,), {"latency": latency})
+        self._server = ThreadingHTTPServer((host, port), handler)
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        """Base URL for OpenAICompatibleBackend."""
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> "FakeLLMServer":
+        """Start serving on a background thread."""
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        """Stop the server."""
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def serve_forever(self) -> None:
+        """Serve on the current thread until interrupted."""
+        self._server.serve_forever()
+
+
+def main() -> None:
+    """Run the fake server from the command line."""
+    parser = argparse.ArgumentParser(description="Fake OpenAI-compatible LLM server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--latency", type=float, default=0.0, help="response delay in seconds")
+    args = parser.parse_args()
+
+    server = FakeLLMServer(args.host, args.port, args.latency)
+    print(f"Fake LLM server listening on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
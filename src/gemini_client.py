@@ -1,51 +1,1241 @@
 """Google Gemini API client for iTerm2 AI Command Generator."""
 
 import asyncio
-import google.generativeai as genai
+import atexit
+import hashlib
+import json
+import logging
+import os
+import random
+import re
+import socket
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from dataclasses import fields, replace
+from enum import Enum
+from pathlib import Path
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, Hashable, List, NoReturn, Optional, Union
 
-from exceptions import APIError, RateLimitError
-from models import GeneratedCommand, RiskLevel
+try:
+    from google.api_core import exceptions as google_exceptions
+except ImportError:  # Installed with google-generativeai
+    google_exceptions = None
+
+from exceptions import APIError, CircuitOpenError, RateLimitError
+from history_journal import write_atomic
+from history_manager import HistoryManager
+from llm_backends import GeminiBackend, LLMBackend
+from models import CommandHistory, GeneratedCommand, GenerationProfile, RiskLevel
 from risk_detector import RiskDetector
 
+logger = logging.getLogger("iterm2-ai-generator")
+
+# Model setting that picks the fastest healthy model per operation
+AUTO_MODEL = "auto"
+
+# Models offered in the model picker
+AVAILABLE_MODELS = [
+    "gemini-2.5-flash-lite",
+    "gemini-2.5-flash",
+    "gemini-2.5-pro",
+    "gemini-2.0-flash",
+    "gemini-2.0-flash-lite"
+]
+
+# Free tier requests-per-minute limits
+DEFAULT_REQUESTS_PER_MINUTE = {
+    "gemini-2.5-flash-lite": 15,
+    "gemini-2.5-flash": 10,
+    "gemini-2.5-pro": 5,
+    "gemini-2.0-flash": 15,
+    "gemini-2.0-flash-lite": 30
+}
+FALLBACK_REQUESTS_PER_MINUTE = 10
+
+# Maximum number of alternatives requested by generate_command
+MAX_CANDIDATES = 5
+
+# Strips "1. ", "2) ", "- " prefixes from candidate lines
+CANDIDATE_PREFIX_PATTERN = re.compile(r'^\s*(?:\d+[.)]|[-*])\s+')
+
+# Maximum number of requests in one generate_commands_batch call
+MAX_BATCH_SIZE = 20
+
+# Generation settings per operation. A command is one short line, so its
+# output is capped hard; stopping at a single "\n" would cut a response
+# that starts with a ```bash fence, so commands stop at a blank line or
+# the closing fence instead. Batch output tokens are per request.
+DEFAULT_GENERATION_PROFILES = {
+    "command": GenerationProfile(
+        max_output_tokens=128,
+        temperature=0.2,
+        stop_sequences=("\n\n", "\n```"),
+        max_input_chars=2000
+    ),
+    "candidates": GenerationProfile(
+        max_output_tokens=512,
+        temperature=0.7,
+        max_input_chars=2000
+    ),
+    "batch": GenerationProfile(
+        max_output_tokens=96,
+        temperature=0.2,
+        max_input_chars=1000
+    ),
+    "script": GenerationProfile(
+        max_output_tokens=4096,
+        temperature=0.3,
+        max_input_chars=12000,
+        max_instructions_chars=4000
+    ),
+    "explain": GenerationProfile(
+        max_output_tokens=768,
+        temperature=0.3,
+        max_input_chars=4000
+    )
+}
+
+# HTTP status codes worth retrying
+TRANSIENT_STATUS_CODES = {500, 502, 503, 504}
+
+# Backup models for hedging, fastest first
+FAST_MODELS = [
+    "gemini-2.5-flash-lite",
+    "gemini-2.0-flash-lite",
+    "gemini-2.0-flash"
+]
+
+
+def build_generation_profiles(
+    overrides: Optional[Dict[str, Dict[str, Any]]] = None
+) -> Dict[str, GenerationProfile]:
+    """
+    Merge per-operation overrides from config.json into the default profiles.
+
+    Args:
+        overrides: Operation name -> {field: value}, e.g.
+            {"script": {"model": "gemini-2.5-pro"}}.
+
+    Returns:
+        Profile for every operation.
+
+    Raises:
+        ValueError: If an operation or field name is unknown.
+    """
+    profiles = dict(DEFAULT_GENERATION_PROFILES)
+    field_names = {f.name for f in fields(GenerationProfile)}
+    for operation, values in (overrides or {}).items():
+        if operation not in profiles:
+            raise ValueError(f"Unknown generation profile: {operation}")
+        unknown = set(values) - field_names
+        if unknown:
+            raise ValueError(f"Unknown {operation} profile fields: {', '.join(sorted(unknown))}")
+        values = dict(values)
+        if "stop_sequences" in values:
+            values["stop_sequences"] = tuple(values["stop_sequences"])
+        profiles[operation] = replace(profiles[operation], **values)
+    return {operation: replace(profile, name=operation) for operation, profile in profiles.items()}
+
+
+def fit_to_budget(text: str, max_chars: int) -> str:
+    """
+    Shrink text to at most max_chars before it is put in a prompt.
+
+    Whitespace is collapsed and repeated lines are dropped first. If that is
+    not enough, the beginning and end are kept and the middle is replaced
+    with a marker, since requests and instructions usually state the goal
+    up front and the details last.
+
+    Args:
+        text: User input or custom instructions.
+        max_chars: Character budget (0 disables trimming).
+
+    Returns:
+        Text within the budget.
+    """
+    if max_chars <= 0 or len(text) <= max_chars:
+        return text
+
+    lines: List[str] = []
+    seen = set()
+    for line in text.splitlines():
+        line = " ".join(line.split())
+        if line and line not in seen:
+            seen.add(line)
+            lines.append(line)
+    compact = "\n".join(lines)
+    if len(compact) <= max_chars:
+        return compact
+
+    marker = "\n[...{} characters omitted...]\n"
+    available = max(0, max_chars - len(marker.format(len(compact))))
+    head = available * 2 // 3
+    tail = available - head
+    omitted = len(compact) - head - tail
+    return compact[:head] + marker.format(omitted) + (compact[-tail:] if tail else "")
+
+
+class ResponseCache:
+    """
+    LRU + TTL cache of generated text, persisted to disk.
+
+    put() only marks the cache changed. A writer thread saves it debounce
+    seconds later, so a burst of misses costs one write and the event loop
+    never waits for the disk. close() saves what is still unsaved and runs
+    at exit.
+    """
+
+    def __init__(
+        self,
+        cache_path: Optional[str] = None,
+        max_entries: int = 256,
+        ttl_seconds: float = 24 * 60 * 60,
+        filename: str = "command_cache.json",
+        debounce: float = 1.0
+    ):
+        """
+        Initialize ResponseCache.
+
+        Args:
+            cache_path: Path to cache file. Defaults to ~/.config/iterm2-ai-generator/<filename>
+            max_entries: Maximum number of entries kept in memory and on disk.
+            ttl_seconds: Seconds after which an entry expires.
+            filename: Cache file name used when cache_path is not given.
+            debounce: Seconds a change waits for more to save with it.
+        """
+        if cache_path is None:
+            config_dir = Path.home() / ".config" / "iterm2-ai-generator"
+            config_dir.mkdir(parents=True, exist_ok=True)
+            cache_path = str(config_dir / filename)
+
+        self.cache_path = cache_path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.debounce = debounce
+        self.hits = 0
+        self.misses = 0
+        # key -> (value, created_at epoch seconds), least recently used first
+        self._entries: "OrderedDict[str, tuple]" = self._load_cache()
+        self._dirty = False
+        self._closing = False
+        self._writer: Optional[threading.Thread] = None
+        # Guards the entries, which the writer copies; the writer waits on it for changes
+        self._lock = threading.Lock()
+        self._wake = threading.Condition(self._lock)
+        atexit.register(self.close)
+
+    @staticmethod
+    def make_key(
+        user_input: str,
+        working_directory: str,
+        shell_type: str,
+        custom_instructions: str,
+        model_name: str
+    ) -> str:
+        """
+        Build a cache key for a generation request.
+
+        The user input is whitespace-normalized and the custom instructions are
+        hashed, so editing instructions.txt or switching models never returns a
+        stale command.
+        """
+        normalized_input = " ".join(user_input.split())
+        instructions_hash = hashlib.sha256(custom_instructions.encode("utf-8")).hexdigest()
+        raw = json.dumps(
+            [normalized_input, working_directory, shell_type, instructions_hash, model_name],
+            ensure_ascii=False
+        )
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def make_explanation_key(command: str) -> str:
+        """
+        Build a cache key for a command explanation.
+
+        Explanations depend only on the command text, so they are shared
+        across models and working directories.
+        """
+        return hashlib.sha256(command.strip().encode("utf-8")).hexdigest()
+
+    def __contains__(self, key: str) -> bool:
+        """Check for an unexpired entry without touching LRU order or counters."""
+        with self._lock:
+            item = self._entries.get(key)
+        return item is not None and time.time() - item[1] < self.ttl_seconds
+
+    def _load_cache(self) -> "OrderedDict[str, tuple]":
+        """Load unexpired entries from file."""
+        entries: "OrderedDict[str, tuple]" = OrderedDict()
+        if not os.path.exists(self.cache_path):
+            return entries
+
+        try:
+            with open(self.cache_path, 'r') as f:
+                data = json.load(f)
+            now = time.time()
+            for item in data.get("entries", []):
+                if now - item["created_at"] < self.ttl_seconds:
+                    entries[item["key"]] = (item["value"], item["created_at"])
+        except (json.JSONDecodeError, IOError, KeyError, TypeError):
+            return OrderedDict()
+
+        while len(entries) > self.max_entries:
+            entries.popitem(last=False)
+        return entries
+
+    def _schedule_save(self) -> None:
+        """Mark the entries changed and wake the writer thread; called with the lock held."""
+        self._dirty = True
+        if self._writer is None:
+            self._writer = threading.Thread(target=self._run_writer, name="cache-writer", daemon=True)
+            self._writer.start()
+        self._wake.notify()
+
+    def _run_writer(self) -> None:
+        """Save the entries debounce seconds after a change, until close()."""
+        while True:
+            with self._wake:
+                while not self._dirty and not self._closing:
+                    self._wake.wait()
+                if self._closing:
+                    # close() saves the rest
+                    return
+                deadline = time.monotonic() + self.debounce
+                while not self._closing:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._wake.wait(remaining)
+            self._save_cache()
+
+    def _save_cache(self) -> None:
+        """Atomically save entries to file if they changed, ignoring write failures."""
+        with self._lock:
+            if not self._dirty:
+                return
+            self._dirty = False
+            items = list(self._entries.items())
+        data = {
+            "version": "1.0",
+            "entries": [
+                {"key": key, "value": value, "created_at": created_at}
+                for key, (value, created_at) in items
+            ]
+        }
+        try:
+            write_atomic(Path(self.cache_path), data)
+        except (OSError, TypeError, ValueError):
+            pass
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        Get a cached value.
+
+        Args:
+            key: Cache key from make_key().
+
+        Returns:
+            Cached value or None if missing or expired.
+        """
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+
+            value, created_at = item
+            if time.time() - created_at >= self.ttl_seconds:
+                del self._entries[key]
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: str, value: str) -> None:
+        """
+        Store a value, evicting the least recently used entries if full.
+
+        Args:
+            key: Cache key from make_key().
+            value: Value to store.
+        """
+        with self._lock:
+            self._entries[key] = (value, time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._schedule_save()
+
+    def clear(self) -> None:
+        """Remove all entries and reset counters."""
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+            self._schedule_save()
+
+    def close(self) -> None:
+        """Save unsaved entries and stop the writer thread."""
+        with self._wake:
+            writer = self._writer
+            self._closing = True
+            self._wake.notify()
+        if writer is not None:
+            writer.join()
+        self._save_cache()
+        with self._wake:
+            # A later put() starts a new writer
+            self._closing = False
+            self._writer = None
+
+    def stats(self) -> Dict[str, int]:
+        """Get hit/miss counters and current size."""
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._entries)}
+
+
+class RequestTransport:
+    """Runs backend API calls with a bounded number of requests in flight."""
+
+    def __init__(self, max_in_flight: int = 4, use_native_async: bool = True):
+        """
+        Initialize RequestTransport.
+
+        Args:
+            max_in_flight: Maximum number of concurrent API requests.
+                Further requests wait in a queue.
+            use_native_async: Use the backend's asyncio API when available
+                instead of a thread executor.
+
+        Raises:
+            ValueError: If max_in_flight is less than 1.
+        """
+        if max_in_flight < 1:
+            raise ValueError("max_in_flight must be at least 1")
+
+        self.max_in_flight = max_in_flight
+        self.use_native_async = use_native_async
+        # Dedicated pool for blocking calls instead of the loop's default executor
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_in_flight,
+            thread_name_prefix="llm-request"
+        )
+        # Created lazily so it binds to the running event loop
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self.in_flight = 0
+        self.queued = 0
+        self.max_queue_depth = 0
+        self.total_requests = 0
+
+    @asynccontextmanager
+    async def _slot(self) -> AsyncIterator[None]:
+        """Wait for a free request slot and hold it."""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_in_flight)
+
+        self.queued += 1
+        self.max_queue_depth = max(self.max_queue_depth, self.queued)
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.queued -= 1
+
+        self.in_flight += 1
+        self.total_requests += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self._semaphore.release()
+
+    def _has_native_async(self, backend: LLMBackend) -> bool:
+        """Check whether the backend has a native asyncio API."""
+        return self.use_native_async and backend.supports_async
+
+    async def generate(
+        self,
+        backend: LLMBackend,
+        model_name: str,
+        prompt: str,
+        profile: Optional[GenerationProfile] = None
+    ) -> str:
+        """
+        Run a single generation request.
+
+        Args:
+            backend: Backend that serves the request.
+            model_name: Model to use.
+            prompt: Prompt to send.
+            profile: Optional generation settings.
+
+        Returns:
+            Full response text.
+        """
+        async with self._slot():
+            if self._has_native_async(backend):
+                return await backend.generate_async(model_name, prompt, profile)
+
+            loop = asyncio.get_event_loop()
+            return await loop.run_in_executor(
+                self._executor,
+                lambda: backend.generate(model_name, prompt, profile)
+            )
+
+    async def stream(
+        self,
+        backend: LLMBackend,
+        model_name: str,
+        prompt: str,
+        profile: Optional[GenerationProfile] = None
+    ) -> AsyncIterator[str]:
+        """
+        Run a streaming generation request.
+
+        Closing the generator stops reading the remainder of the stream and
+        frees the request slot.
+
+        Args:
+            backend: Backend that serves the request.
+            model_name: Model to use.
+            prompt: Prompt to send.
+            profile: Optional generation settings.
+
+        Yields:
+            Response text chunks as they arrive.
+        """
+        async with self._slot():
+            if self._has_native_async(backend):
+                chunks = backend.stream_async(model_name, prompt, profile)
+                try:
+                    async for chunk in chunks:
+                        yield chunk
+                finally:
+                    await chunks.aclose()
+                return
+
+            loop = asyncio.get_event_loop()
+            queue: asyncio.Queue = asyncio.Queue()
+            stop = threading.Event()
+            done = object()
+
+            def produce() -> None:
+                try:
+                    for chunk in backend.stream(model_name, prompt, profile):
+                        if stop.is_set():
+                            break
+                        loop.call_soon_threadsafe(queue.put_nowait, chunk)
+                except Exception as e:
+                    loop.call_soon_threadsafe(queue.put_nowait, e)
+                finally:
+                    loop.call_soon_threadsafe(queue.put_nowait, done)
+
+            loop.run_in_executor(self._executor, produce)
+            try:
+                while True:
+                    item = await queue.get()
+                    if item is done:
+                        return
+                    if isinstance(item, Exception):
+                        raise item
+                    yield item
+            finally:
+                stop.set()
+
+    def stats(self) -> Dict[str, int]:
+        """Get concurrency and queue-depth metrics."""
+        return {
+            "max_in_flight": self.max_in_flight,
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "max_queue_depth": self.max_queue_depth,
+            "total_requests": self.total_requests
+        }
+
+    def close(self) -> None:
+        """Shut down the thread pool."""
+        self._executor.shutdown(wait=False)
+
+
+class _SharedStream:
+    """One underlying stream replayed to every consumer that joins it."""
+
+    def __init__(self, source: AsyncIterator[str], on_finish: Callable[[], None]):
+        self.items: List[str] = []
+        self.error: Optional[BaseException] = None
+        self.finished = False
+        self.consumers = 0
+        self._on_finish = on_finish
+        self._changed = asyncio.Condition()
+        self._task = asyncio.ensure_future(self._pump(source))
+
+    async def _pump(self, source: AsyncIterator[str]) -> None:
+        """Read the source stream and wake up waiting consumers."""
+        try:
+            async for item in source:
+                async with self._changed:
+                    self.items.append(item)
+                    self._changed.notify_all()
+        except asyncio.CancelledError:
+            self.error = asyncio.CancelledError()
+        except Exception as e:
+            self.error = e
+        finally:
+            self._on_finish()
+            async with self._changed:
+                self.finished = True
+                self._changed.notify_all()
+
+    async def consume(self) -> AsyncIterator[str]:
+        """Yield all items from the start, then new ones as they arrive."""
+        self.consumers += 1
+        index = 0
+        try:
+            while True:
+                async with self._changed:
+                    while index >= len(self.items) and not self.finished:
+                        await self._changed.wait()
+                if index < len(self.items):
+                    yield self.items[index]
+                    index += 1
+                    continue
+                if self.error is not None:
+                    raise self.error
+                return
+        finally:
+            self.consumers -= 1
+            # The last consumer leaving cancels the underlying request
+            if self.consumers == 0 and not self.finished:
+                self._on_finish()
+                self._task.cancel()
+
+
+class SingleFlight:
+    """Coalesces concurrent identical requests into one underlying request."""
+
+    def __init__(self):
+        """Initialize SingleFlight."""
+        # key -> [task, waiter count]
+        self._calls: Dict[Hashable, list] = {}
+        self._streams: Dict[Hashable, _SharedStream] = {}
+        self.coalesced = 0
+
+    async def run(self, key: Hashable, factory: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Await the result of factory(), sharing it with concurrent callers.
+
+        A caller that is cancelled (e.g. by asyncio.wait_for) only stops
+        waiting; the request itself is cancelled once no caller is waiting.
+
+        Args:
+            key: Identity of the request.
+            factory: Creates the awaitable when no identical request is in flight.
+
+        Returns:
+            Result of the shared request.
+        """
+        call = self._calls.get(key)
+        if call is None:
+            task = asyncio.ensure_future(factory())
+            call = [task, 0]
+            self._calls[key] = call
+            task.add_done_callback(lambda _: self._forget_call(key, task))
+        else:
+            self.coalesced += 1
+
+        task = call[0]
+        call[1] += 1
+        try:
+            return await asyncio.shield(task)
+        finally:
+            call[1] -= 1
+            if call[1] == 0 and not task.done():
+                task.cancel()
+
+    def _forget_call(self, key: Hashable, task: "asyncio.Future") -> None:
+        """Remove a finished call from the in-flight table."""
+        call = self._calls.get(key)
+        if call is not None and call[0] is task:
+            del self._calls[key]
+
+    def stream(
+        self,
+        key: Hashable,
+        factory: Callable[[], AsyncIterator[str]]
+    ) -> AsyncIterator[str]:
+        """
+        Iterate factory()'s stream, sharing it with concurrent callers.
+
+        Callers joining late first receive the items already produced. The
+        underlying stream is cancelled once every caller has stopped iterating.
+
+        Args:
+            key: Identity of the request.
+            factory: Creates the stream when no identical request is in flight.
+
+        Returns:
+            Async iterator over the shared stream.
+        """
+        shared = self._streams.get(key)
+        if shared is None:
+            shared = _SharedStream(factory(), lambda: self._forget_stream(key, shared))
+            self._streams[key] = shared
+        else:
+            self.coalesced += 1
+        return shared.consume()
+
+    def _forget_stream(self, key: Hashable, shared: Optional[_SharedStream]) -> None:
+        """Remove a finished stream from the in-flight table."""
+        if self._streams.get(key) is shared:
+            del self._streams[key]
+
+
+class LatencyTracker:
+    """Rolling window of recent request latencies and failures per model."""
+
+    def __init__(self, window: int = 50):
+        """
+        Initialize LatencyTracker.
+
+        Args:
+            window: Number of recent samples kept per model.
+        """
+        self.window = window
+        self._samples: Dict[str, Deque[float]] = {}
+        # Recent outcomes per model: "ok", "error" or "timeout"
+        self._outcomes: Dict[str, Deque[str]] = {}
+
+    def _add_outcome(self, model_name: str, outcome: str) -> None:
+        """Append an outcome to the model's rolling window."""
+        if model_name not in self._outcomes:
+            self._outcomes[model_name] = deque(maxlen=self.window)
+        self._outcomes[model_name].append(outcome)
+
+    def record(self, model_name: str, seconds: float) -> None:
+        """Record a successful request latency."""
+        if model_name not in self._samples:
+            self._samples[model_name] = deque(maxlen=self.window)
+        self._samples[model_name].append(seconds)
+        self._add_outcome(model_name, "ok")
+
+    def record_error(self, model_name: str, timeout: bool = False) -> None:
+        """Record a failed request."""
+        self._add_outcome(model_name, "timeout" if timeout else "error")
+
+    def error_rate(self, model_name: str) -> float:
+        """Get the share of recent requests that failed or timed out."""
+        outcomes = self._outcomes.get(model_name, ())
+        if not outcomes:
+            return 0.0
+        return sum(1 for outcome in outcomes if outcome != "ok") / len(outcomes)
+
+    def is_healthy(self, model_name: str, max_error_rate: float = 0.5) -> bool:
+        """Check whether a model's recent error rate is acceptable (True without data)."""
+        return self.error_rate(model_name) < max_error_rate
+
+    def summary(self, model_name: str) -> Dict[str, Optional[float]]:
+        """
+        Get latency quantiles and failure counts for a model.
+
+        Returns:
+            samples, p50/p95/p99 in seconds (None without samples), errors,
+            timeouts and error_rate over the rolling window.
+        """
+        outcomes = self._outcomes.get(model_name, ())
+        return {
+            "samples": self.count(model_name),
+            "p50": self.quantile(model_name, 0.5),
+            "p95": self.quantile(model_name, 0.95),
+            "p99": self.quantile(model_name, 0.99),
+            "errors": sum(1 for outcome in outcomes if outcome == "error"),
+            "timeouts": sum(1 for outcome in outcomes if outcome == "timeout"),
+            "error_rate": self.error_rate(model_name)
+        }
+
+    def count(self, model_name: str) -> int:
+        """Get number of samples for a model."""
+        return len(self._samples.get(model_name, ()))
+
+    def quantile(self, model_name: str, q: float) -> Optional[float]:
+        """
+        Get a latency quantile for a model.
+
+        Args:
+            model_name: Model to look up.
+            q: Quantile between 0 and 1.
+
+        Returns:
+            Latency in seconds, or None without samples.
+        """
+        samples = sorted(self._samples.get(model_name, ()))
+        if not samples:
+            return None
+        index = min(len(samples) - 1, int(q * len(samples)))
+        return samples[index]
+
+    def expected_excess(self, model_name: str, elapsed: float) -> float:
+        """
+        Estimate how much longer a request already running for `elapsed` seconds would take.
+
+        Uses the mean of recorded latencies above `elapsed`; 0.0 without data.
+        """
+        slower = [s for s in self._samples.get(model_name, ()) if s > elapsed]
+        if not slower:
+            return 0.0
+        return sum(slower) / len(slower) - elapsed
+
+
+class ErrorKind(Enum):
+    """Classification of API call failures."""
+    RATE_LIMIT = "rate_limit"
+    TRANSIENT = "transient"
+    FATAL = "fatal"
+
+
+def classify_error(error: BaseException) -> ErrorKind:
+    """
+    Classify an API failure by exception type and status code.
+
+    Args:
+        error: Exception raised by an API call.
+
+    Returns:
+        ErrorKind telling whether the call may succeed if retried.
+    """
+    if isinstance(error, RateLimitError):
+        return ErrorKind.RATE_LIMIT
+    if google_exceptions is not None:
+        if isinstance(error, (google_exceptions.ResourceExhausted, google_exceptions.TooManyRequests)):
+            return ErrorKind.RATE_LIMIT
+        if isinstance(error, (
+            google_exceptions.ServiceUnavailable,
+            google_exceptions.InternalServerError,
+            google_exceptions.BadGateway,
+            google_exceptions.GatewayTimeout,
+            google_exceptions.DeadlineExceeded
+        )):
+            return ErrorKind.TRANSIENT
+
+    # HTTP-style errors expose the status code as `code` or `status_code`
+    status = getattr(error, "status_code", None) or getattr(error, "code", None)
+    if status == 429:
+        return ErrorKind.RATE_LIMIT
+    if status in TRANSIENT_STATUS_CODES:
+        return ErrorKind.TRANSIENT
+
+    if isinstance(error, (asyncio.TimeoutError, OSError)):
+        return ErrorKind.TRANSIENT
+    return ErrorKind.FATAL
+
+
+def is_timeout(error: BaseException) -> bool:
+    """Check whether an API failure was a timeout rather than an error response."""
+    if isinstance(error, (asyncio.TimeoutError, socket.timeout)):
+        return True
+    # urllib wraps socket timeouts in URLError
+    if isinstance(getattr(error, "reason", None), socket.timeout):
+        return True
+    if google_exceptions is not None and isinstance(
+        error, (google_exceptions.DeadlineExceeded, google_exceptions.GatewayTimeout)
+    ):
+        return True
+    return (getattr(error, "status_code", None) or getattr(error, "code", None)) == 504
+
+
+class TokenBucket:
+    """Token bucket refilled continuously at a requests-per-minute rate."""
+
+    def __init__(self, requests_per_minute: float, capacity: Optional[float] = None):
+        """
+        Initialize TokenBucket.
+
+        Args:
+            requests_per_minute: Refill rate.
+            capacity: Maximum burst size. Defaults to one minute of requests.
+
+        Raises:
+            ValueError: If requests_per_minute is not positive.
+        """
+        if requests_per_minute <= 0:
+            raise ValueError("requests_per_minute must be positive")
+
+        self.rate = requests_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else float(requests_per_minute)
+        self.tokens = self.capacity
+        self._updated = time.monotonic()
+
+    def _refill(self) -> None:
+        """Add the tokens accumulated since the last update."""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self) -> float:
+        """Get seconds until a token is available."""
+        self._refill()
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def try_acquire(self) -> bool:
+        """Take a token if one is available without waiting."""
+        if self.wait_time() > 0:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class RateLimiter:
+    """Per-model client-side rate limiter."""
+
+    def __init__(self, requests_per_minute: Optional[Dict[str, int]] = None):
+        """
+        Initialize RateLimiter.
+
+        Args:
+            requests_per_minute: Per-model overrides of DEFAULT_REQUESTS_PER_MINUTE.
+        """
+        self.requests_per_minute = dict(DEFAULT_REQUESTS_PER_MINUTE)
+        if requests_per_minute:
+            self.requests_per_minute.update(requests_per_minute)
+        self._buckets: Dict[str, TokenBucket] = {}
+        self.queued = 0
+        self.shed = 0
+        self.total_wait_seconds = 0.0
+
+    def _bucket(self, model_name: str) -> TokenBucket:
+        """Get or create the bucket for a model."""
+        if model_name not in self._buckets:
+            rpm = self.requests_per_minute.get(model_name, FALLBACK_REQUESTS_PER_MINUTE)
+            self._buckets[model_name] = TokenBucket(rpm)
+        return self._buckets[model_name]
+
+    def try_acquire(self, model_name: str) -> bool:
+        """Take a request slot for a model only if one is free right now."""
+        return self._bucket(model_name).try_acquire()
+
+    def has_headroom(self, model_name: str, reserve: int = 0) -> bool:
+        """
+        Check whether a request could start now and still leave spare slots.
+
+        Used by background work so it never takes the last slots that an
+        interactive request would need.
+
+        Args:
+            model_name: Model the request would be sent to.
+            reserve: Number of slots that must remain free afterwards.
+        """
+        bucket = self._bucket(model_name)
+        bucket.wait_time()
+        return bucket.tokens >= 1 + reserve
+
+    async def acquire(self, model_name: str, deadline: Optional[float] = None) -> None:
+        """
+        Wait for a request slot for a model.
+
+        Args:
+            model_name: Model the request is sent to.
+            deadline: Absolute time.monotonic() by which the request must start.
+
+        Raises:
+            RateLimitError: If no slot frees up before the deadline.
+        """
+        bucket = self._bucket(model_name)
+        while True:
+            wait = bucket.wait_time()
+            if wait <= 0:
+                bucket.tokens -= 1
+                return
+            if deadline is not None and time.monotonic() + wait > deadline:
+                self.shed += 1
+                raise RateLimitError(
+                    f"Local rate limit for {model_name} reached "
+                    f"({self.requests_per_minute.get(model_name, FALLBACK_REQUESTS_PER_MINUTE)}/min)"
+                )
+            self.queued += 1
+            self.total_wait_seconds += wait
+            await asyncio.sleep(wait)
+
+    def stats(self) -> Dict[str, float]:
+        """Get queued/shed counters and time spent waiting."""
+        return {
+            "queued": self.queued,
+            "shed": self.shed,
+            "total_wait_seconds": self.total_wait_seconds
+        }
+
+
+class CircuitState(Enum):
+    """Circuit breaker state."""
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """Fails fast after consecutive API failures, probing periodically for recovery."""
+
+    def __init__(self, failure_threshold: int = 3, reset_timeout: float = 30.0):
+        """
+        Initialize CircuitBreaker.
+
+        Args:
+            failure_threshold: Consecutive failures or timeouts that open the circuit.
+            reset_timeout: Seconds to stay open before letting a probe request through.
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CircuitState.CLOSED
+        self.consecutive_failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self.times_opened = 0
+        self.rejected = 0
+
+    def _transition(self, state: CircuitState) -> None:
+        """Change state and log the transition."""
+        if state == self.state:
+            return
+        logger.info(f"Circuit breaker {self.state.value} -> {state.value}")
+        self.state = state
+        if state == CircuitState.OPEN:
+            self._opened_at = time.monotonic()
+            self.times_opened += 1
+
+    def retry_after(self) -> float:
+        """Get seconds until the next probe is allowed."""
+        if self.state != CircuitState.OPEN:
+            return 0.0
+        return max(0.0, self._opened_at + self.reset_timeout - time.monotonic())
+
+    def allow_request(self) -> bool:
+        """
+        Check whether a request may be sent.
+
+        Once the reset timeout has passed, a single probe request is allowed
+        through in the half-open state.
+        """
+        if self.state == CircuitState.OPEN and self.retry_after() == 0:
+            self._transition(CircuitState.HALF_OPEN)
+
+        if self.state == CircuitState.CLOSED:
+            return True
+        if self.state == CircuitState.HALF_OPEN and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return True
+
+        self.rejected += 1
+        return False
+
+    def record_success(self) -> None:
+        """Record a request that reached the API."""
+        self._probe_in_flight = False
+        self.consecutive_failures = 0
+        self._transition(CircuitState.CLOSED)
+
+    def record_failure(self) -> None:
+        """Record a failed or timed out request."""
+        self._probe_in_flight = False
+        self.consecutive_failures += 1
+        if (self.state == CircuitState.HALF_OPEN or
+                self.consecutive_failures >= self.failure_threshold):
+            self._transition(CircuitState.OPEN)
+
+    def release(self) -> None:
+        """Record a request that ended without reaching the API."""
+        self._probe_in_flight = False
+
+    def stats(self) -> Dict[str, Any]:
+        """Get breaker state and counters."""
+        return {
+            "state": self.state.value,
+            "consecutive_failures": self.consecutive_failures,
+            "times_opened": self.times_opened,
+            "rejected": self.rejected,
+            "retry_after": self.retry_after()
+        }
+
 
 class GeminiClient:
     """Client for Google Gemini API."""
 
-    def __init__(self, api_key: str):
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        response_cache: Optional[ResponseCache] = None,
+        transport: Optional[RequestTransport] = None,
+        rate_limiter: Optional["RateLimiter"] = None,
+        circuit_breaker: Optional["CircuitBreaker"] = None,
+        history_manager: Optional[HistoryManager] = None,
+        hedging: bool = False,
+        hedge_model: Optional[str] = None,
+        backend: Optional[LLMBackend] = None,
+        explanation_cache: Optional[ResponseCache] = None,
+        profiles: Optional[Dict[str, GenerationProfile]] = None,
+        risk_detector: Optional[RiskDetector] = None
+    ):
         """
         Initialize GeminiClient.
 
         Args:
-            api_key: Google Gemini API key.
+            api_key: Google Gemini API key. Not needed when a backend is given.
+            response_cache: Optional command cache (created if not provided).
+            transport: Optional request transport (created if not provided).
+            rate_limiter: Optional client-side rate limiter (created if not provided).
+            circuit_breaker: Optional circuit breaker (created if not provided).
+            history_manager: Optional history used as an offline fallback
+                while the circuit breaker is open.
+            hedging: Send a backup request to a faster model when command
+                generation is slower than usual.
+            hedge_model: Backup model for hedging. Defaults to the fastest
+                observed model.
+            backend: Optional text generation backend. Defaults to Gemini
+                using api_key.
+            explanation_cache: Optional explanation cache (created if not provided).
+            profiles: Optional generation profile per operation ("command",
+                "candidates", "batch", "script", "explain"). Defaults to
+                DEFAULT_GENERATION_PROFILES.
+            risk_detector: Optional risk detector, e.g. with a rule pack
+                directory (created with built-in rules if not provided).
 
         Raises:
-            ValueError: If API key is empty.
+            ValueError: If API key is empty and no backend is given.
         """
-        if not api_key:
-            raise ValueError("API key cannot be empty")
+        if backend is None:
+            if not api_key:
+                raise ValueError("API key cannot be empty")
+            backend = GeminiBackend(api_key)
 
         self.api_key = api_key
-        genai.configure(api_key=api_key)
+        self.backend = backend
+        # Create model handles up front instead of on the first request or model switch
+        self.backend.warm(AVAILABLE_MODELS)
         self.model_name = 'gemini-2.5-flash-lite'
-        self.model = genai.GenerativeModel(self.model_name)
-        self.risk_detector = RiskDetector()
+        self.profiles = profiles if profiles is not None else build_generation_profiles()
+        self.risk_detector = risk_detector if risk_detector is not None else RiskDetector()
+        self.response_cache = response_cache if response_cache is not None else ResponseCache()
+        if explanation_cache is None:
+            explanation_cache = ResponseCache(
+                max_entries=512,
+                ttl_seconds=30 * 24 * 60 * 60,
+                filename="explanation_cache.json"
+            )
+        self.explanation_cache = explanation_cache
+        self.transport = transport if transport is not None else RequestTransport()
+        self.rate_limiter = rate_limiter if rate_limiter is not None else RateLimiter()
+        self.circuit_breaker = circuit_breaker if circuit_breaker is not None else CircuitBreaker()
+        self.history_manager = history_manager
+        self.single_flight = SingleFlight()
+
+        # Retry settings for transient failures
+        self.max_attempts = 3
+        self.retry_base_delay = 0.5
+        self.retry_max_delay = 8.0
+        # Stay below the 30 second timeout used by the shortcut handlers
+        self.request_deadline = 25.0
+
+        # Per-operation latency and error telemetry. Command latency is the
+        # time to the first streamed chunk and also drives hedging.
+        self.operation_latency: Dict[str, LatencyTracker] = {
+            operation: LatencyTracker() for operation in self.profiles
+        }
+        self.latency_tracker = self.operation_latency["command"]
+        # Samples a model needs before "auto" compares it by latency
+        self.auto_min_samples = 3
+
+        # Hedging settings and counters
+        self.hedging = hedging
+        self.hedge_model = hedge_model
+        self.hedge_quantile = 0.9
+        self.hedge_min_samples = 5
+        self.hedge_default_delay = 3.0
+        self.hedge_min_delay = 0.5
+        self.hedge_requests = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.hedge_saved_seconds = 0.0
+
+        # Speculative explanation settings and counters
+        self.prefetch_reserve = 2  # Rate limit slots kept for interactive requests
+        self._prefetch_tasks: Dict[str, "asyncio.Task"] = {}
+        self.prefetch_started = 0
+        self.prefetch_skipped = 0
+        self.prefetch_failed = 0
+
+    def _model_for(self, profile: Optional[GenerationProfile]) -> str:
+        """Get the model for an operation: the profile override or the selected model."""
+        if profile is not None and profile.model:
+            return profile.model
+        if self.model_name == AUTO_MODEL:
+            return self._auto_model(profile.name if profile is not None else "command")
+        return self.model_name
+
+    def _auto_model(self, operation: str) -> str:
+        """
+        Pick the fastest healthy model for an operation.
+
+        Models are compared by median latency once they have a few samples
+        (e.g. from hedged requests). Without enough data the fastest model
+        tier is used, skipping models whose recent requests mostly failed.
+        """
+        tracker = self.operation_latency.get(operation, self.latency_tracker)
+        healthy = [m for m in AVAILABLE_MODELS if tracker.is_healthy(m)]
+        measured = [
+            (tracker.quantile(m, 0.5), m)
+            for m in healthy
+            if tracker.count(m) >= self.auto_min_samples
+        ]
+        if measured:
+            return min(measured)[1]
+        for model_name in FAST_MODELS + AVAILABLE_MODELS:
+            if model_name in healthy:
+                return model_name
+        return FAST_MODELS[0]
+
+    def _tracker(self, profile: Optional[GenerationProfile]) -> LatencyTracker:
+        """Get the telemetry tracker for a profile's operation."""
+        if profile is None or profile.name not in self.operation_latency:
+            return self.latency_tracker
+        return self.operation_latency[profile.name]
+
+    def model_stats(self, operation: str = "command") -> Dict[str, Dict[str, Optional[float]]]:
+        """
+        Get latency and failure telemetry per model for an operation.
+
+        Args:
+            operation: Profile name, e.g. "command" or "script".
+
+        Returns:
+            Model name -> LatencyTracker.summary() for every available model.
+        """
+        tracker = self.operation_latency[operation]
+        return {model_name: tracker.summary(model_name) for model_name in AVAILABLE_MODELS}
 
     def set_model(self, model_name: str) -> None:
         """
-        Change the Gemini model.
+        Change the model.
+
+        Cached commands are keyed on the model name, so entries generated by
+        the previous model are no longer returned.
 
         Args:
-            model_name: Name of the model to use.
+            model_name: Name of the model to use, or AUTO_MODEL to pick the
+                fastest healthy model per operation.
         """
+        if model_name != AUTO_MODEL:
+            self.backend.warm([model_name])
         self.model_name = model_name
-        self.model = genai.GenerativeModel(model_name)
 
     async def generate_command(
         self,
         user_input: str,
         working_directory: str,
         shell_type: str,
-        custom_instructions: str = ""
+        custom_instructions: str = "",
+        candidates: int = 1
     ) -> GeneratedCommand:
         """
         Generate shell command from natural language input.
@@ -54,58 +1244,472 @@ class GeminiClient:
             user_input: User's natural language description (1-500 chars).
             working_directory: Current working directory.
             shell_type: Shell type (bash/zsh/sh/fish).
+            custom_instructions: Optional custom instructions from user.
+            candidates: Number of alternative commands to request in the same
+                API call (1-MAX_CANDIDATES).
 
         Returns:
-            GeneratedCommand with the generated command.
+            GeneratedCommand with the best ranked command. Other candidates,
+            ranked, are in its alternatives list.
 
         Raises:
             ValueError: If input is invalid.
             APIError: If API call fails.
             RateLimitError: If API rate limit exceeded.
+            CircuitOpenError: If the API is failing and no history entry matches.
+
+        Note:
+            While the circuit breaker is open, the best matching history entry
+            is returned instead (with from_history set).
         """
         if not user_input or len(user_input) > 10000:
             raise ValueError("user_input must be 1-10000 characters")
+        if not 1 <= candidates <= MAX_CANDIDATES:
+            raise ValueError(f"candidates must be 1-{MAX_CANDIDATES}")
 
-        prompt = self._build_generation_prompt(user_input, working_directory, shell_type, custom_instructions)
+        profile = self.profiles["candidates" if candidates > 1 else "command"]
+        model_name = self._model_for(profile)
+        model_key = model_name if candidates == 1 else f"{model_name}#{candidates}"
+        cache_key = ResponseCache.make_key(
+            user_input, working_directory, shell_type, custom_instructions, model_key
+        )
+        cached = self.response_cache.get(cache_key)
+        if cached is not None:
+            # Re-rank, since history use counts may have changed
+            return self._rank_candidates(cached.split("\n"), shell_type)
+
+        prompt = self._build_generation_prompt(
+            fit_to_budget(user_input, profile.max_input_chars),
+            working_directory,
+            shell_type,
+            fit_to_budget(custom_instructions, profile.max_instructions_chars),
+            candidates
+        )
 
         try:
-            # Run synchronous API call in thread executor to avoid blocking event loop
-            loop = asyncio.get_event_loop()
-            response = await loop.run_in_executor(
-                None,
-                lambda: self.model.generate_content(prompt)
-            )
-            command = self._parse_command_response(response.text)
+            if candidates > 1:
+                text = await self._generate_text(prompt, profile)
+                commands = self._parse_candidates_response(text, candidates)
+            else:
+                async with self._guarded():
+                    try:
+                        command = await asyncio.wait_for(
+                            self._generate_first_line(prompt, model_name, profile),
+                            timeout=self.request_deadline
+                        )
+                    except asyncio.TimeoutError:
+                        self.latency_tracker.record_error(model_name, timeout=True)
+                        raise
+                commands = [command]
+            generated = self._rank_candidates(commands, shell_type)
+
+        except CircuitOpenError:
+            fallback = self._history_fallback(user_input, shell_type)
+            if fallback is not None:
+                logger.warning(f"Circuit open, using history entry: {fallback.command}")
+                return fallback
+            raise
+        except Exception as e:
+            self._raise_api_error(e, "generate command")
+
+        self.response_cache.put(cache_key, "\n".join(commands))
+        return generated
+
+    def _rank_candidates(self, commands: List[str], shell_type: Optional[str] = None) -> GeneratedCommand:
+        """
+        Rank candidate commands locally.
+
+        Prefers lower risk, then commands used often from history, then
+        shorter commands, then the model's own order.
+
+        Returns:
+            Best GeneratedCommand, with the others in its alternatives list.
+
+        Raises:
+            ValueError: If there are no commands.
+        """
+        if not commands:
+            raise ValueError("command cannot be empty")
+
+        risk_order = {RiskLevel.SAFE: 0, RiskLevel.WARNING: 1, RiskLevel.DANGEROUS: 2}
+        ranked = []
+        for index, command in enumerate(commands):
+            generated = self._make_command(command, shell_type)
+            use_count = 0
+            if self.history_manager is not None:
+                entry = self.history_manager.get_by_command(command)
+                if entry is not None:
+                    use_count = entry.use_count
+            key = (risk_order[generated.risk_level], -use_count, len(command), index)
+            ranked.append((key, generated))
+
+        ranked.sort(key=lambda item: item[0])
+        best = ranked[0][1]
+        best.alternatives = [generated for _, generated in ranked[1:]]
+        return best
+
+    def _parse_candidates_response(self, response_text: str, count: int) -> List[str]:
+        """Parse up to `count` distinct commands, one per line."""
+        commands: List[str] = []
+        for line in response_text.strip().split("\n"):
+            if line.strip().startswith("```"):
+                continue
+            # Remove list numbering/bullets and inline backticks
+            command = CANDIDATE_PREFIX_PATTERN.sub("", line).strip().strip("`").strip()
+            if command and command not in commands:
+                commands.append(command)
+            if len(commands) == count:
+                break
+        return commands
+
+    def _make_command(self, command: str, shell_type: Optional[str] = None) -> GeneratedCommand:
+        """Build a GeneratedCommand with a fresh risk analysis."""
+        risk_result = self.risk_detector.analyze(command, shell_type)
+
+        return GeneratedCommand(
+            command=command,
+            request_id="",  # Will be set by caller
+            risk_level=risk_result.level,
+            risk_reasons=risk_result.reasons
+        )
+
+    def _history_fallback(self, user_input: str, shell_type: Optional[str] = None) -> Optional[GeneratedCommand]:
+        """
+        Find the history entry that best matches a request.
+
+        Tries the whole request first, then ranks entries by how many of the
+        request's words they contain, breaking ties by use_count.
+        """
+        if self.history_manager is None:
+            return None
+
+        matches = self.history_manager.search(user_input)
+        if matches:
+            entry = matches[0]
+        else:
+            scores: Dict[str, int] = {}
+            entries: Dict[str, CommandHistory] = {}
+            for word in set(user_input.split()):
+                if len(word) < 2:
+                    continue
+                for match in self.history_manager.search(word):
+                    scores[match.id] = scores.get(match.id, 0) + 1
+                    entries[match.id] = match
+            if not scores:
+                return None
+            best_id = max(scores, key=lambda i: (scores[i], entries[i].use_count))
+            entry = entries[best_id]
 
-            # Analyze risk
-            risk_result = self.risk_detector.analyze(command)
+        generated = self._make_command(entry.command, shell_type)
+        generated.from_history = True
+        return generated
 
-            return GeneratedCommand(
-                command=command,
-                request_id="",  # Will be set by caller
-                risk_level=risk_result.level,
-                risk_reasons=risk_result.reasons
+    @asynccontextmanager
+    async def _guarded(self) -> AsyncIterator[None]:
+        """
+        Run an API operation through the circuit breaker.
+
+        Raises:
+            CircuitOpenError: If the circuit is open.
+        """
+        breaker = self.circuit_breaker
+        if not breaker.allow_request():
+            raise CircuitOpenError(
+                f"API is unavailable, retrying in {breaker.retry_after():.0f}s"
             )
 
+        try:
+            yield
+        except asyncio.CancelledError:
+            if asyncio.current_task() in self._prefetch_tasks.values():
+                # Speculative work dropped on purpose, says nothing about the API
+                breaker.release()
+            else:
+                # Cancelled by the caller's timeout
+                breaker.record_failure()
+            raise
         except Exception as e:
-            error_msg = str(e).lower()
-            if "quota" in error_msg or "rate" in error_msg or "limit" in error_msg:
-                raise RateLimitError(f"API rate limit exceeded: {e}")
-            raise APIError(f"Failed to generate command: {e}")
+            if isinstance(e, APIError):
+                # Raised locally (e.g. rate limit shedding), the API was not reached
+                breaker.release()
+            elif classify_error(e) == ErrorKind.FATAL:
+                # The API answered, the request itself was bad
+                breaker.record_success()
+            else:
+                breaker.record_failure()
+            raise
+        except BaseException:
+            breaker.release()
+            raise
+        else:
+            breaker.record_success()
+
+    def _raise_api_error(self, error: Exception, action: str) -> NoReturn:
+        """Re-raise an API failure as RateLimitError or APIError."""
+        if isinstance(error, APIError):
+            raise error
+        if isinstance(error, asyncio.TimeoutError):
+            raise APIError(f"Failed to {action}: request timed out")
+        if classify_error(error) == ErrorKind.RATE_LIMIT:
+            raise RateLimitError(f"API rate limit exceeded: {error}")
+        raise APIError(f"Failed to {action}: {error}")
+
+    def _retry_delay(self, attempt: int, deadline: float) -> Optional[float]:
+        """
+        Get the jittered backoff before retry number `attempt`.
+
+        Returns:
+            Delay in seconds, or None if no retry fits before the deadline.
+        """
+        if attempt >= self.max_attempts:
+            return None
+        delay = random.uniform(0, min(self.retry_max_delay, self.retry_base_delay * 2 ** attempt))
+        if time.monotonic() + delay >= deadline:
+            return None
+        return delay
+
+    async def _generate_with_retry(
+        self,
+        model_name: str,
+        prompt: str,
+        profile: Optional[GenerationProfile] = None
+    ) -> str:
+        """Run a rate-limited generation request, retrying transient failures."""
+        tracker = self._tracker(profile)
+        deadline = time.monotonic() + self.request_deadline
+        attempt = 0
+        while True:
+            attempt += 1
+            await self.rate_limiter.acquire(model_name, deadline)
+            start = time.monotonic()
+            try:
+                text = await self.transport.generate(self.backend, model_name, prompt, profile)
+                tracker.record(model_name, time.monotonic() - start)
+                return text
+            except Exception as e:
+                delay = None
+                if classify_error(e) != ErrorKind.FATAL:
+                    tracker.record_error(model_name, timeout=is_timeout(e))
+                    delay = self._retry_delay(attempt, deadline)
+                if delay is None:
+                    raise
+                logger.debug(f"Retrying {model_name} request in {delay:.2f}s: {e}")
+                await asyncio.sleep(delay)
+
+    async def _stream_with_retry(
+        self,
+        model_name: str,
+        prompt: str,
+        profile: Optional[GenerationProfile] = None
+    ) -> AsyncIterator[str]:
+        """
+        Run a rate-limited streaming request, retrying transient failures.
+
+        A request is only retried if it failed before producing any output.
+        The time to the first chunk is recorded as the request latency.
+        """
+        tracker = self._tracker(profile)
+        deadline = time.monotonic() + self.request_deadline
+        attempt = 0
+        while True:
+            attempt += 1
+            await self.rate_limiter.acquire(model_name, deadline)
+            start = time.monotonic()
+            chunks = self.transport.stream(self.backend, model_name, prompt, profile)
+            received = False
+            try:
+                async for chunk in chunks:
+                    if not received:
+                        received = True
+                        tracker.record(model_name, time.monotonic() - start)
+                    yield chunk
+                return
+            except Exception as e:
+                delay = None
+                if classify_error(e) != ErrorKind.FATAL:
+                    tracker.record_error(model_name, timeout=is_timeout(e))
+                    if not received:
+                        delay = self._retry_delay(attempt, deadline)
+                if delay is None:
+                    raise
+                logger.debug(f"Retrying {model_name} stream in {delay:.2f}s: {e}")
+            finally:
+                await chunks.aclose()
+            await asyncio.sleep(delay)
+
+    async def _read_lines(
+        self,
+        prompt: str,
+        model_name: str,
+        profile: Optional[GenerationProfile] = None
+    ) -> AsyncIterator[str]:
+        """
+        Yield complete response lines as they arrive.
+
+        Markdown code fence lines (```bash, ```) are dropped on the fly.
+        """
+        chunks = self._stream_with_retry(model_name, prompt, profile)
+        buffer = ""
+        try:
+            async for chunk in chunks:
+                buffer += chunk
+                while "\n" in buffer:
+                    line, buffer = buffer.split("\n", 1)
+                    if not line.strip().startswith("```"):
+                        yield line
+            if buffer and not buffer.strip().startswith("```"):
+                yield buffer
+        finally:
+            await chunks.aclose()
+
+    def _stream_lines(
+        self,
+        prompt: str,
+        model_name: Optional[str] = None,
+        profile: Optional[GenerationProfile] = None
+    ) -> AsyncIterator[str]:
+        """Stream response lines, sharing the request with identical in-flight prompts."""
+        model_name = model_name or self._model_for(profile)
+        return self.single_flight.stream(
+            ("stream", model_name, prompt, profile),
+            lambda: self._read_lines(prompt, model_name, profile)
+        )
+
+    async def _stream_first_line(
+        self,
+        prompt: str,
+        model_name: Optional[str] = None,
+        profile: Optional[GenerationProfile] = None
+    ) -> str:
+        """Return the first non-empty command line, cancelling the rest of the stream."""
+        lines = self._stream_lines(prompt, model_name, profile)
+        try:
+            async for line in lines:
+                # Remove inline backticks
+                command = line.strip().strip("`").strip()
+                if command:
+                    return command
+        finally:
+            await lines.aclose()
+        return ""
+
+    def _select_hedge_model(self, primary_name: str) -> Optional[str]:
+        """Pick the backup model: the fastest observed, else the first lite model."""
+        candidates = [m for m in AVAILABLE_MODELS if m != primary_name]
+        if self.hedge_model:
+            return self.hedge_model if self.hedge_model != primary_name else None
+
+        observed = [
+            (self.latency_tracker.quantile(m, 0.5), m)
+            for m in candidates
+            if self.latency_tracker.count(m) >= self.hedge_min_samples
+        ]
+        primary_median = self.latency_tracker.quantile(primary_name, 0.5)
+        if observed:
+            median, model_name = min(observed)
+            if primary_median is None or median < primary_median:
+                return model_name
+
+        for model_name in FAST_MODELS:
+            if model_name != primary_name:
+                return model_name
+        return None
+
+    def _hedge_delay(self, primary_name: str) -> float:
+        """Delay before hedging: a quantile of the primary model's recent latencies."""
+        if self.latency_tracker.count(primary_name) < self.hedge_min_samples:
+            return self.hedge_default_delay
+        delay = self.latency_tracker.quantile(primary_name, self.hedge_quantile)
+        return max(self.hedge_min_delay, delay)
+
+    async def _generate_first_line(
+        self,
+        prompt: str,
+        primary_name: Optional[str] = None,
+        profile: Optional[GenerationProfile] = None
+    ) -> str:
+        """
+        Generate a command line, hedging to a backup model if enabled.
+
+        When the primary model has not answered within the hedge delay, the
+        same prompt is sent to a faster model and whichever succeeds first
+        wins. The other request is cancelled.
+        """
+        primary_name = primary_name or self._model_for(profile)
+        if not self.hedging:
+            return await self._stream_first_line(prompt, primary_name, profile)
+        # Only requests that could be hedged count towards the hedge rate
+        self.hedge_requests += 1
+
+        start = time.monotonic()
+        primary = asyncio.ensure_future(self._stream_first_line(prompt, primary_name, profile))
+        backup: Optional[asyncio.Future] = None
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=self._hedge_delay(primary_name))
+            backup_name = self._select_hedge_model(primary_name)
+            if done or backup_name is None:
+                return await primary
+
+            logger.debug(f"Hedging {primary_name} request to {backup_name}")
+            self.hedged += 1
+            backup = asyncio.ensure_future(self._stream_first_line(prompt, backup_name, profile))
+            pending = {primary, backup}
+            failure: Optional[asyncio.Future] = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                # A successful result wins over a failure finishing at the same time
+                for task in done:
+                    # Check cancelled() first: exception() raises for a cancelled task
+                    if task.cancelled() or task.exception() is not None:
+                        # Re-raised if both attempts fail; an error over a cancellation
+                        if failure is None or failure.cancelled():
+                            failure = task
+                        continue
+                    if task is backup:
+                        self.hedge_wins += 1
+                        self.hedge_saved_seconds += self.latency_tracker.expected_excess(
+                            primary_name, time.monotonic() - start
+                        )
+                    return task.result()
+            return failure.result()
+        finally:
+            for task in (primary, backup):
+                if task is not None and not task.done():
+                    task.cancel()
+
+    def hedge_stats(self) -> Dict[str, float]:
+        """Get hedging counters, rates and estimated latency saved."""
+        requests = self.hedge_requests
+        return {
+            "requests": requests,
+            "hedged": self.hedged,
+            "backup_wins": self.hedge_wins,
+            "hedge_rate": self.hedged / requests if requests else 0.0,
+            "win_rate": self.hedge_wins / self.hedged if self.hedged else 0.0,
+            "saved_seconds": self.hedge_saved_seconds
+        }
 
     def _build_generation_prompt(
         self,
         user_input: str,
         working_directory: str,
         shell_type: str,
-        custom_instructions: str = ""
+        custom_instructions: str = "",
+        candidates: int = 1
     ) -> str:
         """Build the prompt for command generation."""
         instructions_section = ""
         if custom_instructions:
             instructions_section = f"\nUser Instructions: {custom_instructions}\n"
 
-        return f"""You are a shell command expert. Generate a single shell command based on the user's request.
+        if candidates > 1:
+            task = f"Generate {candidates} different alternative shell commands"
+            output_rule = f"Return ONLY {candidates} shell commands, one per line, most likely first"
+        else:
+            task = "Generate a single shell command"
+            output_rule = "Return ONLY the shell command, nothing else"
+
+        return f"""You are a shell command expert. {task} based on the user's request.
 
 Context:
 - Operating System: Linux
@@ -115,7 +1719,7 @@ Context:
 User Request: {user_input}
 
 Rules:
-1. Return ONLY the shell command, nothing else
+1. {output_rule}
 2. No explanations, no markdown, no code blocks
 3. Command must be valid for Linux {shell_type}
 4. If the request is unclear, generate the most likely intended command
@@ -124,33 +1728,19 @@ Rules:
 
 Command:"""
 
-    async def generate_script(
+    def _build_script_prompt(
         self,
         user_input: str,
         working_directory: str,
         shell_type: str,
         custom_instructions: str = ""
     ) -> str:
-        """
-        Generate a bash script from natural language.
-
-        Args:
-            user_input: Natural language description of the script.
-            working_directory: Current working directory.
-            shell_type: Type of shell (bash, zsh, etc.)
-            custom_instructions: Optional custom instructions from user.
-
-        Returns:
-            Generated bash script as string.
-        """
-        if not user_input or len(user_input) > 50000:
-            raise ValueError("user_input must be 1-50000 characters")
-
+        """Build the prompt for script generation."""
         instructions_section = ""
         if custom_instructions:
             instructions_section = f"\nUser Instructions: {custom_instructions}\n"
 
-        prompt = f"""You are a bash script expert. Generate a complete bash script based on the user's request.
+        return f"""You are a bash script expert. Generate a complete bash script based on the user's request.
 
 Context:
 - Operating System: Linux
@@ -170,51 +1760,81 @@ Rules:
 
 Script:"""
 
-        try:
-            loop = asyncio.get_event_loop()
-            response = await loop.run_in_executor(
-                None,
-                lambda: self.model.generate_content(prompt)
-            )
-            return self._parse_script_response(response.text)
+    async def stream_script(
+        self,
+        user_input: str,
+        working_directory: str,
+        shell_type: str,
+        custom_instructions: str = ""
+    ) -> AsyncIterator[str]:
+        """
+        Generate a bash script from natural language, line by line.
 
-        except Exception as e:
-            error_msg = str(e).lower()
-            if "quota" in error_msg or "rate" in error_msg or "limit" in error_msg:
-                raise RateLimitError(f"API rate limit exceeded: {e}")
-            raise APIError(f"Failed to generate script: {e}")
-
-    def _parse_script_response(self, response_text: str) -> str:
-        """Parse and clean the script response."""
-        script = response_text.strip()
-        # Remove markdown code blocks if present
-        if script.startswith("```"):
-            lines = script.split("\n")
-            # Remove first line (```bash) and last line (```)
-            if lines[-1].strip() == "```":
-                lines = lines[1:-1]
-            else:
-                lines = lines[1:]
-            script = "\n".join(lines)
-        return script.strip()
+        Args:
+            user_input: Natural language description of the script.
+            working_directory: Current working directory.
+            shell_type: Type of shell (bash, zsh, etc.)
+            custom_instructions: Optional custom instructions from user.
+
+        Yields:
+            Script lines as soon as each one is complete.
 
-    def _parse_command_response(self, response_text: str) -> str:
-        """Parse and clean the API response."""
-        # Remove any markdown code blocks
-        command = response_text.strip()
-        if command.startswith("```"):
-            lines = command.split("\n")
-            # Remove first and last lines (```bash and ```)
-            command = "\n".join(lines[1:-1] if len(lines) > 2 else lines)
+        Raises:
+            ValueError: If input is invalid.
+            APIError: If API call fails.
+            RateLimitError: If API rate limit exceeded.
+        """
+        if not user_input or len(user_input) > 50000:
+            raise ValueError("user_input must be 1-50000 characters")
 
-        # Remove backticks
-        command = command.strip("`").strip()
+        profile = self.profiles["script"]
+        prompt = self._build_script_prompt(
+            fit_to_budget(user_input, profile.max_input_chars),
+            working_directory,
+            shell_type,
+            fit_to_budget(custom_instructions, profile.max_instructions_chars)
+        )
+        lines = self._stream_lines(prompt, self._model_for(profile), profile)
+        started = False
 
-        # Take only the first line if multiple lines
-        if "\n" in command:
-            command = command.split("\n")[0].strip()
+        try:
+            async with self._guarded():
+                async for line in lines:
+                    # Skip leading blank lines
+                    if not started and not line.strip():
+                        continue
+                    started = True
+                    yield line.rstrip()
+        except Exception as e:
+            self._raise_api_error(e, "generate script")
+        finally:
+            await lines.aclose()
 
-        return command
+    async def generate_script(
+        self,
+        user_input: str,
+        working_directory: str,
+        shell_type: str,
+        custom_instructions: str = ""
+    ) -> str:
+        """
+        Generate a bash script from natural language.
+
+        Args:
+            user_input: Natural language description of the script.
+            working_directory: Current working directory.
+            shell_type: Type of shell (bash, zsh, etc.)
+            custom_instructions: Optional custom instructions from user.
+
+        Returns:
+            Generated bash script as string.
+        """
+        lines = [
+            line async for line in self.stream_script(
+                user_input, working_directory, shell_type, custom_instructions
+            )
+        ]
+        return "\n".join(lines).strip()
 
     async def explain_command(self, command: str) -> str:
         """
@@ -228,10 +1848,17 @@ Script:"""
 
         Raises:
             APIError: If API call fails.
+            RateLimitError: If API rate limit exceeded.
         """
+        cache_key = ResponseCache.make_explanation_key(command)
+        cached = self.explanation_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+        profile = self.profiles["explain"]
         prompt = f"""Explain this shell command in detail:
 
-Command: {command}
+Command: {fit_to_budget(command, profile.max_input_chars)}
 
 Provide:
 1. Overall purpose of the command
@@ -242,12 +1869,268 @@ Provide:
 Keep the explanation concise but informative. Use simple language."""
 
         try:
-            # Run synchronous API call in thread executor to avoid blocking event loop
-            loop = asyncio.get_event_loop()
-            response = await loop.run_in_executor(
-                None,
-                lambda: self.model.generate_content(prompt)
-            )
-            return response.text.strip()
+            text = await self._generate_text(prompt, profile)
         except Exception as e:
-            raise APIError(f"Failed to explain command: {e}")
+            self._raise_api_error(e, "explain command")
+
+        explanation = text.strip()
+        if explanation:
+            self.explanation_cache.put(cache_key, explanation)
+        return explanation
+
+    def _can_prefetch(self) -> bool:
+        """Check whether background work would not compete with interactive requests."""
+        if self.circuit_breaker.state != CircuitState.CLOSED:
+            return False
+        transport = self.transport.stats()
+        if transport["queued"] > 0 or transport["in_flight"] >= transport["max_in_flight"] - 1:
+            return False
+        model_name = self._model_for(self.profiles["explain"])
+        return self.rate_limiter.has_headroom(model_name, self.prefetch_reserve)
+
+    def prefetch_explanation(self, command: str) -> bool:
+        """
+        Start explaining a command in the background before it is requested.
+
+        The prefetch only starts when the breaker is closed, a transport slot
+        is free and the rate limiter has spare capacity, so it never delays
+        an interactive request. A later explain_command() call for the same
+        command joins the in-flight request or reads the cached result.
+
+        Args:
+            command: Shell command to explain.
+
+        Returns:
+            True if a prefetch is running for the command.
+        """
+        if command in self._prefetch_tasks:
+            return True
+        if ResponseCache.make_explanation_key(command) in self.explanation_cache:
+            return False
+        if not self._can_prefetch():
+            self.prefetch_skipped += 1
+            return False
+
+        task = asyncio.ensure_future(self._prefetch(command))
+        self._prefetch_tasks[command] = task
+        task.add_done_callback(lambda _: self._prefetch_tasks.pop(command, None))
+        self.prefetch_started += 1
+        return True
+
+    async def _prefetch(self, command: str) -> None:
+        """Explain a command, logging instead of raising failures."""
+        try:
+            await self.explain_command(command)
+        except APIError as e:
+            self.prefetch_failed += 1
+            logger.debug(f"Explanation prefetch failed for {command!r}: {e}")
+
+    def cancel_prefetch(self, keep: Optional[str] = None) -> None:
+        """
+        Cancel background explanation requests.
+
+        Args:
+            keep: Command whose prefetch should keep running.
+        """
+        for command, task in list(self._prefetch_tasks.items()):
+            if command != keep:
+                task.cancel()
+
+    async def precompute_explanations(self, commands: List[str], limit: int = 10) -> int:
+        """
+        Explain commands one at a time while the client is otherwise idle.
+
+        Stops at the first command that cannot be prefetched right now, so
+        it can simply be called again on the next idle period.
+
+        Args:
+            commands: Commands to explain, most important first.
+            limit: Maximum number of requests to send.
+
+        Returns:
+            Number of explanations fetched.
+        """
+        fetched = 0
+        for command in commands:
+            if fetched >= limit:
+                break
+            if ResponseCache.make_explanation_key(command) in self.explanation_cache:
+                continue
+            if not self.prefetch_explanation(command):
+                break
+            task = self._prefetch_tasks.get(command)
+            if task is not None:
+                await task
+            fetched += 1
+        return fetched
+
+    def prefetch_stats(self) -> Dict[str, int]:
+        """Get speculative explanation counters."""
+        return {
+            "started": self.prefetch_started,
+            "skipped": self.prefetch_skipped,
+            "failed": self.prefetch_failed,
+            "in_flight": len(self._prefetch_tasks),
+            "cache_hits": self.explanation_cache.hits
+        }
+
+    async def _generate_text(self, prompt: str, profile: Optional[GenerationProfile] = None) -> str:
+        """Run a non-streaming request through single-flight, the breaker and the deadline."""
+        model_name = self._model_for(profile)
+        async with self._guarded():
+            try:
+                return await asyncio.wait_for(
+                    self.single_flight.run(
+                        ("generate", model_name, prompt, profile),
+                        lambda: self._generate_with_retry(model_name, prompt, profile)
+                    ),
+                    timeout=self.request_deadline
+                )
+            except asyncio.TimeoutError:
+                self._tracker(profile).record_error(model_name, timeout=True)
+                raise
+
+    async def generate_commands_batch(
+        self,
+        requests: List[str],
+        working_directory: str,
+        shell_type: str,
+        custom_instructions: str = ""
+    ) -> List[Union[GeneratedCommand, Exception]]:
+        """
+        Generate shell commands for several requests in one API call.
+
+        Args:
+            requests: Natural language descriptions (1-20 items, 1-10000 chars each).
+            working_directory: Current working directory.
+            shell_type: Shell type (bash/zsh/sh/fish).
+            custom_instructions: Optional custom instructions from user.
+
+        Returns:
+            One result per request, in order: a GeneratedCommand, or an
+            APIError if the response had no usable command for that item.
+
+        Raises:
+            ValueError: If input is invalid.
+            APIError: If API call fails or the response cannot be parsed.
+            RateLimitError: If API rate limit exceeded.
+        """
+        if not requests or len(requests) > MAX_BATCH_SIZE:
+            raise ValueError(f"requests must contain 1-{MAX_BATCH_SIZE} items")
+        for user_input in requests:
+            if not user_input or len(user_input) > 10000:
+                raise ValueError("each request must be 1-10000 characters")
+
+        profile = self.profiles["batch"]
+        model_name = self._model_for(profile)
+        results: List[Union[GeneratedCommand, Exception, None]] = [None] * len(requests)
+        cache_keys = [
+            ResponseCache.make_key(
+                user_input, working_directory, shell_type, custom_instructions, model_name
+            )
+            for user_input in requests
+        ]
+
+        # Only send requests that are not cached
+        pending = []
+        for i, cache_key in enumerate(cache_keys):
+            cached = self.response_cache.get(cache_key)
+            if cached is not None:
+                results[i] = self._make_command(cached, shell_type)
+            else:
+                pending.append(i)
+
+        if pending:
+            prompt = self._build_batch_prompt(
+                [fit_to_budget(requests[i], profile.max_input_chars) for i in pending],
+                working_directory,
+                shell_type,
+                fit_to_budget(custom_instructions, profile.max_instructions_chars)
+            )
+            # The profile's output cap is per request
+            batch_profile = replace(
+                profile, max_output_tokens=profile.max_output_tokens * len(pending)
+            )
+            try:
+                text = await self._generate_text(prompt, batch_profile)
+                commands = self._parse_batch_response(text, len(pending))
+            except Exception as e:
+                self._raise_api_error(e, "generate commands")
+
+            for i, command in zip(pending, commands):
+                if not command:
+                    results[i] = APIError(f"No command returned for request {i + 1}")
+                    continue
+                results[i] = self._make_command(command, shell_type)
+                self.response_cache.put(cache_keys[i], command)
+
+        return results
+
+    def _build_batch_prompt(
+        self,
+        requests: List[str],
+        working_directory: str,
+        shell_type: str,
+        custom_instructions: str = ""
+    ) -> str:
+        """Build the prompt for batch command generation."""
+        instructions_section = ""
+        if custom_instructions:
+            instructions_section = f"\nUser Instructions: {custom_instructions}\n"
+
+        numbered = "\n".join(f"{i}. {request}" for i, request in enumerate(requests, 1))
+
+        return f"""You are a shell command expert. Generate one shell command for each of the user's requests.
+
+Context:
+- Operating System: Linux
+- Shell: {shell_type}
+- Current Directory: {working_directory}
+{instructions_section}
+User Requests:
+{numbered}
+
+Rules:
+1. Return ONLY a JSON array of {len(requests)} strings, one command per request, in the same order
+2. No explanations, no markdown, no code blocks
+3. Each command must be a single line valid for Linux {shell_type}
+4. If a request is unclear, generate the most likely intended command
+5. Prefer common, well-known commands over obscure ones
+6. Follow user instructions if provided
+
+JSON:"""
+
+    def _parse_batch_response(self, response_text: str, count: int) -> List[Optional[str]]:
+        """
+        Parse a JSON array of commands.
+
+        Returns:
+            `count` cleaned commands; None for missing or invalid items.
+
+        Raises:
+            APIError: If the response contains no JSON array.
+        """
+        text = "\n".join(
+            line for line in response_text.strip().split("\n")
+            if not line.strip().startswith("```")
+        )
+        start = text.find("[")
+        end = text.rfind("]")
+        try:
+            if start == -1 or end < start:
+                raise ValueError("no JSON array found")
+            data = json.loads(text[start:end + 1])
+            if not isinstance(data, list):
+                raise ValueError("response is not a JSON array")
+        except ValueError as e:
+            raise APIError(f"Invalid batch response: {e}")
+
+        commands: List[Optional[str]] = []
+        for i in range(count):
+            item = data[i] if i < len(data) else None
+            if not isinstance(item, str):
+                commands.append(None)
+                continue
+            command = item.strip().strip("`").strip()
+            commands.append(command.split("\n")[0].strip() or None)
+        return commands
@@ -0,0 +1,530 @@
+"""Append-only journal for command history mutations, shared between processes."""
+
+import fcntl
+import json
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import IO, Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger("iterm2-ai-generator")
+
+# Snapshots start with their version and generation, in this order
+_SNAPSHOT_GENERATION = re.compile(rb'^\{"version":"[^"]*","generation":(\d+)')
+
+
+def write_atomic(path: Path, data: Dict[str, Any]) -> None:
+    """
+    Write JSON to a file so readers see either the old or the new content.
+
+    Args:
+        path: Destination file.
+        data: JSON-serializable data.
+    """
+    temp_path = path.with_name(path.name + ".tmp")
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+
+
+def read_generation(path: Path) -> int:
+    """
+    Read a snapshot's generation without parsing the whole file.
+
+    Args:
+        path: Snapshot written by write_atomic() with "version" and
+            "generation" as its first keys.
+
+    Returns:
+        The generation; 0 for a missing snapshot or one written before
+        snapshots had generations.
+    """
+    try:
+        with open(path, "rb") as f:
+            head = f.read(128)
+    except OSError:
+        return 0
+    match = _SNAPSHOT_GENERATION.match(head)
+    return int(match.group(1)) if match else 0
+
+
+def read_records(path: Path) -> Iterator[Dict[str, Any]]:
+    """
+    Read journal records in order.
+
+    A torn last line (from a crash mid-write) is skipped.
+
+    Args:
+        path: Journal file.
+
+    Yields:
+        Records as dicts.
+    """
+    if not path.exists():
+        return
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                logger.warning(f"Skipping corrupt history journal record {path}:{line_number}")
+                continue
+            if isinstance(record, dict):
+                yield record
+
+
+def _parse_records(data: bytes, path: Path) -> List[Dict[str, Any]]:
+    """Parse complete journal lines, skipping corrupt ones."""
+    records = []
+    for line in data.decode("utf-8", errors="replace").splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            logger.warning(f"Skipping corrupt history journal record in {path}")
+            continue
+        if isinstance(record, dict):
+            records.append(record)
+    return records
+
+
+def _header_generation(line: bytes) -> Optional[int]:
+    """Get the generation from a journal's first line, None if it is no header."""
+    if not line.endswith(b"\n"):
+        return None
+    try:
+        record = json.loads(line)
+    except ValueError:
+        return None
+    if isinstance(record, dict) and record.get("op") == "header":
+        return int(record.get("generation", 0))
+    return None
+
+
+class HistoryJournal:
+    """
+    Append-only log of history mutations, one JSON record per line.
+
+    append() only queues a record. A writer thread writes queued records
+    debounce seconds after the first of them (at once when max_pending are
+    queued), so a burst of changes costs one write and one fsync and the
+    caller never waits for the disk. sync() and close() write whatever is
+    still queued.
+
+    Every process using the same history appends to the same journal,
+    holding an flock on a lock file next to it. The journal starts with a
+    header naming the snapshot generation it applies to. compact() folds
+    the snapshot and journal on disk, including other processes' records,
+    into the next generation and starts a new journal; a journal older than
+    the snapshot was already folded and is skipped. Each record is applied
+    exactly once, so records may be increments.
+
+    changes() picks up what other processes appended by reading the journal
+    past the offset read so far; when nothing changed it costs one stat(),
+    at most every check_interval seconds.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        snapshot_path: Path,
+        debounce: float = 0.2,
+        max_pending: int = 64,
+        compact_after: int = 500,
+        check_interval: float = 0.05
+    ):
+        """
+        Initialize HistoryJournal.
+
+        Args:
+            path: Journal file (created on first write).
+            snapshot_path: Snapshot the journal applies to.
+            debounce: Seconds a queued record waits for more to write with it.
+            max_pending: Queued records that are written without waiting.
+            compact_after: Records after which should_compact() is True.
+            check_interval: Seconds changes() waits before looking again.
+        """
+        self.path = Path(path)
+        self.snapshot_path = Path(snapshot_path)
+        self.lock_path = self.path.with_suffix(".lock")
+        self.debounce = debounce
+        self.max_pending = max_pending
+        self.compact_after = compact_after
+        self.check_interval = check_interval
+        self._checked = 0.0
+        # Tags this process's records, which changes() skips
+        self.instance = uuid.uuid4().hex[:12]
+        # Generation of the snapshot the records read so far apply to
+        self.generation = 0
+        # Records in the current journal file and queue
+        self.record_count = 0
+        # The journal being read; kept open so a compaction that replaces
+        # it cannot hide the records appended since the last read
+        self._reader: Optional[IO[bytes]] = None
+        self._reader_inode: Optional[int] = None
+        self._offset = 0
+        # False if the journal was already folded into the snapshot
+        self._following = False
+        self._lock_file: Optional[IO[str]] = None
+        # Records are serialized by the writer, off the caller's thread
+        self._pending: List[Dict[str, Any]] = []
+        self._closing = False
+        self._writer: Optional[threading.Thread] = None
+        self._compaction: Optional[threading.Thread] = None
+        # Guards the queue; the writer waits on it for records
+        self._lock = threading.Lock()
+        self._wake = threading.Condition(self._lock)
+        # Held with the file lock, which does not exclude this process's threads
+        self._io_lock = threading.Lock()
+
+    @contextmanager
+    def _locked(self, exclusive: bool = True, blocking: bool = True) -> Iterator[bool]:
+        """
+        Lock the journal against this process's other threads and other processes.
+
+        Args:
+            exclusive: Lock for writing rather than reading.
+            blocking: Wait for the lock.
+
+        Yields:
+            Whether the lock was acquired; always True if blocking.
+        """
+        if not self._io_lock.acquire(blocking):
+            yield False
+            return
+        try:
+            if self._lock_file is None:
+                self._lock_file = open(self.lock_path, "a")
+            flags = fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH
+            if not blocking:
+                flags |= fcntl.LOCK_NB
+            try:
+                fcntl.flock(self._lock_file.fileno(), flags)
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_UN)
+        finally:
+            self._io_lock.release()
+
+    def load(
+        self,
+        read_snapshot: Callable[[], int],
+        apply: Callable[[Dict[str, Any]], None]
+    ) -> List[Dict[str, Any]]:
+        """
+        Read the snapshot, then apply the journal records on top of it.
+
+        Args:
+            read_snapshot: Loads the snapshot and returns its generation.
+            apply: Called with each record in order.
+
+        Returns:
+            Records queued but not written yet, to apply after the rest.
+        """
+        with self._locked():
+            generation = read_snapshot()
+            journal_generation = self._open_reader()
+            records = self._read_new() if self._reader is not None else []
+            self._following = journal_generation is not None and journal_generation >= generation
+            if self._following:
+                self.generation = journal_generation
+                for record in records:
+                    apply(record)
+            else:
+                self.generation = generation
+                records = []
+            with self._lock:
+                self.record_count = len(records) + len(self._pending)
+                return list(self._pending)
+
+    def _open_reader(self) -> Optional[int]:
+        """Start reading the journal after its header; returns its generation, None without one."""
+        if self._reader is not None:
+            self._reader.close()
+            self._reader = None
+        try:
+            reader = open(self.path, "rb")
+        except FileNotFoundError:
+            self._reader_inode = None
+            self._offset = 0
+            return None
+        generation = _header_generation(reader.readline())
+        self._reader = reader
+        self._reader_inode = os.fstat(reader.fileno()).st_ino
+        self._offset = reader.tell()
+        return generation
+
+    def _read_new(self) -> List[Dict[str, Any]]:
+        """Read the complete records past the offset read so far."""
+        data = self._reader.read()
+        end = data.rfind(b"\n") + 1
+        self._offset += end
+        self._reader.seek(self._offset)
+        return _parse_records(data[:end], self.path)
+
+    def changes(self) -> Optional[Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]]:
+        """
+        Get the records other processes appended since the last call.
+
+        This process's records were applied when they were made, so they
+        are not returned. Those now in the journal after another process's
+        records, and those still queued, were applied before them but
+        take effect after them: if they do not commute, reload.
+
+        Returns:
+            Other processes' records in order, and this process's records
+            that follow them. None if the journal was replaced in a way the
+            records read so far cannot be continued from (e.g. compacted
+            twice since the last call); reload the history then.
+        """
+        now = time.monotonic()
+        if now - self._checked < self.check_interval or self._io_lock.locked():
+            # Checked just now, or this process is writing or compacting and
+            # stat() may wait for its fsync
+            return [], []
+        self._checked = now
+        try:
+            stat = os.stat(self.path)
+            inode: Optional[int] = stat.st_ino
+            size = stat.st_size
+        except FileNotFoundError:
+            inode, size = None, self._offset
+        if inode == self._reader_inode and size == self._offset:
+            return [], []
+
+        with self._locked(exclusive=False, blocking=False) as locked:
+            if not locked:
+                # Being written or compacted; catch up on the next call
+                return [], []
+            appended = []
+            if self._reader is not None:
+                appended = self._read_new()
+                if not self._following:
+                    appended = []
+            replaced = False
+            try:
+                replaced = os.stat(self.path).st_ino != self._reader_inode
+            except FileNotFoundError:
+                pass
+            if replaced:
+                # A compaction continues the journal read so far; a journal
+                # that was not followed is only ever replaced by its repair
+                expected = self.generation + 1 if self._following else self.generation
+                generation = self._open_reader()
+                if generation != expected:
+                    return None
+                self.generation = generation
+                self._following = True
+                started = self._read_new()
+                appended.extend(started)
+                with self._lock:
+                    self.record_count = len(started) + len(self._pending)
+
+            records = []
+            reordered = []
+            for record in appended:
+                if record.get("src") != self.instance:
+                    records.append(record)
+                elif records:
+                    reordered.append(record)
+            with self._lock:
+                if not replaced:
+                    self.record_count += len(records)
+                if records:
+                    reordered.extend(self._pending)
+            return records, reordered
+
+    @property
+    def is_compacting(self) -> bool:
+        """Whether a background compaction is running."""
+        return self._compaction is not None and self._compaction.is_alive()
+
+    def append(self, record: Dict[str, Any]) -> None:
+        """
+        Queue one record for the writer thread.
+
+        Args:
+            record: JSON-serializable mutation, e.g. {"op": "delete", "id": ...}.
+                Tagged with this process's instance; must not be modified afterwards.
+        """
+        record["src"] = self.instance
+        with self._wake:
+            self._pending.append(record)
+            self.record_count += 1
+            if self._writer is None:
+                self._writer = threading.Thread(
+                    target=self._run_writer, name="history-writer", daemon=True
+                )
+                self._writer.start()
+            self._wake.notify()
+
+    def _run_writer(self) -> None:
+        """Write queued records in debounced batches until close()."""
+        while True:
+            with self._wake:
+                while not self._pending and not self._closing:
+                    self._wake.wait()
+                if self._closing:
+                    # close() writes the rest
+                    return
+                deadline = time.monotonic() + self.debounce
+                while len(self._pending) < self.max_pending and not self._closing:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._wake.wait(remaining)
+            self._write_pending()
+
+    def _write_pending(self) -> None:
+        """Write and fsync queued records."""
+        with self._locked():
+            self._write_locked()
+
+    def _write_locked(self) -> None:
+        """Write and fsync queued records while holding the lock."""
+        with self._lock:
+            records, self._pending = self._pending, []
+        if not records:
+            return
+        data = "".join(
+            json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n"
+            for record in records
+        ).encode("utf-8")
+        try:
+            self._prepare_journal()
+            with open(self.path, "ab") as f:
+                start = f.seek(0, os.SEEK_END)
+                f.write(data)
+                f.flush()
+                if (self._following and start == self._offset
+                        and os.fstat(f.fileno()).st_ino == self._reader_inode):
+                    # Nothing else to read before these; skip re-reading them
+                    self._offset += len(data)
+                    self._reader.seek(self._offset)
+                os.fsync(f.fileno())
+        except OSError as e:
+            # The history in memory is intact, but this process's next
+            # compaction folds only what is on disk
+            logger.error(f"Failed to write {len(records)} history journal records: {e}")
+
+    def _prepare_journal(self) -> None:
+        """Make sure the journal applies to the current snapshot and ends a line."""
+        generation = read_generation(self.snapshot_path)
+        try:
+            with open(self.path, "rb") as f:
+                journal_generation = _header_generation(f.readline())
+                size = f.seek(0, os.SEEK_END)
+                torn = False
+                if size:
+                    f.seek(size - 1)
+                    torn = f.read(1) != b"\n"
+        except FileNotFoundError:
+            self._start_journal(generation)
+            return
+        if journal_generation is None or journal_generation < generation:
+            # A compaction stopped after writing the snapshot, or the header is damaged
+            self._start_journal(generation)
+        elif torn:
+            # A writer crashed mid-record; keep the next record on its own line
+            with open(self.path, "ab") as f:
+                f.write(b"\n")
+
+    def _start_journal(self, generation: int) -> None:
+        """Atomically replace the journal with an empty one for a snapshot generation."""
+        temp_path = self.path.with_name(self.path.name + ".tmp")
+        with open(temp_path, "wb") as f:
+            f.write(json.dumps({"op": "header", "generation": generation}).encode("utf-8") + b"\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.path)
+
+    def sync(self) -> None:
+        """Write and fsync queued records now."""
+        self._write_pending()
+
+    def should_compact(self) -> bool:
+        """Whether the journal is long enough to fold into a snapshot."""
+        return self.record_count >= self.compact_after and not self.is_compacting
+
+    def compact(
+        self,
+        fold: Callable[[List[Dict[str, Any]], int], None],
+        background: bool = True
+    ) -> None:
+        """
+        Fold the journal on disk into the next snapshot generation.
+
+        The lock is held throughout, so records other processes append
+        meanwhile go to the new journal.
+
+        Args:
+            fold: Called with the records to fold and the new generation;
+                applies the records to the snapshot and writes it atomically.
+            background: Fold on a background thread.
+        """
+        if self.is_compacting:
+            return
+
+        def run() -> None:
+            started = time.monotonic()
+            with self._locked():
+                self._write_locked()
+                generation = read_generation(self.snapshot_path)
+                records: List[Dict[str, Any]] = []
+                journal = list(read_records(self.path))
+                if journal and journal[0].get("op") == "header":
+                    journal_generation = int(journal.pop(0).get("generation", 0))
+                    if self._following and journal_generation > self.generation:
+                        # Another process compacted the journal this one counted
+                        return
+                    if journal_generation >= generation:
+                        records = journal
+                try:
+                    fold(records, generation + 1)
+                    self._start_journal(generation + 1)
+                except OSError as e:
+                    # Either the old snapshot and journal are intact, or the
+                    # new snapshot is and the old journal is skipped as folded
+                    logger.error(f"History compaction failed: {e}")
+                    return
+                with self._lock:
+                    self.record_count = len(self._pending)
+            logger.debug(f"History compacted in {time.monotonic() - started:.3f}s")
+
+        if background:
+            self._compaction = threading.Thread(target=run, name="history-compaction", daemon=True)
+            self._compaction.start()
+        else:
+            run()
+
+    def close(self) -> None:
+        """Write queued records and wait for the writer and a running compaction."""
+        with self._wake:
+            writer = self._writer
+            self._closing = True
+            self._wake.notify()
+        if writer is not None:
+            writer.join()
+        self._write_pending()
+        with self._wake:
+            # A later append() starts a new writer
+            self._closing = False
+            self._writer = None
+        if self._compaction is not None:
+            self._compaction.join()
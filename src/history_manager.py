@@ -1,25 +1,189 @@
 """Command history management for iTerm2 AI Command Generator."""
 
+import heapq
+import itertools
 import json
 import os
-from datetime import datetime
+from collections import OrderedDict
+from operator import attrgetter
 from pathlib import Path
-from typing import List, Optional
-
-from models import CommandHistory
+from typing import Any, Dict, List, Optional, Tuple
+
+from history_journal import HistoryJournal, write_atomic
+from history_search import HistorySearchIndex
+from models import CommandHistory, epoch_now, epoch_seconds
+
+
+def _to_entry(data: Any) -> CommandHistory:
+    """Create an entry from its row (see CommandHistory.to_row()) or, in older files, dict form."""
+    if isinstance(data, list):
+        return CommandHistory(*data)
+    return CommandHistory.from_dict(data)
+
+
+def _record_command(record: Dict[str, Any]) -> Optional[str]:
+    """Get the command a journal record changes; None if it may change any."""
+    if record.get("op") == "put":
+        entry = record.get("entry")
+        if isinstance(entry, list):
+            return entry[1] if len(entry) > 1 else None
+        return entry.get("command") if isinstance(entry, dict) else None
+    if record.get("op") in ("use", "delete"):
+        return record.get("command")
+    return None
+
+
+class HistoryState:
+    """
+    History entries and how journal records change them.
+
+    HistoryManager adds its lookup indexes on top; compaction uses this
+    alone to fold the history files on disk.
+    """
+
+    def __init__(self):
+        """Initialize an empty HistoryState."""
+        # Entries by id, least recently used first
+        self._entries: "OrderedDict[str, CommandHistory]" = OrderedDict()
+        self._by_command: Dict[str, CommandHistory] = {}
+
+    def _read_snapshot(self, path: str) -> int:
+        """Load the entries of a history file; returns its generation."""
+        if not os.path.exists(path):
+            return 0
+        try:
+            with open(path, 'r') as f:
+                data = json.load(f)
+                self._load_entries([_to_entry(cmd) for cmd in data.get("commands", [])])
+                return int(data.get("generation", 0))
+        except (json.JSONDecodeError, IOError, KeyError, TypeError, ValueError):
+            self._reset()
+            return 0
+
+    def _snapshot(self, generation: int) -> Dict[str, Any]:
+        """Get the entries as history file data, one row per entry."""
+        return {
+            "version": "2.0",
+            "generation": generation,
+            "commands": [cmd.to_row() for cmd in self._entries.values()]
+        }
 
+    def _apply_record(self, record: Dict[str, Any]) -> None:
+        """Apply one journal record to the history."""
+        op = record.get("op")
+        try:
+            if op == "put":
+                self._put(_to_entry(record["entry"]))
+            elif op == "use":
+                entry = self._find(record)
+                if entry is None:
+                    # Deleted meanwhile, e.g. by another process
+                    return
+                entry.use_count += 1
+                entry.last_used_ts = max(entry.last_used_ts, epoch_seconds(record["last_used"]))
+                alias = record.get("alias")
+                alias_added = bool(alias) and not entry.alias
+                if alias_added:
+                    entry.alias = alias
+                self._touch(entry, alias_added)
+            elif op == "delete":
+                entry = self._find(record)
+                if entry is not None:
+                    self._unindex(entry)
+            elif op == "clear":
+                self._reset()
+        except (KeyError, TypeError, ValueError):
+            pass
+
+    def _find(self, record: Dict[str, Any]) -> Optional[CommandHistory]:
+        """Find the entry a use or delete record refers to."""
+        entry = self._entries.get(record["id"])
+        if entry is None and "created_at" in record:
+            # Merged into an older entry for the same command, see _put()
+            same = self._by_command.get(record.get("command"))
+            if same is not None and same.created_at_ts <= epoch_seconds(record["created_at"]):
+                entry = same
+        return entry
 
-class HistoryManager:
+    def _put(self, entry: CommandHistory) -> None:
+        """Add or replace an entry, merging it with another one for the same command."""
+        old = self._entries.get(entry.id)
+        if old is not None:
+            self._unindex(old)
+            self._index(entry)
+            return
+        same = self._by_command.get(entry.command)
+        if same is None:
+            self._index(entry)
+            return
+        # Two processes added the command at once: every process keeps the
+        # older entry and counts the uses of both
+        if (same.created_at_ts, same.id) > (entry.created_at_ts, entry.id):
+            self._unindex(same)
+            same, entry = entry, same
+            self._index(same)
+        same.use_count += entry.use_count
+        same.last_used_ts = max(same.last_used_ts, entry.last_used_ts)
+        alias_added = bool(entry.alias) and not same.alias
+        if alias_added:
+            same.alias = entry.alias
+        self._touch(same, alias_added)
+
+    def _load_entries(self, entries: List[CommandHistory]) -> None:
+        """Fill the empty history with the entries of a history file, least recently used first."""
+        self._entries = OrderedDict((entry.id, entry) for entry in entries)
+        self._by_command = {entry.command: entry for entry in entries}
+
+    def _reset(self) -> None:
+        """Drop all entries."""
+        self._entries = OrderedDict()
+        self._by_command = {}
+
+    def _index(self, entry: CommandHistory) -> None:
+        """Add an entry as the most recently used one."""
+        self._entries[entry.id] = entry
+        self._by_command[entry.command] = entry
+
+    def _unindex(self, entry: CommandHistory) -> None:
+        """Remove an entry."""
+        del self._entries[entry.id]
+        if self._by_command.get(entry.command) is entry:
+            del self._by_command[entry.command]
+
+    def _touch(self, entry: CommandHistory, alias_added: bool) -> None:
+        """Make an entry whose use_count or last_used changed the most recently used one."""
+        self._entries.move_to_end(entry.id)
+
+
+class HistoryManager(HistoryState):
     """Manages command history storage and retrieval."""
 
-    def __init__(self, storage_path: Optional[str] = None, max_items: int = 50):
+    def __init__(
+        self,
+        storage_path: Optional[str] = None,
+        max_items: int = 50,
+        compact_after: int = 500
+    ):
         """
         Initialize HistoryManager.
 
+        Changes are kept in memory and appended to a journal next to the
+        history file (history.journal) by a background writer, then folded
+        into the history file in the background every compact_after
+        changes. Call close() before exiting to write pending changes.
+
+        Several processes may share the same history: each one picks up
+        the others' changes from the journal before reading or changing it.
+
+        The history file is read on first access rather than here, so
+        creating a HistoryManager stays cheap however long the history is.
+
         Args:
             storage_path: Path to history file. Defaults to ~/.config/iterm2-ai-generator/history.json
             max_items: Maximum number of history items to keep.
+            compact_after: Journal records that trigger a compaction.
         """
+        super().__init__()
         if storage_path is None:
             config_dir = Path.home() / ".config" / "iterm2-ai-generator"
             config_dir.mkdir(parents=True, exist_ok=True)
@@ -27,29 +191,181 @@ class HistoryManager:
 
         self.storage_path = storage_path
         self.max_items = max_items
-        self._history: List[CommandHistory] = self._load_history()
+        self.journal = HistoryJournal(
+            Path(storage_path).with_suffix(".journal"), Path(storage_path),
+            compact_after=compact_after
+        )
+        # Entries by alias, then id, oldest first
+        self._by_alias: Dict[str, Dict[str, CommandHistory]] = {}
+        # Min-heap of (use_count, last_used_ts, seq, id); entries whose use_count or
+        # last_used changed since they were pushed are stale and skipped. Built
+        # when an entry is first evicted, then kept up to date
+        self._eviction: Optional[List[Tuple[int, float, int, str]]] = None
+        self._seq = itertools.count()
+        # Built by the first search_ranked() call, then kept up to date
+        self._search_index: Optional[HistorySearchIndex] = None
+        # Set when another process's change left _entries out of last_used order
+        self._unordered = False
+        self._loaded = False
+
+    def _load_history(self) -> None:
+        """Load the history file, then replay the journal on top of it."""
+        self._reset()
+        pending = self.journal.load(
+            lambda: self._read_snapshot(self.storage_path), self._apply_record
+        )
+        for record in pending:
+            self._apply_record(record)
+        self._loaded = True
 
-    def _load_history(self) -> List[CommandHistory]:
-        """Load history from file."""
-        if not os.path.exists(self.storage_path):
-            return []
+    def _sync(self) -> None:
+        """
+        Apply the changes other processes made since the last call.
 
-        try:
-            with open(self.storage_path, 'r') as f:
-                data = json.load(f)
-                commands = data.get("commands", [])
-                return [CommandHistory.from_dict(cmd) for cmd in commands]
-        except (json.JSONDecodeError, IOError, KeyError):
-            return []
-
-    def _save_history(self) -> None:
-        """Save history to file."""
-        data = {
-            "version": "1.0",
-            "commands": [cmd.to_dict() for cmd in self._history]
-        }
-        with open(self.storage_path, 'w') as f:
-            json.dump(data, f, indent=2, ensure_ascii=False)
+        On first access this loads the history instead.
+        """
+        if not self._loaded:
+            self._load_history()
+            if self.journal.should_compact():
+                self._compact()
+            return
+        changes = self.journal.changes()
+        if changes is None:
+            self._load_history()
+            return
+        records, reordered = changes
+        if reordered:
+            # Changes to different commands commute; otherwise this
+            # process's changes must be redone after the others'
+            mine = {_record_command(record) for record in reordered}
+            theirs = {_record_command(record) for record in records}
+            if None in mine or None in theirs or not mine.isdisjoint(theirs):
+                self._load_history()
+                return
+        for record in records:
+            self._apply_record(record)
+
+    def _reset(self) -> None:
+        """Drop all entries and indexes."""
+        super()._reset()
+        self._by_alias = {}
+        self._unordered = False
+        self._eviction = None
+        if self._search_index is not None:
+            self._search_index.clear()
+
+    def _load_entries(self, entries: List[CommandHistory]) -> None:
+        """Fill the empty history with the entries of a history file, sorted by last_used."""
+        entries.sort(key=attrgetter("last_used_ts"))
+        super()._load_entries(entries)
+        for entry in entries:
+            if entry.alias:
+                self._by_alias.setdefault(entry.alias, {})[entry.id] = entry
+        if self._search_index is not None:
+            for entry in entries:
+                self._search_index.add(entry)
+
+    def _index(self, entry: CommandHistory) -> None:
+        """Add an entry as the most recently used one."""
+        self._check_order(entry)
+        super()._index(entry)
+        if entry.alias:
+            self._by_alias.setdefault(entry.alias, {})[entry.id] = entry
+        self._push_eviction(entry)
+        if self._search_index is not None:
+            self._search_index.add(entry)
+
+    def _unindex(self, entry: CommandHistory) -> None:
+        """Remove an entry; its eviction heap item goes stale."""
+        super()._unindex(entry)
+        if entry.alias:
+            aliased = self._by_alias.get(entry.alias)
+            if aliased is not None:
+                aliased.pop(entry.id, None)
+                if not aliased:
+                    del self._by_alias[entry.alias]
+        if self._search_index is not None:
+            self._search_index.remove(entry.id)
+
+    def _touch(self, entry: CommandHistory, alias_added: bool) -> None:
+        """Reindex an entry whose use_count, last_used or alias changed."""
+        if alias_added:
+            self._by_alias.setdefault(entry.alias, {})[entry.id] = entry
+        self._check_order(entry)
+        super()._touch(entry, alias_added)
+        self._push_eviction(entry)
+        if self._search_index is not None:
+            self._search_index.add(entry)
+
+    def _check_order(self, entry: CommandHistory) -> None:
+        """Note if making an entry the most recently used one breaks last_used order."""
+        if self._entries and not self._unordered:
+            newest = self._entries[next(reversed(self._entries))]
+            if entry.last_used_ts < newest.last_used_ts:
+                self._unordered = True
+
+    def _push_eviction(self, entry: CommandHistory) -> None:
+        """Queue an entry for eviction at its current use_count and last_used."""
+        if self._eviction is None:
+            return
+        heapq.heappush(self._eviction, (entry.use_count, entry.last_used_ts, next(self._seq), entry.id))
+        # Bound the stale items left behind by updates and deletes
+        if len(self._eviction) > 2 * len(self._entries) + 64:
+            self._rebuild_eviction()
+
+    def _rebuild_eviction(self) -> None:
+        """Rebuild the eviction heap from the live entries."""
+        self._eviction = [
+            (entry.use_count, entry.last_used_ts, next(self._seq), entry.id)
+            for entry in self._entries.values()
+        ]
+        heapq.heapify(self._eviction)
+
+    def _sort_entries(self) -> None:
+        """Order entries by last_used."""
+        self._entries = OrderedDict(
+            (entry.id, entry) for entry in sorted(self._entries.values(), key=attrgetter("last_used_ts"))
+        )
+        self._unordered = False
+
+    def _recent_first(self) -> List[CommandHistory]:
+        """Get entries sorted by last_used, most recent first."""
+        if self._unordered:
+            self._sort_entries()
+        return list(reversed(self._entries.values()))
+
+    def _record(self, record: Dict[str, Any]) -> None:
+        """Append a change to the journal, compacting when it grows long."""
+        self.journal.append(record)
+        if self.journal.should_compact():
+            self._compact()
+
+    def _record_delete(self, entry: CommandHistory) -> None:
+        """Journal the deletion of an entry."""
+        self._record({
+            "op": "delete",
+            "id": entry.id,
+            "command": entry.command,
+            "created_at": entry.created_at_ts
+        })
+
+    def _compact(self, background: bool = True) -> None:
+        """Fold the journal into the history file and start a new journal."""
+        path = self.storage_path
+
+        def fold(records: List[Dict[str, Any]], generation: int) -> None:
+            # From the files, which hold every process's changes
+            state = HistoryState()
+            state._read_snapshot(path)
+            for record in records:
+                state._apply_record(record)
+            write_atomic(Path(path), state._snapshot(generation))
+
+        self.journal.compact(fold, background)
+
+    def close(self) -> None:
+        """Write pending changes to disk and wait for a running compaction."""
+        self.journal.close()
 
     def add(
         self,
@@ -72,14 +388,21 @@ class HistoryManager:
             If the same command exists, updates use_count instead of adding duplicate.
             Enforces max_items limit by removing least used old items.
         """
+        self._sync()
         # Check if command already exists
         existing = self._find_by_command(command)
         if existing:
-            existing.use_count += 1
-            existing.last_used = datetime.now()
-            if alias and not existing.alias:
-                existing.alias = alias
-            self._save_history()
+            # An increment, so uses from several processes add up
+            record = {
+                "op": "use",
+                "id": existing.id,
+                "command": command,
+                "created_at": existing.created_at_ts,
+                "last_used": epoch_now(),
+                "alias": alias
+            }
+            self._apply_record(record)
+            self._record(record)
             return existing
 
         # Create new entry
@@ -89,29 +412,31 @@ class HistoryManager:
             alias=alias
         )
 
-        self._history.append(entry)
+        self._index(entry)
+        self._record({"op": "put", "entry": entry.to_row()})
 
         # Enforce max items limit
-        if len(self._history) > self.max_items:
+        if len(self._entries) > self.max_items:
             self._remove_least_used()
 
-        self._save_history()
         return entry
 
     def _find_by_command(self, command: str) -> Optional[CommandHistory]:
         """Find history entry by command string."""
-        for entry in self._history:
-            if entry.command == command:
-                return entry
-        return None
+        return self._by_command.get(command)
 
     def _remove_least_used(self) -> None:
         """Remove least used old items to maintain max_items limit."""
-        # Sort by use_count (ascending) then by last_used (ascending)
-        self._history.sort(key=lambda x: (x.use_count, x.last_used))
-        # Remove excess items from the beginning (least used/oldest)
-        while len(self._history) > self.max_items:
-            self._history.pop(0)
+        if self._eviction is None:
+            self._rebuild_eviction()
+        # Pop by use_count (ascending) then by last_used (ascending), skipping stale items
+        while len(self._entries) > self.max_items and self._eviction:
+            use_count, last_used, _, id = heapq.heappop(self._eviction)
+            entry = self._entries.get(id)
+            if entry is None or entry.use_count != use_count or entry.last_used_ts != last_used:
+                continue
+            self._unindex(entry)
+            self._record_delete(entry)
 
     def get_all(self) -> List[CommandHistory]:
         """
@@ -120,11 +445,21 @@ class HistoryManager:
         Returns:
             List of CommandHistory sorted by last_used (most recent first).
         """
-        return sorted(
-            self._history,
-            key=lambda x: x.last_used,
-            reverse=True
-        )
+        self._sync()
+        return self._recent_first()
+
+    def get_by_command(self, command: str) -> Optional[CommandHistory]:
+        """
+        Get history entry by command string.
+
+        Args:
+            command: Exact command to search for.
+
+        Returns:
+            CommandHistory or None if not found.
+        """
+        self._sync()
+        return self._find_by_command(command)
 
     def get_by_alias(self, alias: str) -> Optional[CommandHistory]:
         """
@@ -136,10 +471,11 @@ class HistoryManager:
         Returns:
             CommandHistory or None if not found.
         """
-        for entry in self._history:
-            if entry.alias == alias:
-                return entry
-        return None
+        self._sync()
+        aliased = self._by_alias.get(alias)
+        if not aliased:
+            return None
+        return next(iter(aliased.values()))
 
     def search(self, query: str) -> List[CommandHistory]:
         """
@@ -151,16 +487,34 @@ class HistoryManager:
         Returns:
             List of matching CommandHistory entries.
         """
+        self._sync()
         query_lower = query.lower()
         results = []
 
-        for entry in self._history:
+        for entry in self._recent_first():
             if (query_lower in entry.prompt.lower() or
                 query_lower in entry.command.lower() or
                 (entry.alias and query_lower in entry.alias.lower())):
                 results.append(entry)
 
-        return sorted(results, key=lambda x: x.last_used, reverse=True)
+        return results
+
+    def search_ranked(self, query: str, limit: int = 10) -> List[CommandHistory]:
+        """
+        Search history by prompt, command or alias, tolerating typos.
+
+        Args:
+            query: Search query string.
+            limit: Maximum number of results.
+
+        Returns:
+            Best matches first, ranked by similarity, then by how often
+            and how recently each entry was used.
+        """
+        self._sync()
+        if self._search_index is None:
+            self._search_index = HistorySearchIndex(self._entries.values())
+        return self._search_index.search(query, limit)
 
     def delete(self, id: str) -> bool:
         """
@@ -172,18 +526,21 @@ class HistoryManager:
         Returns:
             True if entry was found and deleted.
         """
-        for i, entry in enumerate(self._history):
-            if entry.id == id:
-                self._history.pop(i)
-                self._save_history()
-                return True
-        return False
+        self._sync()
+        entry = self._entries.get(id)
+        if entry is None:
+            return False
+        self._unindex(entry)
+        self._record_delete(entry)
+        return True
 
     def clear(self) -> None:
         """Clear all history entries."""
-        self._history = []
-        self._save_history()
+        self._sync()
+        self._reset()
+        self._record({"op": "clear"})
 
     def get_count(self) -> int:
         """Get total number of history entries."""
-        return len(self._history)
+        self._sync()
+        return len(self._entries)
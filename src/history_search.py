@@ -0,0 +1,372 @@
+"""Trigram index for ranked, typo-tolerant command history search."""
+
+import bisect
+import heapq
+import itertools
+import math
+import time
+from typing import Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+
+from models import CommandHistory
+
+# Share of the query's trigrams an entry must contain to match.
+# One typo in a word removes up to three of its trigrams.
+MIN_SIMILARITY = 0.4
+# Added to the similarity of entries that contain the query verbatim
+SUBSTRING_BONUS = 0.5
+# Seconds after which a use counts half as much
+FRECENCY_HALF_LIFE = 7 * 24 * 3600
+
+
+def trigrams(text: str) -> Set[str]:
+    """
+    Get the trigrams of lowercased text.
+
+    The text is padded with a space on both sides so one- and two-letter
+    words (e.g. "ls") still produce trigrams.
+
+    Args:
+        text: Text to split.
+
+    Returns:
+        Set of three-character strings.
+    """
+    padded = f" {text.lower()} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def entry_trigrams(entry: CommandHistory) -> FrozenSet[str]:
+    """Get the trigrams of an entry's prompt, command and alias."""
+    grams = trigrams(entry.prompt) | trigrams(entry.command)
+    if entry.alias:
+        grams |= trigrams(entry.alias)
+    return frozenset(grams)
+
+
+def _entry_text(entry: CommandHistory) -> str:
+    """Lowercased prompt, command and alias, for verbatim matching."""
+    return f"{entry.prompt}\n{entry.command}\n{entry.alias or ''}".lower()
+
+
+def frecency_key(entry: CommandHistory) -> float:
+    """
+    Get a time-independent key that orders entries by frecency.
+
+    Decay scales every entry by the same factor as time passes, so the
+    order of these keys is the order of frecency at any later time.
+
+    Args:
+        entry: History entry.
+
+    Returns:
+        log2 of the entry's frecency at Unix time 0.
+    """
+    return math.log2(max(entry.use_count, 1)) + entry.last_used_ts / FRECENCY_HALF_LIFE
+
+
+def frecency(entry: CommandHistory, now: float) -> float:
+    """
+    Weigh how often and how recently an entry was used.
+
+    Args:
+        entry: History entry.
+        now: Current time as a Unix timestamp.
+
+    Returns:
+        use_count halved for every FRECENCY_HALF_LIFE since last use.
+    """
+    return 2.0 ** (frecency_key(entry) - now / FRECENCY_HALF_LIFE)
+
+
+def _score(similarity: float, entry_frecency: float) -> float:
+    """Rank by similarity to the query, then by frecency."""
+    # Squared so similarity outweighs frecency, which is log-damped
+    return similarity * similarity * (1.0 + math.log1p(entry_frecency))
+
+
+def match_trigrams(query: str, entry_counts: Dict[str, int]) -> List[str]:
+    """
+    Get trigrams of a query at least one of which every match contains.
+
+    A match shares at least MIN_SIMILARITY of the query's trigrams, so at
+    least one of the rarest ones that fall outside that share.
+
+    Args:
+        query: Search query.
+        entry_counts: Number of entries containing each trigram; missing
+            trigrams are in none.
+
+    Returns:
+        The query's rarest trigrams, rarest first.
+    """
+    grams = sorted(trigrams(query.strip()), key=lambda gram: entry_counts.get(gram, 0))
+    needed = max(1, math.ceil(MIN_SIMILARITY * len(grams)))
+    return grams[:len(grams) - needed + 1]
+
+
+def rank_frecent(
+    query: str,
+    entries: Iterable[CommandHistory],
+    limit: int = 10,
+    now: Optional[float] = None
+) -> List[CommandHistory]:
+    """
+    Rank candidate entries visited from the most to the least frecent.
+
+    Returns the same entries as HistorySearchIndex.search() would, but
+    stops reading `entries` once even a verbatim match with every query
+    trigram could not beat the results found so far.
+
+    Args:
+        query: Search query.
+        entries: Candidates in descending frecency_key() order, e.g.
+            streamed from a database.
+        limit: Maximum number of results.
+        now: Current Unix time. Defaults to time.time().
+
+    Returns:
+        Best matches first. An empty query ranks by frecency alone.
+    """
+    if limit <= 0:
+        return []
+    query_lower = query.strip().lower()
+    if not query_lower:
+        return list(itertools.islice(entries, limit))
+    now_key = (time.time() if now is None else now) / FRECENCY_HALF_LIFE
+
+    query_grams = trigrams(query_lower)
+    total = len(query_grams)
+    needed = max(1, math.ceil(MIN_SIMILARITY * total))
+    top = 1.0 + SUBSTRING_BONUS
+    # Min-heap of the best (score, id, entry) so far
+    best: List[Tuple[float, str, CommandHistory]] = []
+    stop = -math.inf
+    for entry in entries:
+        key = frecency_key(entry)
+        if key <= stop:
+            break
+        shared = len(query_grams & entry_trigrams(entry))
+        if shared < needed:
+            continue
+        similarity = shared / total
+        if query_lower in _entry_text(entry):
+            similarity += SUBSTRING_BONUS
+        item = (_score(similarity, 2.0 ** (key - now_key)), entry.id, entry)
+        if len(best) < limit:
+            heapq.heappush(best, item)
+        elif item[:2] > best[0][:2]:
+            heapq.heapreplace(best, item)
+        else:
+            continue
+        if len(best) == limit:
+            # Largest frecency key at which a perfect match scores at most best[0]
+            room = math.expm1(best[0][0] / (top * top) - 1.0)
+            stop = now_key + math.log2(room) if room > 0 else -math.inf
+    return [entry for _, _, entry in sorted(best, key=lambda item: item[:2], reverse=True)]
+
+
+class HistorySearchIndex:
+    """
+    Inverted trigram index over history entries.
+
+    Entries are added, replaced and removed one at a time as the history
+    changes. A query first scores the entries of its rarest trigrams; every
+    other entry lacks those, which caps its similarity. The rest are then
+    visited from the most to the least frecent, stopping once even the best
+    possible match could not beat the results found so far.
+    """
+
+    # Entries scored before the frecency scan
+    DIRECT_SCORE_LIMIT = 256
+
+    def __init__(self, entries: Iterable[CommandHistory] = ()):
+        """
+        Initialize HistorySearchIndex.
+
+        Args:
+            entries: Entries to index.
+        """
+        self._postings: Dict[str, Set[str]] = {}
+        self._grams: Dict[str, FrozenSet[str]] = {}
+        self._text: Dict[str, str] = {}
+        self._entries: Dict[str, CommandHistory] = {}
+        self._keys: Dict[str, float] = {}
+        # (frecency_key, id), ascending
+        self._order: List[Tuple[float, str]] = []
+        for entry in entries:
+            self._index_text(entry)
+            self._keys[entry.id] = frecency_key(entry)
+        self._order = sorted((key, entry_id) for entry_id, key in self._keys.items())
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def add(self, entry: CommandHistory) -> None:
+        """
+        Index an entry, replacing an indexed entry with the same id.
+
+        Call again whenever the entry changes, including its use_count
+        and last_used.
+
+        Args:
+            entry: Entry to index.
+        """
+        if entry.id in self._entries:
+            if self._text[entry.id] == _entry_text(entry):
+                # Only frecency changed
+                self._entries[entry.id] = entry
+                self._unorder(entry.id)
+                self._reorder(entry)
+                return
+            self.remove(entry.id)
+        self._index_text(entry)
+        self._reorder(entry)
+
+    def _index_text(self, entry: CommandHistory) -> None:
+        """Add an entry's trigrams to the postings."""
+        grams = entry_trigrams(entry)
+        self._entries[entry.id] = entry
+        self._grams[entry.id] = grams
+        self._text[entry.id] = _entry_text(entry)
+        for gram in grams:
+            posting = self._postings.get(gram)
+            if posting is None:
+                self._postings[gram] = {entry.id}
+            else:
+                posting.add(entry.id)
+
+    def _reorder(self, entry: CommandHistory) -> None:
+        """Insert an entry into the frecency order."""
+        key = frecency_key(entry)
+        self._keys[entry.id] = key
+        bisect.insort(self._order, (key, entry.id))
+
+    def _unorder(self, entry_id: str) -> None:
+        """Remove an entry from the frecency order."""
+        key = self._keys.pop(entry_id, None)
+        if key is None:
+            return
+        i = bisect.bisect_left(self._order, (key, entry_id))
+        if i < len(self._order) and self._order[i] == (key, entry_id):
+            del self._order[i]
+
+    def remove(self, entry_id: str) -> None:
+        """
+        Remove an entry from the index.
+
+        Args:
+            entry_id: Id of the entry. Unknown ids are ignored.
+        """
+        self._unorder(entry_id)
+        self._entries.pop(entry_id, None)
+        self._text.pop(entry_id, None)
+        for gram in self._grams.pop(entry_id, ()):
+            posting = self._postings[gram]
+            posting.discard(entry_id)
+            if not posting:
+                del self._postings[gram]
+
+    def clear(self) -> None:
+        """Remove all entries."""
+        self._postings.clear()
+        self._grams.clear()
+        self._text.clear()
+        self._entries.clear()
+        self._keys.clear()
+        self._order = []
+
+    def search(self, query: str, limit: int = 10, now: Optional[float] = None) -> List[CommandHistory]:
+        """
+        Find the entries that best match a query, tolerating typos.
+
+        Args:
+            query: Search query.
+            limit: Maximum number of results.
+            now: Current Unix time. Defaults to time.time().
+
+        Returns:
+            Best matches first. An empty query ranks all entries by frecency.
+        """
+        if limit <= 0:
+            return []
+        now_key = (time.time() if now is None else now) / FRECENCY_HALF_LIFE
+        query_lower = query.strip().lower()
+        if not query_lower:
+            return [self._entries[entry_id] for _, entry_id in reversed(self._order[-limit:])]
+
+        empty: Set[str] = set()
+        grams = sorted(trigrams(query_lower), key=lambda gram: len(self._postings.get(gram, empty)))
+        postings = [self._postings.get(gram, empty) for gram in grams]
+        total = len(postings)
+        needed = max(1, math.ceil(MIN_SIMILARITY * total))
+
+        # Min-heap of the best (score, id) so far
+        best: List[Tuple[float, str]] = []
+
+        def consider(entry_id: str, key: float) -> bool:
+            """Score a candidate; True if it entered the results."""
+            shared = 0
+            for posting in postings:
+                if entry_id in posting:
+                    shared += 1
+            if shared < needed:
+                return False
+            similarity = shared / total
+            if query_lower in self._text[entry_id]:
+                similarity += SUBSTRING_BONUS
+            item = (_score(similarity, 2.0 ** (key - now_key)), entry_id)
+            if len(best) < limit:
+                heapq.heappush(best, item)
+            elif item > best[0]:
+                heapq.heapreplace(best, item)
+            else:
+                return False
+            return True
+
+        # Score the entries of the rarest postings that fit the budget.
+        # Every other entry lacks those `rare` trigrams.
+        rare = 0
+        size = 0
+        while rare < total and size + len(postings[rare]) <= self.DIRECT_SCORE_LIMIT:
+            size += len(postings[rare])
+            rare += 1
+        scored: Set[str] = set().union(*postings[:rare])
+        for entry_id in scored:
+            consider(entry_id, self._keys[entry_id])
+        # A match shares at least `needed` trigrams, so at least one of the
+        # total - needed + 1 rarest ones: if all were scored, so was every match
+        if rare > total - needed:
+            return [self._entries[entry_id] for _, entry_id in sorted(best, reverse=True)]
+
+        # Best similarity an unscored entry can reach. It contains the query
+        # verbatim only if it has every unpadded query trigram.
+        top = (total - rare) / total
+        inner = {query_lower[i:i + 3] for i in range(len(query_lower) - 2)}
+        if not inner.intersection(grams[:rare]):
+            top += SUBSTRING_BONUS
+
+        def stop_key() -> float:
+            """Largest frecency key at which the best possible match scores at most best[0]."""
+            if len(best) < limit:
+                return -math.inf
+            room = math.expm1(best[0][0] / (top * top) - 1.0)
+            return now_key + math.log2(room) if room > 0 else -math.inf
+
+        # Visit the rest from the most frecent, until no entry left can beat best[0].
+        # Most scans stop early; a long one first collects the candidates so
+        # entries sharing none of the rarest trigrams are skipped cheaply.
+        stop = stop_key()
+        candidates: Optional[Set[str]] = None
+        for visited, (key, entry_id) in enumerate(reversed(self._order)):
+            if key <= stop:
+                break
+            if candidates is None:
+                if visited == self.DIRECT_SCORE_LIMIT * 4:
+                    candidates = set().union(*postings[:total - needed + 1])
+            elif entry_id not in candidates:
+                continue
+            if entry_id in scored:
+                continue
+            if consider(entry_id, key):
+                stop = stop_key()
+        return [self._entries[entry_id] for _, entry_id in sorted(best, reverse=True)]
@@ -0,0 +1,390 @@
+"""SQLite storage backend for command history."""
+
+import logging
+import math
+import sqlite3
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from history_manager import HistoryManager
+from history_search import FRECENCY_HALF_LIFE, match_trigrams, rank_frecent, trigrams
+from models import CommandHistory
+
+logger = logging.getLogger("iterm2-ai-generator")
+
+COLUMNS = "id, prompt, command, alias, use_count, last_used, created_at"
+# Follows INSERT; takes a row from _to_row()
+INTO_HISTORY = f"INTO history ({COLUMNS}, frecency) VALUES (?, ?, ?, ?, ?, ?, ?, frecency_key(?5, ?6))"
+
+# frecency holds history_search.frecency_key(), so ranked search can visit
+# entries from the most frecent like HistorySearchIndex does.
+# seq is an explicit rowid so VACUUM cannot renumber rows behind the FTS index.
+# The UNIQUE constraints on id and command create their lookup indexes.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS history (
+    seq INTEGER PRIMARY KEY,
+    id TEXT NOT NULL UNIQUE,
+    prompt TEXT NOT NULL,
+    command TEXT NOT NULL UNIQUE,
+    alias TEXT,
+    use_count INTEGER NOT NULL DEFAULT 1,
+    last_used TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    frecency REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS history_alias ON history(alias);
+CREATE INDEX IF NOT EXISTS history_last_used ON history(last_used);
+CREATE INDEX IF NOT EXISTS history_eviction ON history(use_count, last_used);
+CREATE INDEX IF NOT EXISTS history_frecency ON history(frecency, id);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+# Trigram tokens match any substring of 3+ characters, case-insensitively,
+# like the substring scan of the JSON backend. Columns are indexed padded
+# with a space on both sides, like history_search.trigrams(), so the
+# trigrams search_ranked() scores at their start and end are indexed too.
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS history_fts USING fts5(
+    prompt, command, alias, content='history', content_rowid='seq', tokenize='trigram'
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS history_fts_terms USING fts5vocab(history_fts, row);
+CREATE TRIGGER IF NOT EXISTS history_fts_insert AFTER INSERT ON history BEGIN
+    INSERT INTO history_fts(rowid, prompt, command, alias)
+    VALUES (new.seq, ' ' || new.prompt || ' ', ' ' || new.command || ' ', ' ' || new.alias || ' ');
+END;
+CREATE TRIGGER IF NOT EXISTS history_fts_delete AFTER DELETE ON history BEGIN
+    INSERT INTO history_fts(history_fts, rowid, prompt, command, alias)
+    VALUES ('delete', old.seq, ' ' || old.prompt || ' ', ' ' || old.command || ' ', ' ' || old.alias || ' ');
+END;
+CREATE TRIGGER IF NOT EXISTS history_fts_update AFTER UPDATE OF prompt, command, alias ON history BEGIN
+    INSERT INTO history_fts(history_fts, rowid, prompt, command, alias)
+    VALUES ('delete', old.seq, ' ' || old.prompt || ' ', ' ' || old.command || ' ', ' ' || old.alias || ' ');
+    INSERT INTO history_fts(rowid, prompt, command, alias)
+    VALUES (new.seq, ' ' || new.prompt || ' ', ' ' || new.command || ' ', ' ' || new.alias || ' ');
+END;
+"""
+
+# Shortest query the trigram index can answer
+FTS_MIN_QUERY = 3
+
+MIGRATED_KEY = "migrated_from_json"
+
+
+def _frecency_key(use_count: int, last_used: str) -> float:
+    """history_search.frecency_key() of a row's use_count and last_used."""
+    last_used_ts = datetime.fromisoformat(last_used).timestamp()
+    return math.log2(max(use_count, 1)) + last_used_ts / FRECENCY_HALF_LIFE
+
+
+def _to_entry(row: Tuple) -> CommandHistory:
+    """Build a CommandHistory from a row selected with COLUMNS."""
+    return CommandHistory(
+        id=row[0],
+        prompt=row[1],
+        command=row[2],
+        alias=row[3],
+        use_count=row[4],
+        last_used_ts=datetime.fromisoformat(row[5]).timestamp(),
+        created_at_ts=datetime.fromisoformat(row[6]).timestamp()
+    )
+
+
+def _to_row(entry: CommandHistory) -> Tuple:
+    """Convert a CommandHistory to a row in COLUMNS order."""
+    return (
+        entry.id,
+        entry.prompt,
+        entry.command,
+        entry.alias,
+        entry.use_count,
+        entry.last_used.isoformat(),
+        entry.created_at.isoformat()
+    )
+
+
+class SQLiteHistoryManager:
+    """
+    Command history stored in an indexed SQLite database.
+
+    Same interface as HistoryManager, for histories too large to keep in a
+    JSON file. Lookups by command, alias and id use indexes, and search()
+    uses an FTS5 trigram index when the SQLite library provides one
+    (SQLite 3.34+), falling back to LIKE otherwise.
+
+    Several processes may share the database: SQLite serializes their
+    writes, and use counts are incremented in place so none are lost.
+    """
+
+    def __init__(
+        self,
+        storage_path: Optional[str] = None,
+        max_items: int = 50,
+        json_path: Optional[str] = None
+    ):
+        """
+        Initialize SQLiteHistoryManager.
+
+        On first run an existing JSON history (and its journal) is copied
+        into the database. The JSON files are left in place.
+
+        Args:
+            storage_path: Path to database. Defaults to ~/.config/iterm2-ai-generator/history.db
+            max_items: Maximum number of history items to keep.
+            json_path: JSON history to migrate. Defaults to history.json next to the database.
+
+        Raises:
+            sqlite3.Error: If the database cannot be opened or created.
+        """
+        if storage_path is None:
+            config_dir = Path.home() / ".config" / "iterm2-ai-generator"
+            config_dir.mkdir(parents=True, exist_ok=True)
+            storage_path = str(config_dir / "history.db")
+
+        self.storage_path = storage_path
+        self.max_items = max_items
+        self._lock = threading.Lock()
+        # Shared with executor threads; every access holds _lock
+        self._conn = sqlite3.connect(storage_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.create_function("frecency_key", 2, _frecency_key)
+        self._conn.executescript(SCHEMA)
+        self.fts_enabled = self._create_fts()
+
+        if json_path is None:
+            json_path = str(Path(storage_path).with_name("history.json"))
+        self._migrate_json(json_path)
+        self._count = self._conn.execute("SELECT COUNT(*) FROM history").fetchone()[0]
+
+    def _create_fts(self) -> bool:
+        """Create the full-text index, if this SQLite build supports it."""
+        try:
+            self._conn.executescript(FTS_SCHEMA)
+            return True
+        except sqlite3.OperationalError as e:
+            logger.info(f"History full-text search unavailable, using LIKE: {e}")
+            return False
+
+    def _migrate_json(self, json_path: str) -> None:
+        """Copy a JSON history into the database once."""
+        done = self._conn.execute("SELECT 1 FROM meta WHERE key = ?", (MIGRATED_KEY,)).fetchone()
+        if done:
+            return
+        legacy_path = Path(json_path)
+        entries: List[CommandHistory] = []
+        if legacy_path.exists() or legacy_path.with_suffix(".journal").exists():
+            legacy = HistoryManager(json_path, max_items=self.max_items)
+            entries = legacy.get_all()
+            legacy.close()
+        with self._conn:
+            self._conn.executemany(
+                "INSERT OR IGNORE " + INTO_HISTORY, [_to_row(entry) for entry in entries]
+            )
+            self._conn.execute(
+                "INSERT INTO meta (key, value) VALUES (?, ?)",
+                (MIGRATED_KEY, datetime.now().isoformat())
+            )
+        if entries:
+            logger.info(f"Migrated {len(entries)} history entries from {json_path}")
+
+    def close(self) -> None:
+        """Close the database connection."""
+        with self._lock:
+            self._conn.close()
+
+    def add(
+        self,
+        prompt: str,
+        command: str,
+        alias: Optional[str] = None
+    ) -> CommandHistory:
+        """
+        Add a new command to history.
+
+        Args:
+            prompt: Original natural language request.
+            command: Generated command.
+            alias: Optional alias for the command.
+
+        Returns:
+            The saved CommandHistory entry.
+
+        Note:
+            If the same command exists, updates use_count instead of adding duplicate.
+            Enforces max_items limit by removing least used old items.
+        """
+        with self._lock, self._conn:
+            # Update in place rather than read, modify and write, so uses
+            # from other processes sharing the database add up
+            updated = self._conn.execute(
+                "UPDATE history SET use_count = use_count + 1, last_used = ?1, "
+                "frecency = frecency_key(use_count + 1, ?1), "
+                "alias = COALESCE(NULLIF(alias, ''), NULLIF(?2, ''), alias) WHERE command = ?3",
+                (datetime.now().isoformat(), alias, command)
+            ).rowcount
+            if updated:
+                row = self._conn.execute(
+                    f"SELECT {COLUMNS} FROM history WHERE command = ?", (command,)
+                ).fetchone()
+                return _to_entry(row)
+
+            entry = CommandHistory(prompt=prompt, command=command, alias=alias)
+            self._conn.execute("INSERT " + INTO_HISTORY, _to_row(entry))
+            self._count += 1
+
+            if self._count > self.max_items:
+                self._remove_least_used()
+
+        return entry
+
+    def _remove_least_used(self) -> None:
+        """Remove least used old items to maintain max_items limit."""
+        # Other processes may have added entries since the count was taken
+        self._count = self._conn.execute("SELECT COUNT(*) FROM history").fetchone()[0]
+        excess = self._count - self.max_items
+        if excess <= 0:
+            return
+        self._conn.execute(
+            "DELETE FROM history WHERE seq IN "
+            "(SELECT seq FROM history ORDER BY use_count, last_used LIMIT ?)",
+            (excess,)
+        )
+        self._count -= excess
+
+    def _select(self, where: str = "", params: Tuple = ()) -> List[CommandHistory]:
+        """Select entries, most recently used first."""
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {COLUMNS} FROM history {where} ORDER BY last_used DESC", params
+            ).fetchall()
+        return [_to_entry(row) for row in rows]
+
+    def get_all(self) -> List[CommandHistory]:
+        """
+        Get all history entries.
+
+        Returns:
+            List of CommandHistory sorted by last_used (most recent first).
+        """
+        return self._select()
+
+    def get_by_command(self, command: str) -> Optional[CommandHistory]:
+        """
+        Get history entry by command string.
+
+        Args:
+            command: Exact command to search for.
+
+        Returns:
+            CommandHistory or None if not found.
+        """
+        matches = self._select("WHERE command = ?", (command,))
+        return matches[0] if matches else None
+
+    def get_by_alias(self, alias: str) -> Optional[CommandHistory]:
+        """
+        Get history entry by alias.
+
+        Args:
+            alias: Alias to search for.
+
+        Returns:
+            CommandHistory or None if not found.
+        """
+        matches = self._select("WHERE alias = ?", (alias,))
+        return matches[0] if matches else None
+
+    def search(self, query: str) -> List[CommandHistory]:
+        """
+        Search history by prompt or command.
+
+        Args:
+            query: Search query string.
+
+        Returns:
+            List of matching CommandHistory entries.
+        """
+        if not query:
+            return self.get_all()
+        if self.fts_enabled and len(query) >= FTS_MIN_QUERY:
+            # Quoted as one phrase so FTS5 operators in the query are literal text
+            phrase = '"' + query.replace('"', '""') + '"'
+            return self._select(
+                "WHERE seq IN (SELECT rowid FROM history_fts WHERE history_fts MATCH ?)",
+                (phrase,)
+            )
+        pattern = "%" + query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+        return self._select(
+            "WHERE prompt LIKE ?1 ESCAPE '\\' OR command LIKE ?1 ESCAPE '\\' "
+            "OR alias LIKE ?1 ESCAPE '\\'",
+            (pattern,)
+        )
+
+    def search_ranked(self, query: str, limit: int = 10) -> List[CommandHistory]:
+        """
+        Search history by prompt, command or alias, tolerating typos.
+
+        Entries are visited from the most frecent, using the frecency
+        index, and scored like HistoryManager.search_ranked scores them,
+        stopping once no entry left can make the results, so both backends
+        return the same entries. The full-text index skips entries lacking
+        all of the query's rarest space-padded trigrams, which no match does.
+
+        Args:
+            query: Search query string.
+            limit: Maximum number of results.
+
+        Returns:
+            Best matches first, ranked by similarity, then by how often
+            and how recently each entry was used.
+        """
+        query = query.strip()
+        where = ""
+        params: Tuple = ()
+        with self._lock:
+            if query and self.fts_enabled:
+                grams = tuple(trigrams(query))
+                entry_counts = dict(self._conn.execute(
+                    "SELECT term, doc FROM history_fts_terms "
+                    f"WHERE term IN ({', '.join('?' * len(grams))})",
+                    grams
+                ).fetchall())
+                match = " OR ".join(
+                    '"' + gram.replace('"', '""') + '"' for gram in match_trigrams(query, entry_counts)
+                )
+                where = "WHERE seq IN (SELECT rowid FROM history_fts WHERE history_fts MATCH ?)"
+                params = (match,)
+            cursor = self._conn.execute(
+                f"SELECT {COLUMNS} FROM history {where} ORDER BY frecency DESC, id DESC", params
+            )
+            return rank_frecent(query, (_to_entry(row) for row in cursor), limit)
+
+    def delete(self, id: str) -> bool:
+        """
+        Delete history entry by ID.
+
+        Args:
+            id: Entry ID to delete.
+
+        Returns:
+            True if entry was found and deleted.
+        """
+        with self._lock, self._conn:
+            deleted = self._conn.execute("DELETE FROM history WHERE id = ?", (id,)).rowcount
+            self._count -= deleted
+        return deleted > 0
+
+    def clear(self) -> None:
+        """Clear all history entries."""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM history")
+            self._count = 0
+
+    def get_count(self) -> int:
+        """Get total number of history entries."""
+        return self._count
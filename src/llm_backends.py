@@ -0,0 +1,290 @@
+"""LLM backends for iTerm2 AI Command Generator."""
+
+import json
+import threading
+import urllib.request
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+
+try:
+    import google.generativeai as genai
+except ImportError:  # Only needed by GeminiBackend
+    genai = None
+
+from models import GenerationProfile
+
+
+class LLMBackend:
+    """
+    Interface for text generation providers.
+
+    Backends implement blocking generate()/stream(). Backends with a native
+    asyncio API also set supports_async and implement generate_async()/
+    stream_async(). Command generation, scripts and explanations are all
+    plain prompts, so these two calls cover every client operation.
+    Each call may carry a GenerationProfile with output limits.
+    """
+
+    # Whether generate_async/stream_async are implemented
+    supports_async = False
+
+    def generate(
+        self,
+        model_name: str,
+        prompt: str,
+        profile: Optional[GenerationProfile] = None
+    ) -> str:
+        """
+        Run a blocking generation request.
+
+        Args:
+            model_name: Model requested by the client.
+            prompt: Prompt to send.
+            profile: Optional output token cap, temperature and stop sequences.
+
+        Returns:
+            Full response text.
+        """
+        raise NotImplementedError
+
+    def stream(
+        self,
+        model_name: str,
+        prompt: str,
+        profile: Optional[GenerationProfile] = None
+    ) -> Iterator[str]:
+        """
+        Run a blocking streaming request.
+
+        Args:
+            model_name: Model requested by the client.
+            prompt: Prompt to send.
+            profile: Optional output token cap, temperature and stop sequences.
+
+        Yields:
+            Response text chunks as they arrive.
+        """
+        raise NotImplementedError
+
+    def warm(self, model_names: List[str]) -> None:
+        """
+        Prepare per-model resources ahead of the first request.
+
+        Args:
+            model_names: Models the client may use.
+        """
+
+    async def generate_async(
+        self,
+        model_name: str,
+        prompt: str,
+        profile: Optional[GenerationProfile] = None
+    ) -> str:
+        """Run a generation request on the event loop."""
+        raise NotImplementedError
+
+    def stream_async(
+        self,
+        model_name: str,
+        prompt: str,
+        profile: Optional[GenerationProfile] = None
+    ) -> AsyncIterator[str]:
+        """Run a streaming request on the event loop."""
+        raise NotImplementedError
+
+
+class GeminiBackend(LLMBackend):
+    """Google Gemini through google-generativeai."""
+
+    supports_async = True
+
+    def __init__(self, api_key: str):
+        """
+        Initialize GeminiBackend.
+
+        Args:
+            api_key: Google Gemini API key.
+
+        Raises:
+            ValueError: If API key is empty.
+            ImportError: If google-generativeai is not installed.
+        """
+        if not api_key:
+            raise ValueError("API key cannot be empty")
+        if genai is None:
+            raise ImportError("google-generativeai is required for the Gemini backend")
+
+        self.api_key = api_key
+        # The library only supports process-wide configuration
+        genai.configure(api_key=api_key)
+        # Pool of model handles by name, shared by all requests
+        self._models: Dict[str, "genai.GenerativeModel"] = {}
+        self._lock = threading.Lock()
+
+    def get_model(self, model_name: str) -> "genai.GenerativeModel":
+        """Get the pooled model handle, creating it on first use."""
+        model = self._models.get(model_name)
+        if model is None:
+            # Requests also run on executor threads
+            with self._lock:
+                model = self._models.get(model_name)
+                if model is None:
+                    model = genai.GenerativeModel(model_name)
+                    self._models[model_name] = model
+        return model
+
+    def warm(self, model_names: List[str]) -> None:
+        """Create pooled model handles so switching models costs nothing."""
+        for model_name in model_names:
+            self.get_model(model_name)
+
+    @staticmethod
+    def _generation_config(profile: Optional[GenerationProfile]) -> Optional[Dict[str, Any]]:
+        """Convert a profile to a generation_config dict."""
+        if profile is None:
+            return None
+        config: Dict[str, Any] = {
+            "max_output_tokens": profile.max_output_tokens,
+            "temperature": profile.temperature
+        }
+        if profile.stop_sequences:
+            config["stop_sequences"] = list(profile.stop_sequences)
+        return config
+
+    def generate(
+        self,
+        model_name: str,
+        prompt: str,
+        profile: Optional[GenerationProfile] = None
+    ) -> str:
+        """Run a blocking generation request."""
+        response = self.get_model(model_name).generate_content(
+            prompt, generation_config=self._generation_config(profile)
+        )
+        return response.text
+
+    def stream(
+        self,
+        model_name: str,
+        prompt: str,
+        profile: Optional[GenerationProfile] = None
+    ) -> Iterator[str]:
+        """Run a blocking streaming request."""
+        response = self.get_model(model_name).generate_content(
+            prompt, generation_config=self._generation_config(profile), stream=True
+        )
+        for chunk in response:
+            yield chunk.text
+
+    async def generate_async(
+        self,
+        model_name: str,
+        prompt: str,
+        profile: Optional[GenerationProfile] = None
+    ) -> str:
+        """Run a generation request with generate_content_async."""
+        response = await self.get_model(model_name).generate_content_async(
+            prompt, generation_config=self._generation_config(profile)
+        )
+        return response.text
+
+    async def stream_async(
+        self,
+        model_name: str,
+        prompt: str,
+        profile: Optional[GenerationProfile] = None
+    ) -> AsyncIterator[str]:
+        """Run a streaming request with generate_content_async."""
+        response = await self.get_model(model_name).generate_content_async(
+            prompt, generation_config=self._generation_config(profile), stream=True
+        )
+        async for chunk in response:
+            yield chunk.text
+
+
+class OpenAICompatibleBackend(LLMBackend):
+    """Any server implementing the OpenAI /chat/completions API (e.g. a local model)."""
+
+    def __init__(
+        self,
+        base_url: str = "http://127.0.0.1:8080/v1",
+        api_key: Optional[str] = None,
+        model: Optional[str] = None,
+        timeout: float = 30.0
+    ):
+        """
+        Initialize OpenAICompatibleBackend.
+
+        Args:
+            base_url: API base URL, up to and including the version path.
+            api_key: Optional bearer token.
+            model: Model name sent to the server. Defaults to the client's model.
+            timeout: Socket timeout in seconds.
+        """
+        self.base_url = base_url.rstrip("/")
+        self.api_key = api_key
+        self.model = model
+        self.timeout = timeout
+
+    def _open(
+        self,
+        model_name: str,
+        prompt: str,
+        profile: Optional[GenerationProfile],
+        stream: bool
+    ):
+        """Send a chat completion request and return the open response."""
+        body: Dict[str, Any] = {
+            "model": self.model or model_name,
+            "messages": [{"role": "user", "content": prompt}],
+            "stream": stream
+        }
+        if profile is not None:
+            body["max_tokens"] = profile.max_output_tokens
+            body["temperature"] = profile.temperature
+            if profile.stop_sequences:
+                # The API accepts at most 4 stop sequences
+                body["stop"] = list(profile.stop_sequences[:4])
+        data = json.dumps(body).encode("utf-8")
+        headers = {"Content-Type": "application/json"}
+        if self.api_key:
+            headers["Authorization"] = f"Bearer {self.api_key}"
+
+        request = urllib.request.Request(
+            f"{self.base_url}/chat/completions",
+            data=data,
+            headers=headers,
+            method="POST"
+        )
+        # HTTPError carries the status code used for error classification
+        return urllib.request.urlopen(request, timeout=self.timeout)
+
+    def generate(
+        self,
+        model_name: str,
+        prompt: str,
+        profile: Optional[GenerationProfile] = None
+    ) -> str:
+        """Run a blocking chat completion request."""
+        with self._open(model_name, prompt, profile, stream=False) as response:
+            data = json.load(response)
+        return data["choices"][0]["message"]["content"] or ""
+
+    def stream(
+        self,
+        model_name: str,
+        prompt: str,
+        profile: Optional[GenerationProfile] = None
+    ) -> Iterator[str]:
+        """Run a blocking chat completion request with server-sent events."""
+        with self._open(model_name, prompt, profile, stream=True) as response:
+            for raw_line in response:
+                line = raw_line.decode("utf-8").strip()
+                if not line.startswith("data:"):
+                    continue
+                payload = line[len("data:"):].strip()
+                if payload == "[DONE]":
+                    return
+                delta = json.loads(payload)["choices"][0].get("delta", {})
+                text = delta.get("content")
+                if text:
+                    yield text
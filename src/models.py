@@ -1,9 +1,10 @@
 """Data models for iTerm2 AI Command Generator."""
 
-from dataclasses import dataclass, field
+from dataclasses import dataclass, field, fields
 from datetime import datetime
 from enum import Enum
-from typing import List, Optional
+from typing import Any, Dict, List, Optional, Tuple
+import time
 import uuid
 
 
@@ -21,6 +22,34 @@ class RiskResult:
     reasons: List[str] = field(default_factory=list)
 
 
+@dataclass(frozen=True)
+class RiskRule:
+    """Regex risk rule, e.g. from a rule pack file."""
+    pattern: str
+    level: RiskLevel
+    reason: str
+    shells: Tuple[str, ...] = ()  # Empty applies to every shell
+
+
+@dataclass
+class ScriptFinding:
+    """Risk found in one command of a script."""
+    line_number: int  # 1-based line the command starts on
+    command: str
+    level: RiskLevel
+    reasons: List[str] = field(default_factory=list)
+
+
+@dataclass
+class AuditFinding:
+    """Risk of a saved or imported command, re-scored by a history audit."""
+    command: str
+    level: RiskLevel
+    reasons: List[str] = field(default_factory=list)
+    sources: List[str] = field(default_factory=list)  # e.g. "history", "zsh"
+    occurrences: int = 1
+
+
 @dataclass
 class PromptRequest:
     """User's natural language request."""
@@ -45,6 +74,8 @@ class GeneratedCommand:
     risk_level: RiskLevel = RiskLevel.SAFE
     explanation: Optional[str] = None
     risk_reasons: List[str] = field(default_factory=list)
+    from_history: bool = False
+    alternatives: List["GeneratedCommand"] = field(default_factory=list)
     id: str = field(default_factory=lambda: str(uuid.uuid4()))
     created_at: datetime = field(default_factory=datetime.now)
 
@@ -53,17 +84,64 @@ class GeneratedCommand:
             raise ValueError("command cannot be empty")
 
 
+def _with_slots(cls: type) -> type:
+    """Recreate a dataclass with __slots__ (dataclass(slots=True) needs Python 3.10)."""
+    names = tuple(f.name for f in fields(cls))
+    namespace = dict(cls.__dict__)
+    for name in names + ("__dict__", "__weakref__"):
+        namespace.pop(name, None)
+    namespace["__slots__"] = names
+    return type(cls)(cls.__name__, cls.__bases__, namespace)
+
+
+def epoch_now() -> float:
+    """Get the current Unix time to the microsecond, like datetime.now()."""
+    return round(time.time(), 6)
+
+
+def epoch_seconds(value: Any) -> float:
+    """Get a Unix time from an epoch number or, in older files, an ISO timestamp."""
+    if isinstance(value, str):
+        return datetime.fromisoformat(value).timestamp()
+    return float(value)
+
+
+@_with_slots
 @dataclass
 class CommandHistory:
-    """Stored command history entry."""
+    """
+    Stored command history entry.
+
+    Timestamps are kept as Unix times (last_used_ts, created_at_ts) and
+    slots are used, since a history may hold many entries; last_used and
+    created_at give them as datetimes.
+    """
     prompt: str
     command: str
     alias: Optional[str] = None
     use_count: int = 1
-    last_used: datetime = field(default_factory=datetime.now)
-    created_at: datetime = field(default_factory=datetime.now)
+    last_used_ts: float = field(default_factory=epoch_now)
+    created_at_ts: float = field(default_factory=epoch_now)
     id: str = field(default_factory=lambda: str(uuid.uuid4()))
 
+    @property
+    def last_used(self) -> datetime:
+        """When the command was last used."""
+        return datetime.fromtimestamp(self.last_used_ts)
+
+    @last_used.setter
+    def last_used(self, value: datetime) -> None:
+        self.last_used_ts = value.timestamp()
+
+    @property
+    def created_at(self) -> datetime:
+        """When the command was first saved."""
+        return datetime.fromtimestamp(self.created_at_ts)
+
+    @created_at.setter
+    def created_at(self, value: datetime) -> None:
+        self.created_at_ts = value.timestamp()
+
     def to_dict(self) -> dict:
         """Convert to dictionary for JSON serialization."""
         return {
@@ -78,17 +156,42 @@ class CommandHistory:
 
     @classmethod
     def from_dict(cls, data: dict) -> "CommandHistory":
-        """Create from dictionary."""
+        """Create from dictionary; timestamps may be ISO strings or epoch numbers."""
         return cls(
             id=data["id"],
             prompt=data["prompt"],
             command=data["command"],
             alias=data.get("alias"),
             use_count=data.get("use_count", 1),
-            last_used=datetime.fromisoformat(data["last_used"]),
-            created_at=datetime.fromisoformat(data["created_at"])
+            last_used_ts=epoch_seconds(data["last_used"]),
+            created_at_ts=epoch_seconds(data["created_at"])
         )
 
+    def to_row(self) -> list:
+        """
+        Convert to the compact list form used by history files.
+
+        Returns:
+            The fields in declaration order, so CommandHistory(*row)
+            recreates the entry.
+        """
+        return [
+            self.prompt, self.command, self.alias, self.use_count,
+            self.last_used_ts, self.created_at_ts, self.id
+        ]
+
+
+@dataclass(frozen=True)
+class GenerationProfile:
+    """Generation settings and prompt budget for one kind of request."""
+    max_output_tokens: int
+    temperature: float
+    stop_sequences: Tuple[str, ...] = ()
+    model: Optional[str] = None  # Overrides the selected model
+    max_input_chars: int = 10000  # User input longer than this is trimmed
+    max_instructions_chars: int = 2000  # Custom instructions longer than this are trimmed
+    name: str = ""  # Operation name, used for per-operation latency telemetry
+
 
 @dataclass
 class AppConfig:
@@ -98,3 +201,13 @@ class AppConfig:
     shortcut_key: str = "Ctrl+Shift+A"
     max_history: int = 50
     max_input_length: int = 500
+    max_concurrent_requests: int = 4
+    hedging_enabled: bool = False
+    requests_per_minute: Dict[str, int] = field(default_factory=dict)
+    command_candidates: int = 1
+    backend: str = "gemini"
+    backend_url: str = ""
+    backend_model: str = ""
+    speculative_explain: bool = False
+    generation_profiles: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+    history_backend: str = "json"  # "json" or "sqlite"
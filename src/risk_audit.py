@@ -0,0 +1,203 @@
+"""
+Re-score saved and imported commands against the current risk rules.
+
+Audits the plugin's command history and, optionally, zsh/bash history
+files with the built-in rules plus the rule packs in the config directory:
+
+    python3 src/risk_audit.py
+    python3 src/risk_audit.py --shell-history
+    python3 src/risk_audit.py --shell-history ~/.zsh_history --workers 8 --json
+
+Exits with status 1 if any command is dangerous.
+"""
+
+import argparse
+import json
+import re
+import sys
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from history_manager import HistoryManager
+from history_sqlite import SQLiteHistoryManager
+from models import AuditFinding, RiskLevel
+from risk_detector import RiskDetector
+
+CONFIG_DIR = Path.home() / ".config" / "iterm2-ai-generator"
+
+DEFAULT_SHELL_HISTORIES = (
+    (Path.home() / ".zsh_history", "zsh"),
+    (Path.home() / ".bash_history", "bash"),
+)
+
+# zsh extended history: ": <start>:<elapsed>;<command>"
+ZSH_EXTENDED_PATTERN = re.compile(r'^: \d+:\d+;')
+# bash HISTTIMEFORMAT timestamp lines
+BASH_TIMESTAMP_PATTERN = re.compile(r'^#\d+$')
+# zsh escapes some bytes in history files as 0x83 followed by the byte XOR 32
+ZSH_META_PATTERN = re.compile(b'\x83(.)', re.DOTALL)
+
+LEVEL_ORDER = {RiskLevel.DANGEROUS: 0, RiskLevel.WARNING: 1, RiskLevel.SAFE: 2}
+
+
+def read_shell_history(path: Path) -> List[str]:
+    """
+    Read commands from a zsh or bash history file.
+
+    Handles zsh extended history, multi-line commands continued with a
+    trailing backslash, and bash timestamp lines.
+
+    Args:
+        path: History file.
+
+    Returns:
+        Commands in file order.
+    """
+    data = ZSH_META_PATTERN.sub(lambda m: bytes([m.group(1)[0] ^ 32]), path.read_bytes())
+    commands: List[str] = []
+    pending: List[str] = []
+    for line in data.decode("utf-8", errors="replace").splitlines():
+        if not pending:
+            if BASH_TIMESTAMP_PATTERN.match(line):
+                continue
+            line = ZSH_EXTENDED_PATTERN.sub("", line, count=1)
+        if line.endswith("\\"):
+            pending.append(line[:-1])
+            continue
+        pending.append(line)
+        command = "\n".join(pending).strip()
+        pending = []
+        if command:
+            commands.append(command)
+    if pending and "\n".join(pending).strip():
+        commands.append("\n".join(pending).strip())
+    return commands
+
+
+def audit_commands(
+    detector: RiskDetector,
+    commands: Iterable[Tuple[str, str]],
+    shell: Optional[str] = None,
+    workers: Optional[int] = None
+) -> List[AuditFinding]:
+    """
+    Re-score commands, analyzing each distinct command once.
+
+    Args:
+        detector: Detector with the current rules.
+        commands: (command, source) pairs, e.g. ("rm -rf build", "zsh").
+        shell: Shell the commands run in, for shell-scoped rules.
+        workers: Worker processes for RiskDetector.analyze_many.
+
+    Returns:
+        One finding per distinct command, most dangerous and most
+        frequent first.
+    """
+    findings: Dict[str, AuditFinding] = {}
+    for command, source in commands:
+        finding = findings.get(command)
+        if finding is None:
+            findings[command] = AuditFinding(command, RiskLevel.SAFE, sources=[source], occurrences=1)
+            continue
+        finding.occurrences += 1
+        if source not in finding.sources:
+            finding.sources.append(source)
+
+    results = detector.analyze_many(list(findings), shell, workers)
+    for finding, result in zip(findings.values(), results):
+        finding.level = result.level
+        finding.reasons = result.reasons
+
+    return sorted(findings.values(), key=lambda f: (LEVEL_ORDER[f.level], -f.occurrences))
+
+
+def _collect(history_path: Path, shell_histories: List[Tuple[Path, str]]) -> List[Tuple[str, str]]:
+    """Gather (command, source) pairs from the plugin and shell histories."""
+    commands: List[Tuple[str, str]] = []
+    if history_path.exists():
+        if history_path.suffix == ".db":
+            manager = SQLiteHistoryManager(str(history_path))
+        else:
+            manager = HistoryManager(str(history_path))
+        commands.extend((entry.command, "history") for entry in manager.get_all())
+        manager.close()
+    for path, source in shell_histories:
+        try:
+            commands.extend((command, source) for command in read_shell_history(path))
+        except OSError as e:
+            print(f"Skipping {path}: {e}", file=sys.stderr)
+    return commands
+
+
+def _default_history_path() -> Path:
+    """The SQLite history if the plugin uses it, else the JSON history."""
+    db_path = CONFIG_DIR / "history.db"
+    return db_path if db_path.exists() else CONFIG_DIR / "history.json"
+
+
+def _shell_histories(paths: Optional[List[str]]) -> List[Tuple[Path, str]]:
+    """Resolve --shell-history arguments to (path, source) pairs."""
+    if paths is None:
+        return []
+    if not paths:
+        return [(path, source) for path, source in DEFAULT_SHELL_HISTORIES if path.exists()]
+    resolved = []
+    for raw in paths:
+        path = Path(raw).expanduser()
+        source = "zsh" if "zsh" in path.name else "bash" if "bash" in path.name else path.name
+        resolved.append((path, source))
+    return resolved
+
+
+def main() -> None:
+    """Run the audit from the command line."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--history", default=str(_default_history_path()),
+                        help="plugin history file (history.db or history.json)")
+    parser.add_argument("--shell-history", nargs="*", metavar="PATH",
+                        help="also audit shell history files (default: ~/.zsh_history, ~/.bash_history)")
+    parser.add_argument("--rules-dir", default=str(CONFIG_DIR / "rules"), help="rule pack directory")
+    parser.add_argument("--shell", choices=("bash", "zsh", "sh", "fish"), help="shell for shell-scoped rules")
+    parser.add_argument("--workers", type=int, help="worker processes (default: 1)")
+    parser.add_argument("--all", action="store_true", help="also list safe commands")
+    parser.add_argument("--json", action="store_true", help="print findings as JSON")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    commands = _collect(Path(args.history).expanduser(), _shell_histories(args.shell_history))
+    detector = RiskDetector(rules_dir=Path(args.rules_dir).expanduser())
+    findings = audit_commands(detector, commands, args.shell, args.workers)
+    elapsed = time.perf_counter() - start
+
+    shown = [f for f in findings if args.all or f.level != RiskLevel.SAFE]
+    if args.json:
+        print(json.dumps([
+            {
+                "command": f.command,
+                "level": f.level.value,
+                "reasons": f.reasons,
+                "sources": f.sources,
+                "occurrences": f.occurrences
+            }
+            for f in shown
+        ], ensure_ascii=False, indent=2))
+    else:
+        markers = {RiskLevel.DANGEROUS: "🚨", RiskLevel.WARNING: "⚠️ ", RiskLevel.SAFE: "  "}
+        for f in shown:
+            command = f.command.replace("\n", " ")
+            reasons = f"  ({', '.join(f.reasons)})" if f.reasons else ""
+            print(f"{markers[f.level]} x{f.occurrences:<4} {','.join(f.sources):<14} {command}{reasons}")
+
+    counts = {level: sum(1 for f in findings if f.level == level) for level in RiskLevel}
+    print(
+        f"Audited {len(commands)} commands ({len(findings)} unique) in {elapsed:.2f}s: "
+        f"{counts[RiskLevel.DANGEROUS]} dangerous, {counts[RiskLevel.WARNING]} warning",
+        file=sys.stderr
+    )
+    if counts[RiskLevel.DANGEROUS]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
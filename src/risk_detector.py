@@ -1,90 +1,267 @@
 """Dangerous command detection for iTerm2 AI Command Generator."""
 
+import logging
 import re
-from typing import List, Tuple
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Dict, FrozenSet, Iterable, List, Optional, Pattern, Tuple
 
-from models import RiskLevel, RiskResult
+from exceptions import ConfigError
+from models import RiskLevel, RiskResult, RiskRule, ScriptFinding
+from rule_packs import CompiledRule, RulePackLoader
+from shell_parser import parse
+from shell_rules import analyze_command, stdin_executed
+
+logger = logging.getLogger("iterm2-ai-generator")
+
+# Characters that end the literal prefix of a pattern
+REGEX_METACHARACTERS = set(".^$*+?{}[]()|\\")
+
+# analyze_many(workers > 1) uses worker processes from this many unique
+# commands. Starting the pool takes about 50 ms, as long as analyzing 2,000
+# commands serially (benchmarks/bench_risk_detector.py), so two workers
+# only break even at around 4,500.
+PARALLEL_THRESHOLD = 5000
+
+
+def literal_prefix(pattern: str) -> Optional[str]:
+    """
+    Get the literal text every match of a pattern must start with.
+
+    Args:
+        pattern: Regex pattern.
+
+    Returns:
+        Lowercased literal prefix, or None if the pattern has no usable
+        prefix (e.g. it starts with a group or has a top-level alternation).
+    """
+    if _has_top_level_alternation(pattern):
+        return None
+
+    prefix: List[str] = []
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        if char == "\\":
+            # An escaped punctuation character is a literal; \s, \d etc. are not
+            if i + 1 < len(pattern) and not pattern[i + 1].isalnum():
+                prefix.append(pattern[i + 1])
+                i += 2
+                continue
+            break
+        if char in REGEX_METACHARACTERS:
+            if char in "*?{" and prefix:
+                # The previous character is optional or repeated
+                prefix.pop()
+            break
+        prefix.append(char)
+        i += 1
+
+    keyword = "".join(prefix).lower()
+    return keyword or None
+
+
+def _has_top_level_alternation(pattern: str) -> bool:
+    """Check for a "|" outside of groups and character classes."""
+    depth = 0
+    in_class = False
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        if char == "\\":
+            i += 2
+            continue
+        if in_class:
+            if char == "]":
+                in_class = False
+        elif char == "[":
+            in_class = True
+        elif char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+        elif char == "|" and depth == 0:
+            return True
+        i += 1
+    return False
+
+
+# (rule index, regex, level, reason, shells or None for every shell)
+_IndexedRule = Tuple[int, Pattern, RiskLevel, str, Optional[FrozenSet[str]]]
+
+
+class _CompiledRules:
+    """Immutable snapshot of the compiled rule set."""
+
+    def __init__(self, rules: List[RiskRule], compiled: Dict[str, Pattern]):
+        """
+        Build the keyword index for a rule set.
+
+        Args:
+            rules: Rules in report order.
+            compiled: Compiled regex per pattern string.
+        """
+        by_keyword: Dict[str, List[_IndexedRule]] = {}
+        # Rules without a literal prefix run on every command
+        self.always: List[_IndexedRule] = []
+
+        for index, rule in enumerate(rules):
+            shells = frozenset(rule.shells) if rule.shells else None
+            indexed = (index, compiled[rule.pattern], rule.level, rule.reason, shells)
+            keyword = literal_prefix(rule.pattern)
+            if keyword is None:
+                self.always.append(indexed)
+            else:
+                by_keyword.setdefault(keyword, []).append(indexed)
+
+        # Checked with `in` on the lowercased command: substring search runs
+        # in C and is faster than one alternation regex of all keywords
+        self.keywords = tuple(by_keyword.items())
 
 
 class RiskDetector:
     """Detects potentially dangerous shell commands."""
 
-    def __init__(self):
-        """Initialize RiskDetector with default patterns."""
-        # List of (pattern, risk_level, reason)
-        self._patterns: List[Tuple[str, RiskLevel, str]] = []
+    def __init__(self, rules_dir: Optional[Path] = None, reload_interval: float = 2.0):
+        """
+        Initialize RiskDetector with default patterns.
+
+        Args:
+            rules_dir: Directory of *.json rule packs, or None for built-in rules only.
+            reload_interval: Minimum seconds between checks for changed rule packs.
+        """
+        # Built-in and add_pattern() rules
+        self._patterns: List[RiskRule] = []
+        # Compiled regex per pattern string, kept across rule changes
+        self._compiled: Dict[str, Pattern] = {}
+        self._packs = RulePackLoader(rules_dir) if rules_dir is not None else None
+        self._pack_rules: List[CompiledRule] = []
+        self.reload_interval = reload_interval
+        self._next_reload_check = 0.0
+        # Serializes rule set rebuilds; analyze() never waits for it
+        self._lock = threading.Lock()
         self._add_default_patterns()
+        self._rules = self._build_rules()
+        self.reload_rules()
 
     def _add_default_patterns(self) -> None:
-        """Add default dangerous command patterns."""
-        # DANGEROUS patterns - can cause severe damage
-        dangerous_patterns = [
-            (r'rm\s+(-[rf]+\s+)*/', "루트 디렉토리 삭제 시도"),
-            (r'rm\s+(-[rf]+\s+)*~', "홈 디렉토리 삭제 시도"),
-            (r'rm\s+-[rf]*\s+-[rf]*\s+/', "루트 디렉토리 삭제 시도"),
-            (r'mkfs\.', "파일시스템 포맷 시도"),
-            (r'>\s*/dev/sd[a-z]', "디스크 직접 덮어쓰기"),
-            (r'>\s*/dev/nvme', "NVMe 디스크 직접 덮어쓰기"),
-            (r':\(\)\s*\{\s*:\|:\s*&\s*\}\s*;:', "Fork bomb 감지"),
-            (r'echo\s+.*>\s*/dev/sd[a-z]', "디스크에 데이터 직접 쓰기"),
-        ]
+        """Add default patterns for risks the parse tree cannot express."""
+        # Command-level rules (rm, chmod, dd, sudo, ...) live in shell_rules and
+        # run on the parse tree; regex rules cover raw text only
+        self._register(r':\(\)\s*\{\s*:\|:\s*&\s*\}\s*;:', RiskLevel.DANGEROUS, "Fork bomb 감지")
 
-        for pattern, reason in dangerous_patterns:
-            self._patterns.append((pattern, RiskLevel.DANGEROUS, reason))
-
-        # WARNING patterns - potentially risky
-        warning_patterns = [
-            (r'chmod\s+777', "과도한 권한 부여 (777)"),
-            (r'chmod\s+-R', "재귀적 권한 변경"),
-            (r'chown\s+-R', "재귀적 소유자 변경"),
-            (r'dd\s+if=', "디스크 이미지 직접 쓰기"),
-            (r'sudo\s+', "관리자 권한으로 실행"),
-            (r'curl\s+.*\|\s*sh', "원격 스크립트 직접 실행"),
-            (r'curl\s+.*\|\s*bash', "원격 스크립트 직접 실행"),
-            (r'wget\s+.*\|\s*sh', "원격 스크립트 직접 실행"),
-            (r'wget\s+.*\|\s*bash', "원격 스크립트 직접 실행"),
-            (r'>\s*/etc/', "/etc 디렉토리 파일 덮어쓰기"),
-            (r'rm\s+-[rf]', "강제/재귀 삭제"),
-            (r'pkill\s+-9', "프로세스 강제 종료"),
-            (r'kill\s+-9', "프로세스 강제 종료"),
-            (r'shutdown', "시스템 종료 명령"),
-            (r'reboot', "시스템 재시작 명령"),
-            (r'init\s+[06]', "시스템 종료/재시작"),
-            (r'systemctl\s+(stop|disable|mask)', "서비스 중지/비활성화"),
-            (r'launchctl\s+unload', "서비스 언로드"),
-            (r'>\s*/dev/null\s+2>&1\s*&', "백그라운드로 출력 숨김"),
-            (r'history\s+-c', "명령어 히스토리 삭제"),
-            (r'shred\s+', "파일 영구 삭제"),
-        ]
+    def _register(self, pattern: str, level: RiskLevel, reason: str, shells: Tuple[str, ...] = ()) -> None:
+        """Compile a pattern (once per pattern string) and append it to the rule list."""
+        if pattern not in self._compiled:
+            self._compiled[pattern] = re.compile(pattern, re.IGNORECASE)
+        self._patterns.append(RiskRule(pattern, level, reason, shells))
 
-        for pattern, reason in warning_patterns:
-            self._patterns.append((pattern, RiskLevel.WARNING, reason))
+    def _build_rules(self) -> _CompiledRules:
+        """Build a new rule snapshot from the already compiled patterns and packs."""
+        compiled = dict(self._compiled)
+        compiled.update((rule.pattern, regex) for rule, regex in self._pack_rules)
+        return _CompiledRules(self._patterns + [rule for rule, _ in self._pack_rules], compiled)
 
-    def analyze(self, command: str) -> RiskResult:
+    def reload_rules(self) -> bool:
+        """
+        Reload rule packs that changed on disk.
+
+        The new rule set is built aside and swapped in with one assignment,
+        so concurrent analyze() calls see either the old or the new set.
+
+        Returns:
+            True if the rule set changed.
+        """
+        if self._packs is None:
+            return False
+        with self._lock:
+            self._next_reload_check = time.monotonic() + self.reload_interval
+            changed, pack_rules = self._packs.load()
+            if changed:
+                self._pack_rules = pack_rules
+                self._rules = self._build_rules()
+        return changed
+
+    def _maybe_reload_rules(self) -> None:
+        """Check for changed rule packs at most once per reload_interval."""
+        if self._packs is None or time.monotonic() < self._next_reload_check:
+            return
+        # Skip the check if another thread is already reloading
+        if self._lock.locked():
+            return
+        self.reload_rules()
+
+    def analyze(self, command: str, shell: Optional[str] = None) -> RiskResult:
         """
         Analyze command for potential risks.
 
+        The command is parsed into pipelines and simple commands and checked
+        by the structured rules in shell_rules (memoized per command string). Regex patterns then run on the raw text, but
+        only those whose literal keyword occurs in the command.
+
         Args:
             command: Shell command to analyze.
+            shell: Shell the command runs in (bash/zsh/sh/fish). Rules scoped
+                to other shells are skipped; None applies every rule.
 
         Returns:
             RiskResult with level and reasons.
         """
+        return self._analyze(command, command, shell)
+
+    def _analyze(self, command: str, parsed: str, shell: Optional[str]) -> RiskResult:
+        """Analyze a command, running the structured rules on `parsed` (the command in its context)."""
+        self._maybe_reload_rules()
+        findings = list(analyze_command(parsed))
+
+        # Read the snapshot once; reloads and add_pattern/remove_pattern replace it
+        rules = self._rules
+        matched: List[Tuple[int, RiskLevel, str]] = []
+
+        for index, regex, level, reason, shells in rules.always:
+            if shells is not None and shell is not None and shell not in shells:
+                continue
+            if regex.search(command):
+                matched.append((index, level, reason))
+
+        lowered = command.lower()
+        for keyword, keyword_rules in rules.keywords:
+            if keyword not in lowered:
+                continue
+            for index, regex, level, reason, shells in keyword_rules:
+                if shells is not None and shell is not None and shell not in shells:
+                    continue
+                if regex.search(command):
+                    matched.append((index, level, reason))
+
+        # Structured findings in command order, then patterns in rule order
+        findings.extend((level, reason) for _, level, reason in sorted(matched, key=lambda m: m[0]))
+
         reasons: List[str] = []
         highest_level = RiskLevel.SAFE
 
-        for pattern, level, reason in self._patterns:
-            if re.search(pattern, command, re.IGNORECASE):
+        for level, reason in findings:
+            if reason not in reasons:
                 reasons.append(reason)
-                # Keep track of highest risk level
-                if level == RiskLevel.DANGEROUS:
-                    highest_level = RiskLevel.DANGEROUS
-                elif level == RiskLevel.WARNING and highest_level != RiskLevel.DANGEROUS:
-                    highest_level = RiskLevel.WARNING
+            # Keep track of highest risk level
+            if level == RiskLevel.DANGEROUS:
+                highest_level = RiskLevel.DANGEROUS
+            elif level == RiskLevel.WARNING and highest_level != RiskLevel.DANGEROUS:
+                highest_level = RiskLevel.WARNING
 
         return RiskResult(level=highest_level, reasons=reasons)
 
-    def add_pattern(self, pattern: str, level: RiskLevel, reason: str) -> None:
+    def add_pattern(
+        self,
+        pattern: str,
+        level: RiskLevel,
+        reason: str,
+        shells: Tuple[str, ...] = (),
+        persist: bool = False
+    ) -> None:
         """
         Add a custom risk pattern.
 
@@ -92,23 +269,332 @@ class RiskDetector:
             pattern: Regex pattern to match.
             level: Risk level for this pattern.
             reason: Warning message to display.
+            shells: Shells the pattern applies to; empty for every shell.
+            persist: Save the pattern to the custom rule pack so it survives
+                restarts. Requires a rules directory.
+
+        Raises:
+            re.error: If the pattern is not a valid regex.
+            ConfigError: If persist is set without a rules directory, or the
+                custom rule pack is invalid.
         """
-        self._patterns.append((pattern, level, reason))
+        if not persist:
+            with self._lock:
+                self._register(pattern, level, reason, tuple(shells))
+                self._rules = self._build_rules()
+            return
+
+        if self._packs is None:
+            raise ConfigError("No rules directory to save the pattern to")
+        re.compile(pattern, re.IGNORECASE)
+        with self._lock:
+            rules = self._packs.read_custom_rules()
+            rules.append(RiskRule(pattern, level, reason, tuple(shells)))
+            self._packs.write_custom_rules(rules)
+        self.reload_rules()
 
     def remove_pattern(self, pattern: str) -> bool:
         """
         Remove a pattern by its regex string.
 
+        Patterns saved to the custom rule pack are removed from it as well.
+
         Args:
             pattern: The pattern string to remove.
 
         Returns:
             True if pattern was found and removed.
         """
-        original_length = len(self._patterns)
-        self._patterns = [p for p in self._patterns if p[0] != pattern]
-        return len(self._patterns) < original_length
+        removed = False
+        with self._lock:
+            original_length = len(self._patterns)
+            self._patterns = [p for p in self._patterns if p.pattern != pattern]
+            if len(self._patterns) != original_length:
+                self._compiled.pop(pattern, None)
+                self._rules = self._build_rules()
+                removed = True
+
+            if self._packs is not None:
+                rules = self._packs.read_custom_rules()
+                kept = [rule for rule in rules if rule.pattern != pattern]
+                if len(kept) != len(rules):
+                    self._packs.write_custom_rules(kept)
+                    removed = True
+
+        if removed:
+            self.reload_rules()
+        return removed
+
+    def analyze_many(
+        self,
+        commands: Iterable[str],
+        shell: Optional[str] = None,
+        workers: Optional[int] = None
+    ) -> List[RiskResult]:
+        """
+        Analyze many commands, e.g. to re-score history after a rule change.
+
+        Identical commands are analyzed once and share a result. With
+        several workers and from PARALLEL_THRESHOLD unique commands, the
+        work is split across a process pool that uses the current rule set.
+
+        Args:
+            commands: Shell commands to analyze.
+            shell: Shell the commands run in, for shell-scoped rules.
+            workers: Worker processes. Defaults to 1, which analyzes in the
+                calling process; more only help on a multi-core host.
+
+        Returns:
+            RiskResult per command, in input order.
+        """
+        commands = list(commands)
+        unique = list(dict.fromkeys(commands))
+        if workers is None:
+            workers = 1
+
+        results: Dict[str, RiskResult] = {}
+        if workers > 1 and len(unique) >= PARALLEL_THRESHOLD:
+            try:
+                results = self._analyze_parallel(unique, shell, workers)
+            except (OSError, BrokenProcessPool) as e:
+                logger.warning(f"Parallel risk analysis failed, analyzing serially: {e}")
+        if not results:
+            self._maybe_reload_rules()
+            results = {command: self.analyze(command, shell) for command in unique}
+        return [results[command] for command in commands]
+
+    def _analyze_parallel(self, commands: List[str], shell: Optional[str], workers: int) -> Dict[str, RiskResult]:
+        """Analyze unique commands in worker processes."""
+        self._maybe_reload_rules()
+        rules = self._patterns + [rule for rule, _ in self._pack_rules]
+        # A few chunks per worker balances uneven chunks without much pickling
+        size = max(1, -(-len(commands) // (workers * 4)))
+        chunks = [commands[i:i + size] for i in range(0, len(commands), size)]
+
+        results: Dict[str, RiskResult] = {}
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(rules,)) as pool:
+            for chunk, chunk_results in zip(chunks, pool.map(_analyze_chunk, chunks, [shell] * len(chunks))):
+                results.update(zip(chunk, chunk_results))
+        return results
 
     def get_patterns(self) -> List[Tuple[str, RiskLevel, str]]:
-        """Get all registered patterns."""
-        return self._patterns.copy()
+        """Get all regex patterns, including rule packs (structured rules are not included)."""
+        rules = self._patterns + [rule for rule, _ in self._pack_rules]
+        return [(rule.pattern, rule.level, rule.reason) for rule in rules]
+
+
+# Detector of an analyze_many() worker process
+_worker_detector: Optional[RiskDetector] = None
+
+
+def _init_worker(rules: List[RiskRule]) -> None:
+    """Build the worker's detector with the parent's regex rules."""
+    global _worker_detector
+    detector = RiskDetector()
+    detector._patterns = []
+    for rule in rules:
+        detector._register(rule.pattern, rule.level, rule.reason, rule.shells)
+    detector._rules = detector._build_rules()
+    _worker_detector = detector
+
+
+def _analyze_chunk(commands: List[str], shell: Optional[str]) -> List[RiskResult]:
+    """Analyze commands in a worker process."""
+    return [_worker_detector.analyze(command, shell) for command in commands]
+
+
+def _code_state(line: str, quote: Optional[str]) -> Tuple[Optional[str], str]:
+    """
+    Track quoting through one script line.
+
+    Args:
+        line: Script line without its newline.
+        quote: Quote character open at the start of the line, if any.
+
+    Returns:
+        (quote open at the end of the line, line text before any comment).
+    """
+    i = 0
+    while i < len(line):
+        char = line[i]
+        if quote == "'":
+            if char == "'":
+                quote = None
+        elif char == "\\":
+            i += 1
+        elif quote == '"':
+            if char == '"':
+                quote = None
+        elif char in "'\"":
+            quote = char
+        elif char == "#" and (i == 0 or line[i - 1] in " \t;&|("):
+            return quote, line[:i]
+        i += 1
+    return quote, line
+
+
+def _case_prefix(open_cases: int, in_pattern: bool) -> str:
+    """Get text that reopens case statements in front of a command from inside them."""
+    if not open_cases:
+        return ""
+    return "case _ in _) " * (open_cases - 1) + ("case _ in " if in_pattern else "case _ in _) ")
+
+
+class ScriptRiskScanner:
+    """
+    Incremental risk scanner for scripts, fed one line at a time.
+
+    Lines are joined into complete commands across backslash continuations,
+    open quotes and trailing |, && or ||. Here-document bodies are skipped
+    unless a shell executes them (bash <<EOF, cat <<EOF | sh), and case
+    patterns are told apart from commands across lines. Each line is read once, so
+    scanning is linear in the script length and can run while the script
+    is still streaming in.
+    """
+
+    def __init__(self, detector: RiskDetector, shell: Optional[str] = None):
+        """
+        Initialize ScriptRiskScanner.
+
+        Args:
+            detector: Detector used for each complete command.
+            shell: Shell the script is written for, for shell-scoped rules.
+        """
+        self.detector = detector
+        self.shell = shell
+        self.findings: List[ScriptFinding] = []
+        self._line_number = 0
+        self._start_line = 0
+        self._pending: List[str] = []
+        self._quote: Optional[str] = None
+        # Open here-documents as (delimiter, strip_tabs, executed), innermost last
+        self._heredocs: List[Tuple[str, bool, bool]] = []
+        # case statements left open by earlier commands, and whether a pattern
+        # comes next, so that arms scanned on their own parse as arms
+        self._open_cases = 0
+        self._in_case_pattern = False
+
+    def feed(self, line: str) -> List[ScriptFinding]:
+        """
+        Scan the next script line.
+
+        Args:
+            line: One line of the script, with or without its newline.
+
+        Returns:
+            Findings for commands completed by this line.
+        """
+        self._line_number += 1
+        line = line.rstrip("\r\n")
+
+        if self._heredocs and not self._pending:
+            delimiter, strip_tabs, executed = self._heredocs[-1]
+            if (line.lstrip("\t") if strip_tabs else line) == delimiter:
+                self._heredocs.pop()
+                return []
+            if not executed:
+                return []
+
+        if not self._pending:
+            self._start_line = self._line_number
+
+        self._quote, code = _code_state(line, self._quote)
+        if self._quote is not None:
+            self._pending.append(line + "\n")
+            return []
+        code = code.rstrip()
+        if code.endswith("\\") and (len(code) - len(code.rstrip("\\"))) % 2 == 1:
+            self._pending.append(line[:len(code) - 1])
+            return []
+        if code.endswith(("|", "&&")):
+            self._pending.append(line + " ")
+            return []
+
+        self._pending.append(line)
+        return self._scan_pending()
+
+    def finish(self) -> List[ScriptFinding]:
+        """
+        Scan a command left incomplete at the end of the script.
+
+        Returns:
+            Findings for that command.
+        """
+        if not self._pending:
+            return []
+        self._quote = None
+        return self._scan_pending()
+
+    def result(self) -> RiskResult:
+        """
+        Aggregate the findings so far.
+
+        Returns:
+            RiskResult with the highest level and "line N: reason" reasons.
+        """
+        highest_level = RiskLevel.SAFE
+        reasons: List[str] = []
+        for finding in self.findings:
+            if finding.level == RiskLevel.DANGEROUS:
+                highest_level = RiskLevel.DANGEROUS
+            elif finding.level == RiskLevel.WARNING and highest_level != RiskLevel.DANGEROUS:
+                highest_level = RiskLevel.WARNING
+            reasons.extend(f"line {finding.line_number}: {reason}" for reason in finding.reasons)
+        return RiskResult(level=highest_level, reasons=reasons)
+
+    def _scan_pending(self) -> List[ScriptFinding]:
+        """Analyze the buffered command and open any here-documents it starts."""
+        text = "".join(self._pending)
+        self._pending = []
+        if not text.strip():
+            return []
+
+        parsed = _case_prefix(self._open_cases, self._in_case_pattern) + text
+        tree = parse(parsed)
+        self._open_cases, self._in_case_pattern = tree.open_cases, tree.in_case_pattern
+
+        # A body is executed by its command or a later one in the pipeline (cat <<EOF | sh)
+        heredocs = [
+            (redirection.target, redirection.operator == "<<-", stdin_executed(pipeline, index))
+            for pipeline in tree.walk_pipelines()
+            for index, command in enumerate(pipeline.commands)
+            for redirection in command.redirections
+            if redirection.operator in ("<<", "<<-")
+        ]
+        # Bodies follow in order, so the first here-document goes on top
+        self._heredocs.extend(reversed(heredocs))
+
+        result = self.detector._analyze(text, parsed, self.shell)
+        if result.level == RiskLevel.SAFE:
+            return []
+        finding = ScriptFinding(
+            line_number=self._start_line,
+            command=text.strip(),
+            level=result.level,
+            reasons=result.reasons
+        )
+        self.findings.append(finding)
+        return [finding]
+
+
+def analyze_script(
+    detector: RiskDetector,
+    lines: Iterable[str],
+    shell: Optional[str] = None
+) -> RiskResult:
+    """
+    Scan a whole script.
+
+    Args:
+        detector: Detector used for each command.
+        lines: Script lines, e.g. script.splitlines().
+        shell: Shell the script is written for.
+
+    Returns:
+        Aggregated RiskResult.
+    """
+    scanner = ScriptRiskScanner(detector, shell)
+    for line in lines:
+        scanner.feed(line)
+    scanner.finish()
+    return scanner.result()
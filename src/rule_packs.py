@@ -0,0 +1,218 @@
+"""Risk rule packs loaded from JSON files for iTerm2 AI Command Generator."""
+
+import hashlib
+import json
+import logging
+import os
+import re
+from pathlib import Path
+from typing import Any, Dict, List, Pattern, Tuple
+
+from exceptions import ConfigError
+from models import RiskLevel, RiskRule
+
+logger = logging.getLogger("iterm2-ai-generator")
+
+# Pack written by RiskDetector.add_pattern(..., persist=True)
+CUSTOM_PACK = "custom.json"
+
+SUPPORTED_SHELLS = ("bash", "zsh", "sh", "fish")
+
+# Rule with its compiled regex
+CompiledRule = Tuple[RiskRule, Pattern]
+
+
+def parse_rule_pack(data: Any, source: str = "rule pack") -> List[RiskRule]:
+    """
+    Validate a rule pack.
+
+    A pack is {"rules": [{"pattern": ..., "level": "warning"|"dangerous",
+    "reason": ..., "shells": [...]}]}; "shells" is optional.
+
+    Args:
+        data: Decoded JSON.
+        source: Name used in error messages.
+
+    Returns:
+        Rules in file order.
+
+    Raises:
+        ConfigError: If the pack or a rule is invalid.
+    """
+    if not isinstance(data, dict) or not isinstance(data.get("rules"), list):
+        raise ConfigError(f"{source}: expected an object with a \"rules\" list")
+
+    rules: List[RiskRule] = []
+    for i, item in enumerate(data["rules"], 1):
+        where = f"{source} rule {i}"
+        if not isinstance(item, dict):
+            raise ConfigError(f"{where}: expected an object")
+
+        pattern = item.get("pattern")
+        if not isinstance(pattern, str) or not pattern:
+            raise ConfigError(f"{where}: \"pattern\" must be a non-empty string")
+        try:
+            re.compile(pattern, re.IGNORECASE)
+        except re.error as e:
+            raise ConfigError(f"{where}: invalid pattern: {e}")
+
+        try:
+            level = RiskLevel(item.get("level"))
+        except ValueError:
+            raise ConfigError(f"{where}: \"level\" must be \"warning\" or \"dangerous\"")
+        if level == RiskLevel.SAFE:
+            raise ConfigError(f"{where}: \"level\" must be \"warning\" or \"dangerous\"")
+
+        reason = item.get("reason")
+        if not isinstance(reason, str) or not reason:
+            raise ConfigError(f"{where}: \"reason\" must be a non-empty string")
+
+        shells = item.get("shells", [])
+        if not isinstance(shells, list) or any(s not in SUPPORTED_SHELLS for s in shells):
+            raise ConfigError(f"{where}: \"shells\" must be a list of {', '.join(SUPPORTED_SHELLS)}")
+
+        rules.append(RiskRule(pattern, level, reason, tuple(shells)))
+    return rules
+
+
+def rule_to_dict(rule: RiskRule) -> Dict[str, Any]:
+    """Convert a rule to its rule pack representation."""
+    data: Dict[str, Any] = {"pattern": rule.pattern, "level": rule.level.value, "reason": rule.reason}
+    if rule.shells:
+        data["shells"] = list(rule.shells)
+    return data
+
+
+class _PackFile:
+    """Compiled rules of one pack file with the state they were built from."""
+
+    def __init__(self, stat_key: Tuple[int, int], digest: str, rules: List[CompiledRule]):
+        self.stat_key = stat_key  # (mtime_ns, size)
+        self.digest = digest  # sha256 of the content
+        self.rules = rules
+
+
+class RulePackLoader:
+    """
+    Loads *.json rule packs from a directory, compiling each file once.
+
+    Files are re-read only when their mtime or size changes, and recompiled
+    only when their content hash changes. A file that becomes invalid keeps
+    its last valid rules, so a half-saved edit never drops a pack.
+    """
+
+    def __init__(self, rules_dir: Path):
+        """
+        Initialize RulePackLoader.
+
+        Args:
+            rules_dir: Directory containing the rule pack files.
+        """
+        self.rules_dir = Path(rules_dir)
+        self._files: Dict[str, _PackFile] = {}
+        # Stat of files that failed to load, so they are not re-read until edited
+        self._invalid: Dict[str, Tuple[int, int]] = {}
+
+    def load(self) -> Tuple[bool, List[CompiledRule]]:
+        """
+        Scan the directory for changes.
+
+        Returns:
+            (whether any pack changed since the last call, all rules
+            ordered by file name).
+        """
+        try:
+            paths = sorted(self.rules_dir.glob("*.json"))
+        except OSError:
+            paths = []
+
+        changed = False
+        seen = set()
+        for path in paths:
+            name = path.name
+            seen.add(name)
+            if self._refresh(path):
+                changed = True
+
+        for name in list(self._invalid):
+            if name not in seen:
+                del self._invalid[name]
+        for name in list(self._files):
+            if name not in seen:
+                del self._files[name]
+                changed = True
+
+        rules: List[CompiledRule] = []
+        for name in sorted(self._files):
+            rules.extend(self._files[name].rules)
+        return changed, rules
+
+    def _refresh(self, path: Path) -> bool:
+        """Reload one file if it changed. Returns True if its rules changed."""
+        try:
+            stat = path.stat()
+        except OSError:
+            return False
+        stat_key = (stat.st_mtime_ns, stat.st_size)
+        cached = self._files.get(path.name)
+        if cached is not None and cached.stat_key == stat_key:
+            return False
+        if self._invalid.get(path.name) == stat_key:
+            return False
+
+        try:
+            content = path.read_bytes()
+        except OSError as e:
+            logger.warning(f"Cannot read rule pack {path}: {e}")
+            return False
+        digest = hashlib.sha256(content).hexdigest()
+        if cached is not None and cached.digest == digest:
+            # Touched but not modified
+            cached.stat_key = stat_key
+            return False
+
+        try:
+            rules = parse_rule_pack(json.loads(content.decode("utf-8")), path.name)
+        except (ValueError, ConfigError) as e:
+            logger.warning(f"Ignoring invalid rule pack {path}: {e}")
+            self._invalid[path.name] = stat_key
+            return False
+
+        self._invalid.pop(path.name, None)
+        compiled = [(rule, re.compile(rule.pattern, re.IGNORECASE)) for rule in rules]
+        self._files[path.name] = _PackFile(stat_key, digest, compiled)
+        return True
+
+    def read_custom_rules(self) -> List[RiskRule]:
+        """
+        Read the rules saved in the custom pack.
+
+        Returns:
+            Rules in file order, or an empty list if there is no custom pack.
+
+        Raises:
+            ConfigError: If the custom pack exists but is invalid.
+        """
+        path = self.rules_dir / CUSTOM_PACK
+        if not path.exists():
+            return []
+        try:
+            data = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError) as e:
+            raise ConfigError(f"{CUSTOM_PACK}: {e}")
+        return parse_rule_pack(data, CUSTOM_PACK)
+
+    def write_custom_rules(self, rules: List[RiskRule]) -> None:
+        """
+        Replace the custom pack atomically.
+
+        Args:
+            rules: Rules to save.
+        """
+        self.rules_dir.mkdir(parents=True, exist_ok=True)
+        path = self.rules_dir / CUSTOM_PACK
+        temp_path = path.with_suffix(".json.tmp")
+        data = {"rules": [rule_to_dict(rule) for rule in rules]}
+        temp_path.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
+        os.replace(temp_path, path)
+
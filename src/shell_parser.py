@@ -0,0 +1,476 @@
+"""Shell command parsing for iTerm2 AI Command Generator risk analysis."""
+
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Iterator, List, Optional, Tuple
+
+# Words skipped at command position (compound command syntax)
+RESERVED_WORDS = {"if", "then", "else", "elif", "fi", "do", "done", "while", "until", "{", "}", "esac"}
+
+# Operators, longest first. <( and >( are process substitutions, read as words.
+CONTROL_PATTERN = re.compile(r';;&|;;|;&|&&|\|\||\|&|[;|&()]')
+# Operators that end a case arm
+CASE_ARM_ENDS = (";;", ";&", ";;&")
+REDIRECT_PATTERN = re.compile(r'(\d*)(&>>|<<<|<<-|>>|>\||>&|<&|<>|<<|&>|>(?!\()|<(?!\())')
+
+# Spaces, tabs and line continuations
+BLANKS_PATTERN = re.compile(r'(?:[ \t]|\\\n)*')
+# Run of word characters that need no quote or substitution handling
+PLAIN_PATTERN = re.compile(r'[^ \t\n;&|()<>\\\'"$`]+')
+# Blanks, then a whole plain word (not a comment or a redirection's fd)
+PLAIN_WORD_PATTERN = re.compile(
+    r'(?:[ \t]|\\\n)*(?![0-9]*[<>])([^ \t\n;&|()<>\\\'"$`#][^ \t\n;&|()<>\\\'"$`]*)(?=[ \t\n;&|()<>]|$)'
+)
+
+# Leading VAR=value words
+ASSIGNMENT_PATTERN = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*(\[[^\]]*\])?\+?=')
+
+# Characters that end an unquoted word
+WORD_BREAKS = set(" \t\n;&|()<>")
+
+
+@dataclass(frozen=True)
+class Word:
+    """A shell word after quote removal."""
+    value: str
+    quoted: bool = False  # Any part of the word was quoted or escaped
+    nested: Tuple["CommandList", ...] = ()  # $(...), `...`, <(...) inside the word
+
+
+@dataclass(frozen=True)
+class Redirection:
+    """An I/O redirection such as 2>&1 or > /etc/hosts."""
+    operator: str
+    target: str
+    fd: Optional[int] = None
+    body: Optional[str] = None  # Here-document text, when it is part of the parsed text
+
+    @property
+    def writes(self) -> bool:
+        """Check whether the redirection writes to its target."""
+        return self.operator in (">", ">>", ">|", "&>", "&>>", "<>")
+
+
+@dataclass(frozen=True)
+class SimpleCommand:
+    """A command name with its arguments, assignments and redirections."""
+    words: Tuple[Word, ...]
+    assignments: Tuple[str, ...] = ()
+    redirections: Tuple[Redirection, ...] = ()
+    nested: Tuple["CommandList", ...] = ()  # Substitutions and ( ) groups
+
+    @property
+    def argv(self) -> Tuple[str, ...]:
+        """Argument vector, command name first."""
+        return tuple(word.value for word in self.words)
+
+    @property
+    def name(self) -> str:
+        """Command name without its directory (/bin/rm -> rm)."""
+        if not self.words:
+            return ""
+        return self.words[0].value.rsplit("/", 1)[-1]
+
+
+@dataclass(frozen=True)
+class Pipeline:
+    """Simple commands connected with |."""
+    commands: Tuple[SimpleCommand, ...]
+    background: bool = False  # Followed by &
+
+
+@dataclass(frozen=True)
+class CommandList:
+    """Pipelines separated by ;, &&, || or &."""
+    pipelines: Tuple[Pipeline, ...]
+    open_cases: int = 0  # case statements still open at the end of the text
+    in_case_pattern: bool = False  # The text ends where a case pattern comes next
+
+    def walk_pipelines(self) -> Iterator[Pipeline]:
+        """Yield every pipeline, including those inside substitutions and groups."""
+        for pipeline in self.pipelines:
+            yield pipeline
+            for command in pipeline.commands:
+                for nested in _nested_lists(command):
+                    yield from nested.walk_pipelines()
+
+    def walk(self) -> Iterator[SimpleCommand]:
+        """Yield every simple command, including those inside substitutions and groups."""
+        for pipeline in self.walk_pipelines():
+            yield from pipeline.commands
+
+
+def _nested_lists(command: SimpleCommand) -> Iterator[CommandList]:
+    """Yield the command lists nested in a command's words and redirections."""
+    yield from command.nested
+    for word in command.words:
+        yield from word.nested
+
+
+@lru_cache(maxsize=4096)
+def _plain_word(value: str) -> Word:
+    """Get the Word for an unquoted word; shared, since words are immutable."""
+    return Word(value, False, ())
+
+
+@dataclass
+class _Token:
+    """Lexer output: a word or an operator."""
+    kind: str  # "word", "op" or "redirect"
+    value: str
+    word: Optional[Word] = None
+    fd: Optional[int] = None
+    assignment: bool = False  # Word starts with an unquoted NAME=
+    body: Optional[str] = None  # Here-document text, for a here-document's delimiter
+
+
+class _Lexer:
+    """Splits command text into words and operators."""
+
+    def __init__(self, text: str):
+        self.text = text
+        self.pos = 0
+        # (delimiter, strip_tabs, delimiter token) of here-documents whose body comes next
+        self.pending_heredocs: List[Tuple[str, bool, _Token]] = []
+
+    def tokens(self) -> List[_Token]:
+        """Tokenize the whole text. Unterminated quotes run to the end."""
+        tokens: List[_Token] = []
+        expect_heredoc = None
+        while True:
+            # Most words are plain: take them without the character loop
+            plain = PLAIN_WORD_PATTERN.match(self.text, self.pos)
+            if plain is not None and expect_heredoc is None:
+                value = plain.group(1)
+                self.pos = plain.end()
+                assignment = "=" in value and ASSIGNMENT_PATTERN.match(value) is not None
+                tokens.append(_Token("word", value, _plain_word(value), assignment=assignment))
+                continue
+
+            self._skip_blanks()
+            if self.pos >= len(self.text):
+                break
+            char = self.text[self.pos]
+
+            if char == "#":
+                end = self.text.find("\n", self.pos)
+                self.pos = len(self.text) if end == -1 else end
+                continue
+            if char == "\n":
+                tokens.append(_Token("op", ";"))
+                self.pos += 1
+                self._read_heredoc_bodies()
+                continue
+
+            redirect = self._match_redirect()
+            if redirect is not None:
+                tokens.append(redirect)
+                if redirect.value in ("<<", "<<-"):
+                    expect_heredoc = redirect.value == "<<-"
+                continue
+
+            match = CONTROL_PATTERN.match(self.text, self.pos)
+            if match is not None:
+                tokens.append(_Token("op", match.group()))
+                self.pos = match.end()
+                continue
+
+            start = self.pos
+            word = self._read_word()
+            assignment = ASSIGNMENT_PATTERN.match(self.text[start:self.pos]) is not None
+            tokens.append(_Token("word", word.value, word, assignment=assignment))
+            if expect_heredoc is not None:
+                self.pending_heredocs.append((word.value, expect_heredoc, tokens[-1]))
+                expect_heredoc = None
+        return tokens
+
+    def _skip_blanks(self) -> None:
+        """Skip spaces, tabs and line continuations."""
+        self.pos = BLANKS_PATTERN.match(self.text, self.pos).end()
+
+    def _read_heredoc_bodies(self) -> None:
+        """Read the here-document bodies that start after a newline into their delimiter tokens."""
+        while self.pending_heredocs:
+            delimiter, strip_tabs, token = self.pending_heredocs.pop(0)
+            lines: List[str] = []
+            while self.pos < len(self.text):
+                end = self.text.find("\n", self.pos)
+                end = len(self.text) if end == -1 else end
+                line = self.text[self.pos:end]
+                self.pos = min(end + 1, len(self.text))
+                if strip_tabs:
+                    line = line.lstrip("\t")
+                if line == delimiter:
+                    break
+                lines.append(line)
+            token.body = "\n".join(lines)
+
+    def _match_redirect(self) -> Optional[_Token]:
+        """Consume a redirection operator with an optional file descriptor."""
+        match = REDIRECT_PATTERN.match(self.text, self.pos)
+        if match is None:
+            return None
+        self.pos = match.end()
+        fd = int(match.group(1)) if match.group(1) else None
+        return _Token("redirect", match.group(2), fd=fd)
+
+    def _read_word(self) -> Word:
+        """Read one word, removing quotes and parsing substitutions."""
+        text = self.text
+        parts: List[str] = []
+        nested: List[CommandList] = []
+        quoted = False
+
+        # Process substitution <(...) / >(...)
+        if text.startswith(("<(", ">("), self.pos):
+            start = self.pos
+            nested.append(parse(self._read_balanced(self.pos + 2)))
+            return Word(text[start:self.pos], False, tuple(nested))
+
+        while self.pos < len(text):
+            plain = PLAIN_PATTERN.match(text, self.pos)
+            if plain is not None:
+                parts.append(plain.group())
+                self.pos = plain.end()
+                continue
+            char = text[self.pos]
+            if char in WORD_BREAKS:
+                break
+            if char == "\\":
+                quoted = True
+                if self.pos + 1 < len(text) and text[self.pos + 1] != "\n":
+                    parts.append(text[self.pos + 1])
+                self.pos += 2
+            elif char == "'":
+                quoted = True
+                end = text.find("'", self.pos + 1)
+                end = len(text) if end == -1 else end
+                parts.append(text[self.pos + 1:end])
+                self.pos = end + 1
+            elif char == '"':
+                quoted = True
+                self.pos += 1
+                self._read_double_quoted(parts, nested)
+            elif char == "$" and text.startswith("$(", self.pos):
+                parts.append(self._read_substitution(nested))
+            elif char == "$" and text.startswith("${", self.pos):
+                end = text.find("}", self.pos)
+                end = len(text) - 1 if end == -1 else end
+                parts.append(text[self.pos:end + 1])
+                self.pos = end + 1
+            elif char == "`":
+                parts.append(self._read_backticks(nested))
+            else:
+                parts.append(char)
+                self.pos += 1
+        return Word("".join(parts), quoted, tuple(nested))
+
+    def _read_double_quoted(self, parts: List[str], nested: List["CommandList"]) -> None:
+        """Read the rest of a "..." string (the opening quote is consumed)."""
+        text = self.text
+        while self.pos < len(text):
+            char = text[self.pos]
+            if char == '"':
+                self.pos += 1
+                return
+            if char == "\\" and self.pos + 1 < len(text) and text[self.pos + 1] in '$`"\\\n':
+                if text[self.pos + 1] != "\n":
+                    parts.append(text[self.pos + 1])
+                self.pos += 2
+            elif text.startswith("$(", self.pos):
+                parts.append(self._read_substitution(nested))
+            elif char == "`":
+                parts.append(self._read_backticks(nested))
+            else:
+                parts.append(char)
+                self.pos += 1
+
+    def _read_substitution(self, nested: List["CommandList"]) -> str:
+        """Read $(...) or $((...)) and return its raw text."""
+        start = self.pos
+        arithmetic = self.text.startswith("$((", self.pos)
+        inner = self._read_balanced(self.pos + 2)
+        if not arithmetic:
+            nested.append(parse(inner))
+        return self.text[start:self.pos]
+
+    def _read_backticks(self, nested: List["CommandList"]) -> str:
+        """Read `...` and return its raw text."""
+        start = self.pos
+        end = self.pos + 1
+        while end < len(self.text) and self.text[end] != "`":
+            end += 2 if self.text[end] == "\\" else 1
+        inner = self.text[start + 1:end]
+        nested.append(parse(inner.replace("\\`", "`")))
+        self.pos = min(end + 1, len(self.text))
+        return self.text[start:self.pos]
+
+    def _read_balanced(self, start: int) -> str:
+        """Read up to the ")" matching an already consumed "(", skipping quotes."""
+        text = self.text
+        depth = 1
+        i = start
+        while i < len(text):
+            char = text[i]
+            if char == "\\":
+                i += 2
+                continue
+            if char == "'":
+                end = text.find("'", i + 1)
+                i = len(text) if end == -1 else end + 1
+                continue
+            if char == '"':
+                i += 1
+                while i < len(text) and text[i] != '"':
+                    i += 2 if text[i] == "\\" else 1
+                i += 1
+                continue
+            if char == "(":
+                depth += 1
+            elif char == ")":
+                depth -= 1
+                if depth == 0:
+                    self.pos = i + 1
+                    return text[start:i]
+            i += 1
+        self.pos = len(text)
+        return text[start:]
+
+
+class _Parser:
+    """Builds a CommandList from tokens."""
+
+    def __init__(self, tokens: List[_Token]):
+        self.tokens = tokens
+        self.pos = 0
+
+    def parse_list(self, in_group: bool = False) -> CommandList:
+        """Parse pipelines until the end of input (or a closing parenthesis in a group)."""
+        pipelines: List[Pipeline] = []
+        commands: List[SimpleCommand] = []
+        words: List[Word] = []
+        assignments: List[str] = []
+        redirections: List[Redirection] = []
+        nested: List[CommandList] = []
+        pending_redirect: Optional[_Token] = None
+        case_depth = 0  # Open case statements
+        in_pattern = False  # Reading a case pattern, up to its ")"
+
+        def drop_words() -> None:
+            # Words that are not run (case patterns, function names), but
+            # substitutions in them are
+            for word in words:
+                nested.extend(word.nested)
+            words.clear()
+
+        def finish_command() -> None:
+            if words or redirections or nested or assignments:
+                commands.append(SimpleCommand(
+                    tuple(words), tuple(assignments), tuple(redirections), tuple(nested)
+                ))
+            words.clear()
+            assignments.clear()
+            redirections.clear()
+            nested.clear()
+
+        def finish_pipeline(background: bool = False) -> None:
+            finish_command()
+            if commands:
+                pipelines.append(Pipeline(tuple(commands), background))
+            commands.clear()
+
+        while self.pos < len(self.tokens):
+            token = self.tokens[self.pos]
+            self.pos += 1
+
+            if in_pattern:
+                if token.kind == "word":
+                    if not words and not token.word.quoted and token.word.value == "esac":
+                        case_depth -= 1
+                        in_pattern = False
+                    else:
+                        words.append(token.word)
+                elif token.value == ")":
+                    drop_words()
+                    finish_pipeline()
+                    in_pattern = False
+                # Newlines, the optional "(" and "|" between alternatives
+                continue
+
+            if token.kind == "word":
+                word = token.word
+                if pending_redirect is not None:
+                    redirections.append(Redirection(
+                        pending_redirect.value, word.value, pending_redirect.fd, token.body
+                    ))
+                    nested.extend(word.nested)
+                    pending_redirect = None
+                elif not words and not word.quoted and word.value in RESERVED_WORDS:
+                    if word.value == "esac" and case_depth:
+                        case_depth -= 1
+                    continue
+                elif (not word.quoted and word.value == "in" and len(words) >= 2
+                        and words[0].value == "case" and not words[0].quoted):
+                    # End of "case WORD in", patterns follow
+                    drop_words()
+                    finish_pipeline()
+                    case_depth += 1
+                    in_pattern = True
+                elif (not word.quoted and word.value == "{" and words
+                        and words[0].value == "function" and not words[0].quoted):
+                    # "function name {": the body starts a new command
+                    drop_words()
+                    finish_pipeline()
+                elif not words and not word.quoted and word.value == "!":
+                    continue
+                elif not words and token.assignment:
+                    assignments.append(word.value)
+                    nested.extend(word.nested)
+                else:
+                    words.append(word)
+            elif token.kind == "redirect":
+                pending_redirect = token
+            elif token.value in ("|", "|&"):
+                finish_command()
+            elif token.value == "(":
+                following = self.tokens[self.pos] if self.pos < len(self.tokens) else None
+                if words and following is not None and following.value == ")":
+                    # "name()": the function body starts a new command
+                    self.pos += 1
+                    drop_words()
+                    finish_pipeline()
+                else:
+                    nested.append(self.parse_list(in_group=True))
+            elif token.value == ")":
+                if in_group:
+                    break
+                # Stray, e.g. after a case pattern on a line scanned alone:
+                # the words before it are kept as a command
+                finish_pipeline()
+            elif token.value in CASE_ARM_ENDS:
+                finish_pipeline()
+                in_pattern = case_depth > 0
+            else:
+                finish_pipeline(background=token.value == "&")
+
+        finish_pipeline()
+        return CommandList(tuple(pipelines), case_depth, in_pattern)
+
+
+@lru_cache(maxsize=1024)
+def parse(command: str) -> CommandList:
+    """
+    Parse a shell command into pipelines, lists and simple commands.
+
+    Parsing is lenient: unterminated quotes and substitutions run to the end
+    of the text instead of raising. Results are cached per command string,
+    so repeated analysis of the same command does not parse it again.
+
+    Args:
+        command: Shell command or script text.
+
+    Returns:
+        Parsed command list.
+    """
+    return _Parser(_Lexer(command).tokens()).parse_list()
@@ -0,0 +1,701 @@
+"""Structured risk rules over parsed shell commands."""
+
+import re
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional, Sequence, Set, Tuple
+
+from models import RiskLevel
+from shell_parser import CommandList, Pipeline, Redirection, SimpleCommand, Word, parse
+
+# (level, reason) produced by a rule
+Finding = Tuple[RiskLevel, str]
+
+# Reasons, shared with the regex rules they replace
+ROOT_DELETE = "루트 디렉토리 삭제 시도"
+HOME_DELETE = "홈 디렉토리 삭제 시도"
+SYSTEM_DIR_DELETE = "시스템 디렉토리 삭제 시도"
+FORCE_DELETE = "강제/재귀 삭제"
+BULK_DELETE = "입력 목록의 파일 일괄 삭제"
+FORMAT = "파일시스템 포맷 시도"
+DISK_WRITE = "디스크 직접 덮어쓰기"
+NVME_WRITE = "NVMe 디스크 직접 덮어쓰기"
+ECHO_DISK_WRITE = "디스크에 데이터 직접 쓰기"
+CHMOD_777 = "과도한 권한 부여 (777)"
+CHMOD_RECURSIVE = "재귀적 권한 변경"
+CHOWN_RECURSIVE = "재귀적 소유자 변경"
+DISK_IMAGE = "디스크 이미지 직접 쓰기"
+SUDO = "관리자 권한으로 실행"
+REMOTE_SCRIPT = "원격 스크립트 직접 실행"
+ETC_WRITE = "/etc 디렉토리 파일 덮어쓰기"
+FORCE_KILL = "프로세스 강제 종료"
+SHUTDOWN = "시스템 종료 명령"
+REBOOT = "시스템 재시작 명령"
+INIT = "시스템 종료/재시작"
+SERVICE_STOP = "서비스 중지/비활성화"
+SERVICE_UNLOAD = "서비스 언로드"
+HIDDEN_BACKGROUND = "백그라운드로 출력 숨김"
+HISTORY_CLEAR = "명령어 히스토리 삭제"
+SHRED = "파일 영구 삭제"
+
+SHELLS = {"sh", "bash", "zsh", "dash", "ksh", "fish"}
+DOWNLOADERS = {"curl", "wget", "fetch"}
+
+# Top-level directories whose recursive removal breaks the system
+SYSTEM_DIRS = {
+    "/bin", "/boot", "/dev", "/etc", "/home", "/lib", "/lib64", "/opt", "/proc",
+    "/root", "/sbin", "/srv", "/sys", "/usr", "/var", "/Applications", "/Library",
+    "/System", "/Users", "/private"
+}
+
+DISK_DEVICE_PATTERN = re.compile(r'^/dev/(sd[a-z]|hd[a-z]|xvd[a-z]|vd[a-z]|disk\d|rdisk\d|mmcblk\d)')
+NVME_DEVICE_PATTERN = re.compile(r'^/dev/nvme')
+
+# Wrapper options that take a value, so the value is not mistaken for the command
+SUDO_VALUE_OPTIONS = {"-u", "-g", "-h", "-p", "-C", "-D", "-r", "-t", "-U", "-T"}
+XARGS_VALUE_OPTIONS = {"-n", "-I", "-i", "-P", "-L", "-l", "-d", "-E", "-e", "-s", "-a"}
+WRAPPER_VALUE_OPTIONS = {
+    "sudo": SUDO_VALUE_OPTIONS,
+    "doas": {"-u", "-C"},
+    "env": {"-u", "-C", "-S"},
+    "nice": {"-n"},
+    "timeout": {"-s", "-k", "--signal", "--kill-after"},
+    "xargs": XARGS_VALUE_OPTIONS,
+    "busybox": set(),
+    "nohup": set(),
+    "exec": {"-a"},
+    "command": set(),
+    "builtin": set(),
+    "time": set(),
+    "stdbuf": {"-i", "-o", "-e"},
+}
+
+# Commands that run a command given as text (su -c '...', ssh host '...'),
+# and their options that take a value
+SCRIPT_VALUE_OPTIONS = {
+    "su": {"-s", "--shell", "-g", "--group", "-G", "--supp-group", "-w", "--whitelist-environment"},
+    "runuser": {"-s", "--shell", "-g", "--group", "-G", "--supp-group", "-u", "--user"},
+    "ssh": {
+        "-B", "-b", "-c", "-D", "-E", "-e", "-F", "-I", "-i", "-J", "-L", "-l", "-m",
+        "-O", "-o", "-p", "-Q", "-R", "-S", "-W", "-w"
+    },
+    "watch": {"-n", "--interval", "-q", "--equexit"},
+    "parallel": {
+        "-j", "--jobs", "-S", "--sshlogin", "-a", "--arg-file", "-n", "--max-args",
+        "-N", "-L", "-l", "-P", "-I", "-E", "-d", "--delimiter", "-C", "--colsep",
+        "--timeout", "--joblog", "--results", "--tmpdir", "--env"
+    },
+}
+# parallel's separators between its command and its arguments
+PARALLEL_SEPARATORS = {":::", "::::", ":::+", "::::+"}
+# parallel's replacement strings: {}, {.}, {/}, {1}, ...
+PLACEHOLDER_PATTERN = re.compile(r'\{[^{}\s]*\}')
+
+# Interpreters (without version suffix) -> option letters that take inline code
+INTERPRETER_CODE_OPTIONS = {
+    "python": "c",
+    "perl": "eE",
+    "ruby": "e",
+    "node": "ep",
+    "php": "r",
+    "osascript": "e",
+}
+# String literals in inline code, whose text may be a shell command (os.system("..."))
+STRING_LITERAL_PATTERN = re.compile(r'"((?:[^"\\]|\\.)*)"|\'((?:[^\'\\]|\\.)*)\'|`([^`]*)`')
+
+
+def _options(args: Sequence[Word]) -> Tuple[Set[str], Set[str], List[Word]]:
+    """
+    Split arguments into short option letters, long options and operands.
+
+    Returns:
+        (short option letters, long options, operands).
+    """
+    short: Set[str] = set()
+    long: Set[str] = set()
+    operands: List[Word] = []
+    options_done = False
+    for word in args:
+        value = word.value
+        if options_done or word.quoted or not value.startswith("-") or value == "-":
+            operands.append(word)
+        elif value == "--":
+            options_done = True
+        elif value.startswith("--"):
+            long.add(value.split("=", 1)[0])
+        else:
+            short.update(value[1:])
+    return short, long, operands
+
+
+def _strip_path(value: str) -> str:
+    """Normalize a path operand: drop trailing slashes, /. and /* suffixes."""
+    while len(value) > 1 and value.endswith(("/", "/.", "/*", "/.*")):
+        value = value[:-1] if value.endswith("/") else value.rsplit("/", 1)[0] or "/"
+    return value
+
+
+def _is_root(word: Word) -> bool:
+    """Check for / and its equivalents (/*, //, /.)."""
+    return _strip_path(word.value) in ("/", "") and word.value.startswith("/")
+
+
+def _is_home(word: Word) -> bool:
+    """Check for the home directory (~, $HOME, ${HOME}, with optional /*)."""
+    value = _strip_path(word.value)
+    if value == "~":
+        # A quoted ~ is a literal directory name
+        return not word.quoted
+    return value in ("$HOME", "${HOME}")
+
+
+def _is_system_dir(word: Word) -> bool:
+    """Check for a top-level system directory such as /etc or /usr."""
+    return _strip_path(word.value) in SYSTEM_DIRS
+
+
+def _check_rm(args: Sequence[Word], unknown_operands: bool) -> List[Finding]:
+    short, long, operands = _options(args)
+    recursive = "r" in short or "R" in short or "--recursive" in long
+    force = "f" in short or "--force" in long
+
+    findings: List[Finding] = []
+    if "--no-preserve-root" in long:
+        findings.append((RiskLevel.DANGEROUS, ROOT_DELETE))
+    for word in operands:
+        if _is_root(word):
+            findings.append((RiskLevel.DANGEROUS, ROOT_DELETE))
+        elif _is_home(word):
+            findings.append((RiskLevel.DANGEROUS, HOME_DELETE))
+        elif recursive and _is_system_dir(word):
+            findings.append((RiskLevel.DANGEROUS, SYSTEM_DIR_DELETE))
+    if recursive or force:
+        findings.append((RiskLevel.WARNING, FORCE_DELETE))
+    if unknown_operands:
+        findings.append((RiskLevel.WARNING, BULK_DELETE))
+    return findings
+
+
+def _check_chmod(args: Sequence[Word], unknown_operands: bool) -> List[Finding]:
+    findings: List[Finding] = []
+    # Modes such as -x look like options, so only -R and the first operand are checked
+    values = [word.value for word in args]
+    if "-R" in values or "--recursive" in values or any(
+        v.startswith("-") and not v.startswith("--") and "R" in v for v in values
+    ):
+        findings.append((RiskLevel.WARNING, CHMOD_RECURSIVE))
+    _, _, operands = _options(args)
+    if operands and operands[0].value in ("777", "0777", "a+rwx", "ugo+rwx", "a=rwx", "ugo=rwx"):
+        findings.append((RiskLevel.WARNING, CHMOD_777))
+    return findings
+
+
+def _check_chown(args: Sequence[Word], unknown_operands: bool) -> List[Finding]:
+    short, long, _ = _options(args)
+    if "R" in short or "--recursive" in long:
+        return [(RiskLevel.WARNING, CHOWN_RECURSIVE)]
+    return []
+
+
+def _check_dd(args: Sequence[Word], unknown_operands: bool) -> List[Finding]:
+    findings: List[Finding] = []
+    for word in args:
+        if word.value.startswith("if="):
+            findings.append((RiskLevel.WARNING, DISK_IMAGE))
+        elif word.value.startswith("of="):
+            findings.extend(_device_write(word.value[3:]))
+    return findings
+
+
+def _check_kill(args: Sequence[Word], unknown_operands: bool) -> List[Finding]:
+    values = [word.value.upper() for word in args]
+    for i, value in enumerate(values):
+        if value in ("-9", "-KILL", "-SIGKILL", "--SIGNAL=KILL", "--SIGNAL=9"):
+            return [(RiskLevel.WARNING, FORCE_KILL)]
+        if value in ("-S", "--SIGNAL", "-N") and i + 1 < len(values) and values[i + 1] in ("9", "KILL", "SIGKILL"):
+            return [(RiskLevel.WARNING, FORCE_KILL)]
+    return []
+
+
+def _check_init(args: Sequence[Word], unknown_operands: bool) -> List[Finding]:
+    if args and args[0].value in ("0", "6"):
+        return [(RiskLevel.WARNING, INIT)]
+    return []
+
+
+def _check_systemctl(args: Sequence[Word], unknown_operands: bool) -> List[Finding]:
+    _, _, operands = _options(args)
+    action = operands[0].value if operands else ""
+    if action in ("stop", "disable", "mask", "kill"):
+        return [(RiskLevel.WARNING, SERVICE_STOP)]
+    if action in ("poweroff", "halt"):
+        return [(RiskLevel.WARNING, SHUTDOWN)]
+    if action == "reboot":
+        return [(RiskLevel.WARNING, REBOOT)]
+    return []
+
+
+def _check_launchctl(args: Sequence[Word], unknown_operands: bool) -> List[Finding]:
+    if args and args[0].value in ("unload", "remove", "bootout", "disable"):
+        return [(RiskLevel.WARNING, SERVICE_UNLOAD)]
+    return []
+
+
+def _check_history(args: Sequence[Word], unknown_operands: bool) -> List[Finding]:
+    short, _, _ = _options(args)
+    if "c" in short:
+        return [(RiskLevel.WARNING, HISTORY_CLEAR)]
+    return []
+
+
+def _check_diskutil(args: Sequence[Word], unknown_operands: bool) -> List[Finding]:
+    if args and args[0].value.lower() in ("erasedisk", "erasevolume", "zerodisk", "partitiondisk", "secureerase"):
+        return [(RiskLevel.DANGEROUS, FORMAT)]
+    return []
+
+
+def _check_tee(args: Sequence[Word], unknown_operands: bool) -> List[Finding]:
+    _, _, operands = _options(args)
+    findings: List[Finding] = []
+    for word in operands:
+        findings.extend(_file_write(word.value))
+    return findings
+
+
+def _always(finding: Finding) -> Callable[[Sequence[Word], bool], List[Finding]]:
+    """Build a rule that flags every use of a command."""
+    return lambda args, unknown_operands: [finding]
+
+
+# Command name -> rule over its arguments. Lookups replace regex scans of the whole text.
+COMMAND_RULES: Dict[str, Callable[[Sequence[Word], bool], List[Finding]]] = {
+    "rm": _check_rm,
+    "chmod": _check_chmod,
+    "chown": _check_chown,
+    "chgrp": _check_chown,
+    "dd": _check_dd,
+    "kill": _check_kill,
+    "pkill": _check_kill,
+    "killall": _check_kill,
+    "init": _check_init,
+    "telinit": _check_init,
+    "systemctl": _check_systemctl,
+    "launchctl": _check_launchctl,
+    "history": _check_history,
+    "diskutil": _check_diskutil,
+    "tee": _check_tee,
+    "mkfs": _always((RiskLevel.DANGEROUS, FORMAT)),
+    "newfs": _always((RiskLevel.DANGEROUS, FORMAT)),
+    "wipefs": _always((RiskLevel.DANGEROUS, FORMAT)),
+    "shutdown": _always((RiskLevel.WARNING, SHUTDOWN)),
+    "halt": _always((RiskLevel.WARNING, SHUTDOWN)),
+    "poweroff": _always((RiskLevel.WARNING, SHUTDOWN)),
+    "reboot": _always((RiskLevel.WARNING, REBOOT)),
+    "shred": _always((RiskLevel.WARNING, SHRED)),
+    "su": _always((RiskLevel.WARNING, SUDO)),
+}
+
+
+# Command names the rules look at, for needs_parse()
+TRIGGER_WORDS = (
+    frozenset(COMMAND_RULES) | frozenset(WRAPPER_VALUE_OPTIONS) | frozenset(SCRIPT_VALUE_OPTIONS)
+    | frozenset(INTERPRETER_CODE_OPTIONS) | SHELLS | {"find", "eval", "python2", "python3"}
+)
+# Words of a command for needs_parse(); "mkfs.ext4" and "/bin/rm" yield "mkfs" and "rm"
+WORD_PATTERN = re.compile(r'[\w-]+')
+# Quote removal for needs_parse(), so that r""m and r\m read as rm
+UNQUOTE = str.maketrans("", "", "'\"\\")
+
+
+def _device_write(target: str) -> List[Finding]:
+    """Findings for writing to a block device."""
+    if NVME_DEVICE_PATTERN.match(target):
+        return [(RiskLevel.DANGEROUS, NVME_WRITE)]
+    if DISK_DEVICE_PATTERN.match(target):
+        return [(RiskLevel.DANGEROUS, DISK_WRITE)]
+    return []
+
+
+def _file_write(target: str) -> List[Finding]:
+    """Findings for writing to a file or device."""
+    if target.startswith("/etc/"):
+        return [(RiskLevel.WARNING, ETC_WRITE)]
+    return _device_write(target)
+
+
+def _command_name(word: Word) -> str:
+    """Get a command name without its directory, lowercased (macOS file names ignore case)."""
+    return word.value.rsplit("/", 1)[-1].lower()
+
+
+def _interpreter_name(name: str) -> str:
+    """Get an interpreter name without its version (python3.12 -> python)."""
+    return name.rstrip("0123456789.")
+
+
+def _skip_options(args: Sequence[Word], value_options: Set[str]) -> int:
+    """Get the index of the first operand, skipping options and their values."""
+    i = 0
+    while i < len(args):
+        value = args[i].value
+        if value == "--":
+            return i + 1
+        if not value.startswith("-") or value == "-":
+            return i
+        i += 2 if value in value_options else 1
+    return i
+
+
+def _skip_wrapper_options(name: str, args: Sequence[Word]) -> int:
+    """Get the index of the wrapped command in a wrapper's arguments."""
+    value_options = WRAPPER_VALUE_OPTIONS[name]
+    i = 0
+    while i < len(args):
+        value = args[i].value
+        if value == "--":
+            return i + 1
+        if name in ("env", "sudo") and "=" in value and not value.startswith("-"):
+            i += 1  # env NAME=value
+        elif name == "timeout" and not value.startswith("-"):
+            return i + 1  # Duration precedes the command
+        elif name == "nice" and value.startswith("-") and value[1:].isdigit():
+            i += 1  # nice -10
+        elif value.startswith("-") and value != "-":
+            i += 2 if value in value_options else 1
+        else:
+            return i
+    return i
+
+
+def _unwrap(words: Sequence[Word]) -> Tuple[Sequence[Word], List[Finding], bool]:
+    """
+    Strip wrapper commands (sudo, env, xargs, nohup, ...) from a command.
+
+    Returns:
+        (wrapped command words, findings for the wrappers, whether the
+        wrapped command receives operands that are not visible, as with xargs).
+    """
+    findings: List[Finding] = []
+    unknown_operands = False
+    while words:
+        name = _command_name(words[0])
+        if name not in WRAPPER_VALUE_OPTIONS:
+            break
+        if name in ("sudo", "doas"):
+            findings.append((RiskLevel.WARNING, SUDO))
+        if name == "xargs":
+            unknown_operands = True
+        args = words[1:]
+        words = args[_skip_wrapper_options(name, args):]
+    return words, findings, unknown_operands
+
+
+def _check_words(words: Sequence[Word], unknown_operands: bool = False, depth: int = 0) -> List[Finding]:
+    """Run the rules for one command given as words."""
+    words, findings, wrapped_unknown = _unwrap(words)
+    if not words:
+        return findings
+    unknown_operands = unknown_operands or wrapped_unknown
+    name = _command_name(words[0])
+    args = words[1:]
+
+    rule = COMMAND_RULES.get(name)
+    if rule is None and name.startswith("mkfs."):
+        rule = COMMAND_RULES["mkfs"]
+    if rule is not None:
+        findings.extend(rule(args, unknown_operands))
+
+    if name == "find":
+        findings.extend(_check_find(args, depth))
+    elif depth < 3 and name == "parallel":
+        script, from_stdin = _parallel_script(args)
+        findings.extend(analyze_tree(parse(script), depth + 1, from_stdin))
+    elif depth < 3:
+        for script in _command_scripts(name, args):
+            findings.extend(analyze_tree(parse(script), depth + 1))
+    return findings
+
+
+def _check_find(args: Sequence[Word], depth: int) -> List[Finding]:
+    """Check commands run by find -exec/-execdir/-ok and -delete."""
+    findings: List[Finding] = []
+    i = 0
+    while i < len(args):
+        value = args[i].value
+        if value == "-delete":
+            findings.append((RiskLevel.WARNING, BULK_DELETE))
+        elif value in ("-exec", "-execdir", "-ok", "-okdir"):
+            end = i + 1
+            while end < len(args) and args[end].value not in (";", "+"):
+                end += 1
+            findings.extend(_check_words(args[i + 1:end], True, depth))
+            i = end
+        i += 1
+    return findings
+
+
+def _inline_script(name: str, args: Sequence[Word]) -> Optional[str]:
+    """Get the script text of sh -c '...' or eval '...'."""
+    if name == "eval":
+        return " ".join(word.value for word in args)
+    for i, word in enumerate(args):
+        if word.value.startswith("-") and not word.value.startswith("--") and "c" in word.value:
+            return args[i + 1].value if i + 1 < len(args) else None
+    return None
+
+
+def _su_script(args: Sequence[Word]) -> Optional[str]:
+    """Get the command text of su/runuser -c '...'."""
+    for i, word in enumerate(args):
+        value = word.value
+        if value.startswith("--command="):
+            return value.split("=", 1)[1]
+        if value == "--command" or (value.startswith("-") and not value.startswith("--") and value.endswith("c")):
+            return args[i + 1].value if i + 1 < len(args) else None
+    return None
+
+
+def _ssh_script(args: Sequence[Word]) -> Optional[str]:
+    """Get the remote command of ssh host ...; the remote shell parses the joined words."""
+    operands = args[_skip_options(args, SCRIPT_VALUE_OPTIONS["ssh"]):]
+    if len(operands) < 2:
+        return None
+    return " ".join(word.value for word in operands[1:])
+
+
+def _parallel_script(args: Sequence[Word]) -> Tuple[str, bool]:
+    """
+    Get the command text GNU parallel runs, with its ::: arguments filled in.
+
+    Returns:
+        (command text, whether the arguments are read from standard input).
+    """
+    words = args[_skip_options(args, SCRIPT_VALUE_OPTIONS["parallel"]):]
+    separators = [i for i, word in enumerate(words) if word.value in PARALLEL_SEPARATORS]
+    end = separators[0] if separators else len(words)
+    template = " ".join(word.value for word in words[:end])
+    # Each argument makes its own job; filling in all of them flags any risky one
+    values = " ".join(word.value for word in words[end:] if word.value not in PARALLEL_SEPARATORS)
+    if PLACEHOLDER_PATTERN.search(template):
+        return PLACEHOLDER_PATTERN.sub(lambda _: values, template), not separators
+    return f"{template} {values}", not separators
+
+
+def _interpreter_code(name: str, args: Sequence[Word]) -> List[str]:
+    """Get the inline code of python -c '...', perl -e '...', osascript -e '...'."""
+    letters = INTERPRETER_CODE_OPTIONS[name]
+    code: List[str] = []
+    i = 0
+    while i < len(args):
+        word = args[i]
+        value = word.value
+        if word.quoted or not value.startswith("-") or value == "-":
+            # A script file; the rest are its arguments
+            break
+        if value.startswith("--eval=") or value.startswith("--print="):
+            code.append(value.split("=", 1)[1])
+        elif (value in ("--eval", "--print") or (not value.startswith("--") and value[-1] in letters)) \
+                and i + 1 < len(args):
+            i += 1
+            code.append(args[i].value)
+        i += 1
+    return code
+
+
+def _command_scripts(name: str, args: Sequence[Word]) -> List[str]:
+    """Get the shell command text a command runs from its arguments."""
+    if name in SHELLS or name == "eval":
+        script = _inline_script(name, args)
+        return [script] if script is not None else []
+    if name in ("su", "runuser"):
+        script = _su_script(args)
+        return [script] if script is not None else []
+    if name == "ssh":
+        script = _ssh_script(args)
+        return [script] if script is not None else []
+    if name == "watch":
+        # Runs its arguments joined with spaces through sh -c
+        operands = args[_skip_options(args, SCRIPT_VALUE_OPTIONS["watch"]):]
+        return [" ".join(word.value for word in operands)] if operands else []
+    interpreter = _interpreter_name(name)
+    if interpreter in INTERPRETER_CODE_OPTIONS:
+        scripts: List[str] = []
+        for code in _interpreter_code(interpreter, args):
+            literals = ["".join(groups) for groups in STRING_LITERAL_PATTERN.findall(code)]
+            if literals:
+                # One command per literal (os.system("...")), or argv split
+                # into literals (subprocess.run(["rm", "-rf", "/"]))
+                scripts.extend(("\n".join(literals), " ".join(literals)))
+        return scripts
+    return []
+
+
+def _contains_downloader(lists: Sequence[CommandList]) -> bool:
+    """Check whether nested command lists run curl/wget."""
+    for command_list in lists:
+        for command in command_list.walk():
+            words, _, _ = _unwrap(command.words)
+            if words and _command_name(words[0]) in DOWNLOADERS:
+                return True
+    return False
+
+
+def executes_stdin(command: SimpleCommand) -> bool:
+    """
+    Check whether a command runs its standard input as a script.
+
+    True for shells without a script operand (bash, sudo sh -s, ...), so
+    a here-document fed to them is code rather than data.
+
+    Args:
+        command: Parsed simple command.
+
+    Returns:
+        True if standard input is executed.
+    """
+    words, _, _ = _unwrap(command.words)
+    if not words:
+        return False
+    name = _command_name(words[0])
+    if name in SHELLS:
+        return all(word.value.startswith("-") and "c" not in word.value for word in words[1:])
+    if name in ("su", "runuser"):
+        # A login shell reading its commands from standard input
+        return _su_script(words[1:]) is None
+    if name == "ssh":
+        # The remote shell reads its commands from standard input
+        operands = words[1 + _skip_options(words[1:], SCRIPT_VALUE_OPTIONS["ssh"]):]
+        return len(operands) == 1
+    return False
+
+
+def stdin_executed(pipeline: Pipeline, index: int) -> bool:
+    """
+    Check whether the standard input of a pipeline's command ends up executed.
+
+    True if the command executes its standard input, or a later command in
+    the pipeline does (cat <<EOF | sh), since the input may flow through.
+
+    Args:
+        pipeline: Parsed pipeline.
+        index: Index of the command in the pipeline.
+
+    Returns:
+        True if what the command reads may be run as a script.
+    """
+    return any(executes_stdin(command) for command in pipeline.commands[index:])
+
+
+def _stdin_script(redirection: Redirection) -> Optional[str]:
+    """Get the text a here-document (<<EOF) or here-string (<<<) feeds to standard input."""
+    if redirection.operator in ("<<", "<<-"):
+        return redirection.body
+    if redirection.operator == "<<<":
+        return redirection.target
+    return None
+
+
+def _check_pipeline(pipeline: Pipeline) -> List[Finding]:
+    """Rules spanning a pipeline: downloads piped to a shell, hidden background jobs."""
+    findings: List[Finding] = []
+    downloaded = False
+    for command in pipeline.commands:
+        words, _, _ = _unwrap(command.words)
+        name = _command_name(words[0]) if words else ""
+        if name in DOWNLOADERS:
+            downloaded = True
+        elif name in SHELLS:
+            nested = [n for word in words for n in word.nested]
+            reads_stdin = _inline_script(name, words[1:]) is None
+            if (downloaded and reads_stdin) or _contains_downloader(nested):
+                findings.append((RiskLevel.WARNING, REMOTE_SCRIPT))
+
+    if pipeline.background:
+        for command in pipeline.commands:
+            quiet_stdout = any(
+                r.target == "/dev/null" and r.operator in (">", ">>", "&>") and r.fd in (None, 1)
+                for r in command.redirections
+            )
+            quiet_stderr = any(
+                (r.operator == ">&" and r.fd == 2 and r.target == "1") or r.operator == "&>"
+                for r in command.redirections
+            )
+            if quiet_stdout and quiet_stderr:
+                findings.append((RiskLevel.WARNING, HIDDEN_BACKGROUND))
+                break
+    return findings
+
+
+def _check_redirections(command: SimpleCommand) -> List[Finding]:
+    """Rules for output redirections (> /dev/sda, > /etc/hosts)."""
+    findings: List[Finding] = []
+    for redirection in command.redirections:
+        if not redirection.writes:
+            continue
+        target_findings = _file_write(redirection.target)
+        findings.extend(target_findings)
+        if target_findings and command.name.lower() == "echo" and DISK_DEVICE_PATTERN.match(redirection.target):
+            findings.append((RiskLevel.DANGEROUS, ECHO_DISK_WRITE))
+    return findings
+
+
+def analyze_tree(tree: CommandList, depth: int = 0, unknown_operands: bool = False) -> List[Finding]:
+    """
+    Run the structured rules over a parsed command.
+
+    Args:
+        tree: Parsed command from shell_parser.parse().
+        depth: Nesting level of sh -c/eval scripts, to bound recursion.
+        unknown_operands: The commands receive operands that are not
+            visible, as with parallel reading its arguments from stdin.
+
+    Returns:
+        Findings in command order, possibly with duplicates.
+    """
+    findings: List[Finding] = []
+    for pipeline in tree.walk_pipelines():
+        findings.extend(_check_pipeline(pipeline))
+        for index, command in enumerate(pipeline.commands):
+            findings.extend(_check_redirections(command))
+            findings.extend(_check_words(command.words, unknown_operands, depth))
+            if depth >= 3:
+                continue
+            for redirection in command.redirections:
+                script = _stdin_script(redirection)
+                if script is not None and stdin_executed(pipeline, index):
+                    findings.extend(analyze_tree(parse(script), depth + 1))
+    return findings
+
+
+def needs_parse(command: str) -> bool:
+    """
+    Check whether any structured rule could apply to a command.
+
+    A cheap prefilter: commands without a redirection or a trigger word (a
+    command name some rule looks at, after quote removal) skip parsing.
+
+    Args:
+        command: Shell command text.
+
+    Returns:
+        False only if no structured rule can report anything.
+    """
+    if ">" in command:
+        return True
+    words = WORD_PATTERN.findall(command.replace("\\\n", "").translate(UNQUOTE).lower())
+    return not TRIGGER_WORDS.isdisjoint(words)
+
+
+@lru_cache(maxsize=1024)
+def analyze_command(command: str) -> Tuple[Finding, ...]:
+    """
+    Parse a command and run the structured rules, memoized per command string.
+
+    Args:
+        command: Shell command text.
+
+    Returns:
+        Findings in command order, possibly with duplicates.
+    """
+    if not needs_parse(command):
+        return ()
+    return tuple(analyze_tree(parse(command)))